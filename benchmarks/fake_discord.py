@@ -0,0 +1,532 @@
+"""A local stand-in for Discord's REST API and gateway.
+
+Serves just enough of both for the bot to log in, connect every shard,
+receive its guilds and register its commands, so sharding and cluster
+mode can be tried without a bot token or a real application. Guilds are
+assigned to shards like Discord does, by `(guild_id >> 22) % shards`.
+Sessions can be resumed until their connection is closed with code 1000.
+
+Interaction responses and sent messages are accepted and echoed back,
+and :meth:`FakeDiscord.slash_command` and :meth:`FakeDiscord.button_click`
+build the interactions to feed the bot, e.g. in `benchmarks/handlers.py`.
+
+Usage (from the project root):
+    python -m benchmarks.fake_discord [--port 8765] [--guilds 100] [--members 0]
+                                      [--shards 4]
+
+Then point the bot at it (any token works):
+    DISCORD_API_BASE=http://127.0.0.1:8765/api/v10 python launcher.py
+"""
+
+import json
+import asyncio
+import argparse
+import itertools
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web, WSMsgType
+from disnake.utils import time_snowflake
+
+APPLICATION_ID = 1 << 22
+JOINED_AT = datetime(2024, 1, 1, tzinfo=timezone.utc).isoformat()
+# The user that uses the bot's commands
+USER_ID = 2 << 22
+
+# Gateway opcodes
+DISPATCH = 0
+HEARTBEAT = 1
+IDENTIFY = 2
+RESUME = 6
+REQUEST_MEMBERS = 8
+INVALID_SESSION = 9
+HELLO = 10
+HEARTBEAT_ACK = 11
+
+
+def json_response(data: Any, status: int = 200) -> web.Response:
+    # disnake only decodes bodies whose content type is exactly JSON,
+    # without a charset
+    return web.Response(
+        body=json.dumps(data).encode(), status=status, content_type="application/json"
+    )
+
+
+class FakeDiscord:
+    """Fakes the REST routes and gateway events the bot needs to start.
+
+    Parameters
+    ----------
+    guilds: :class:`int`
+        The number of guilds the bot is in.
+    members: :class:`int`
+        The number of members in each guild, besides the bot. They are the
+        same users in every guild. (Default: 0)
+    shards: :class:`int`
+        The shard count recommended by `GET /gateway/bot`.
+    host: :class:`str`
+        The address to listen on.
+    port: :class:`int`
+        The port to listen on.
+    max_concurrency: :class:`int`
+        The number of shards that may identify at once, as reported in
+        the session start limit. (Default: 1)
+    """
+
+    def __init__(
+        self,
+        guilds: int = 100,
+        members: int = 0,
+        shards: int = 1,
+        host: str = "127.0.0.1",
+        port: int = 8765,
+        max_concurrency: int = 1,
+    ) -> None:
+        self.guild_ids = [(i + 1) << 22 | i for i in range(guilds)]
+        self.members = members
+        self.shards = shards
+        self.host = host
+        self.port = port
+        self.max_concurrency = max_concurrency
+        self.user = {
+            "id": str(APPLICATION_ID),
+            "username": "my-bot",
+            "discriminator": "0",
+            "global_name": None,
+            "avatar": None,
+            "bot": True,
+        }
+        self.identifies = 0
+        self.resumes = 0
+        self._snowflakes = itertools.count()
+        # Interaction token -> the message of its response
+        self.responses: Dict[str, Dict[str, Any]] = {}
+        self.sent_messages = 0
+        self._session_ids = itertools.count(1)
+        # Session ID -> the sequence number of its last event
+        self.sessions: Dict[str, int] = {}
+        self._runner: Optional[web.AppRunner] = None
+
+        self.app = web.Application()
+        self.app.add_routes(
+            [
+                web.get("/api/v10/users/@me", self.get_user),
+                web.get("/api/v10/gateway", self.get_gateway),
+                web.get("/api/v10/gateway/bot", self.get_gateway),
+                web.get("/api/v10/oauth2/applications/@me", self.get_application),
+                web.get("/api/v10/applications/{app}/commands", self.get_commands),
+                web.put("/api/v10/applications/{app}/commands", self.put_commands),
+                web.get(
+                    "/api/v10/applications/{app}/guilds/{guild}/commands",
+                    self.get_commands,
+                ),
+                web.put(
+                    "/api/v10/applications/{app}/guilds/{guild}/commands",
+                    self.put_commands,
+                ),
+                web.post(
+                    "/api/v10/interactions/{interaction}/{token}/callback",
+                    self.interaction_callback,
+                ),
+                web.get(
+                    "/api/v10/webhooks/{app}/{token}/messages/@original",
+                    self.get_original,
+                ),
+                web.patch(
+                    "/api/v10/webhooks/{app}/{token}/messages/@original",
+                    self.edit_original,
+                ),
+                web.post("/api/v10/channels/{channel}/messages", self.send_message),
+                web.get("/gateway", self.gateway),
+                web.route("*", "/{tail:.*}", self.unknown),
+            ]
+        )
+
+    @property
+    def url(self) -> str:
+        """The base URL of the fake REST API, for `DISCORD_API_BASE`."""
+        return f"http://{self.host}:{self.port}/api/v10"
+
+    async def start(self) -> None:
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def close(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    def shard_guilds(self, shard_id: int, shard_count: int) -> List[int]:
+        """Get the IDs of the guilds a shard receives."""
+        return [g for g in self.guild_ids if (g >> 22) % shard_count == shard_id]
+
+    def snowflake(self) -> int:
+        """Get a new, unique ID with the current time, like Discord's."""
+        return time_snowflake(datetime.now(timezone.utc)) + next(self._snowflakes)
+
+    def user_payload(self, index: int) -> Dict[str, Any]:
+        user_id = str(USER_ID + (index << 22))
+        return {**self.user, "id": user_id, "username": f"user-{index}", "bot": False}
+
+    def member(self, user: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "user": user,
+            "roles": [],
+            "joined_at": JOINED_AT,
+            "deaf": False,
+            "mute": False,
+        }
+
+    @staticmethod
+    def channel_id(guild_id: int) -> int:
+        """Get the ID of a guild's only (text) channel."""
+        return guild_id + (1 << 21)
+
+    def channel(self, guild_id: int) -> Dict[str, Any]:
+        return {
+            "id": str(self.channel_id(guild_id)),
+            "type": 0,
+            "guild_id": str(guild_id),
+            "name": "general",
+            "position": 0,
+            "permission_overwrites": [],
+            "nsfw": False,
+            "parent_id": None,
+            "topic": None,
+            "last_message_id": None,
+            "rate_limit_per_user": 0,
+            "flags": 0,
+        }
+
+    def guild(self, guild_id: int, name: Optional[str] = None) -> Dict[str, Any]:
+        members = [self.member(self.user)]
+        for i in range(self.members):
+            members.append(self.member(self.user_payload(i)))
+        everyone = {
+            "id": str(guild_id),
+            "name": "@everyone",
+            "permissions": "0",
+            "position": 0,
+            "color": 0,
+            "colors": {
+                "primary_color": 0,
+                "secondary_color": None,
+                "tertiary_color": None,
+            },
+            "hoist": False,
+            "managed": False,
+            "mentionable": False,
+        }
+        return {
+            "id": str(guild_id),
+            "name": name or f"guild-{guild_id & 0x3FFFFF}",
+            "owner_id": self.user["id"],
+            "joined_at": JOINED_AT,
+            "unavailable": False,
+            "large": False,
+            "member_count": len(members),
+            "members": members,
+            "roles": [everyone],
+            "channels": [self.channel(guild_id)],
+            "system_channel_id": str(self.channel_id(guild_id)),
+            "threads": [],
+            "emojis": [],
+            "stickers": [],
+            "features": [],
+            "voice_states": [],
+            "presences": [],
+            "stage_instances": [],
+            "guild_scheduled_events": [],
+            "verification_level": 0,
+            "default_message_notifications": 0,
+            "explicit_content_filter": 0,
+            "mfa_level": 0,
+            "nsfw_level": 0,
+            "premium_tier": 0,
+            "preferred_locale": "en-US",
+            "system_channel_flags": 0,
+        }
+
+    async def get_user(self, request: web.Request) -> web.Response:
+        return json_response(self.user)
+
+    async def get_gateway(self, request: web.Request) -> web.Response:
+        return json_response(
+            {
+                "url": f"ws://{self.host}:{self.port}/gateway",
+                "shards": self.shards,
+                "session_start_limit": {
+                    "total": 1000,
+                    "remaining": 1000,
+                    "reset_after": 0,
+                    "max_concurrency": self.max_concurrency,
+                },
+            }
+        )
+
+    async def get_application(self, request: web.Request) -> web.Response:
+        return json_response(
+            {
+                "id": str(APPLICATION_ID),
+                "name": "my-bot",
+                "icon": None,
+                "description": "",
+                "bot_public": False,
+                "bot_require_code_grant": False,
+                "owner": self.user,
+                "verify_key": "",
+                "flags": 0,
+            }
+        )
+
+    async def get_commands(self, request: web.Request) -> web.Response:
+        return json_response([])
+
+    async def put_commands(self, request: web.Request) -> web.Response:
+        # The registered commands aren't kept, the bot doesn't need them back
+        return json_response([])
+
+    def interaction(
+        self, type: int, guild_id: int, data: Dict[str, Any], **extra: Any
+    ) -> Dict[str, Any]:
+        interaction_id = self.snowflake()
+        return {
+            "id": str(interaction_id),
+            "application_id": str(APPLICATION_ID),
+            "type": type,
+            "token": f"token-{interaction_id}",
+            "version": 1,
+            "guild_id": str(guild_id),
+            "channel_id": str(self.channel_id(guild_id)),
+            "channel": {**self.channel(guild_id), "permissions": str(2**53 - 1)},
+            "member": {**self.member(self.user_payload(0)), "permissions": "8"},
+            "app_permissions": str(2**53 - 1),
+            "locale": "en-US",
+            "guild_locale": "en-US",
+            "entitlements": [],
+            "authorizing_integration_owners": {"0": str(guild_id)},
+            "context": 0,
+            "attachment_size_limit": 10 * 1024**2,
+            "data": data,
+            **extra,
+        }
+
+    def slash_command(
+        self,
+        name: str,
+        guild_id: int,
+        options: Optional[List[Dict[str, Any]]] = None,
+        resolved: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """Build the INTERACTION_CREATE payload of a slash command.
+
+        Parameters
+        ----------
+        name: :class:`str`
+            The name of the command.
+        guild_id: :class:`int`
+            The guild it is used in, by the first fake user.
+        options: Optional[List[Dict[:class:`str`, Any]]]
+            The command's options, e.g. `{"name": "url", "type": 3, "value": ...}`.
+        resolved: Optional[Dict[:class:`str`, Any]]
+            The users, channels, etc. referenced by the options.
+        """
+        data = {"id": str(APPLICATION_ID + 1), "name": name, "type": 1}
+        if options:
+            data["options"] = options
+        if resolved:
+            data["resolved"] = resolved
+        return self.interaction(2, guild_id, data)
+
+    def button_click(
+        self, guild_id: int, message: Dict[str, Any], custom_id: str
+    ) -> Dict[str, Any]:
+        """Build the INTERACTION_CREATE payload of a click on a message's button.
+
+        Parameters
+        ----------
+        guild_id: :class:`int`
+            The guild the message is in.
+        message: Dict[:class:`str`, Any]
+            The message, e.g. from :attr:`responses`.
+        custom_id: :class:`str`
+            The custom ID of the button.
+        """
+        return self.interaction(
+            3,
+            guild_id,
+            {"custom_id": custom_id, "component_type": 2},
+            message=message,
+        )
+
+    def message(self, channel_id: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "id": str(self.snowflake()),
+            "channel_id": channel_id,
+            "author": self.user,
+            "content": body.get("content") or "",
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "edited_timestamp": None,
+            "tts": False,
+            "mention_everyone": False,
+            "mentions": [],
+            "mention_roles": [],
+            "attachments": [],
+            "embeds": body.get("embeds") or [],
+            "components": body.get("components") or [],
+            "pinned": False,
+            "type": 0,
+            "flags": body.get("flags") or 0,
+        }
+
+    @staticmethod
+    async def read_body(request: web.Request) -> Dict[str, Any]:
+        # Messages with files are sent as multipart, with the JSON in a field
+        if request.content_type.startswith("multipart/"):
+            form = await request.post()
+            return json.loads(form.get("payload_json") or "{}")
+        return await request.json() if request.can_read_body else {}
+
+    async def interaction_callback(self, request: web.Request) -> web.Response:
+        payload = await self.read_body(request)
+        token = request.match_info["token"]
+        # 4: a message, 7: an edit of the message the component is on
+        if payload["type"] in (4, 7):
+            message = self.responses.get(token) or self.message("0", {})
+            self.responses[token] = {**message, **payload.get("data", {})}
+        else:
+            self.responses.setdefault(token, self.message("0", {}))
+        return web.Response(status=204)
+
+    async def get_original(self, request: web.Request) -> web.Response:
+        message = self.responses.get(request.match_info["token"])
+        if message is None:
+            return json_response({"message": "Unknown Message", "code": 10008}, 404)
+        return json_response(message)
+
+    async def edit_original(self, request: web.Request) -> web.Response:
+        body = await self.read_body(request)
+        token = request.match_info["token"]
+        message = self.responses.get(token) or self.message("0", {})
+        message = self.responses[token] = {
+            **message,
+            **{
+                k: v
+                for k, v in body.items()
+                if k in ("content", "embeds", "components")
+            },
+        }
+        return json_response(message)
+
+    async def send_message(self, request: web.Request) -> web.Response:
+        self.sent_messages += 1
+        body = await self.read_body(request)
+        return json_response(self.message(request.match_info["channel"], body))
+
+    async def unknown(self, request: web.Request) -> web.Response:
+        print(f"Unknown route: {request.method} {request.path}")
+        return json_response({"message": "404: Not Found", "code": 0}, status=404)
+
+    async def gateway(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        session_id = None
+
+        async def send(op: int, data: Any, event: Optional[str] = None) -> None:
+            payload = {"op": op, "d": data, "s": None, "t": event}
+            if op == DISPATCH:
+                payload["s"] = self.sessions[session_id] = (
+                    self.sessions.get(session_id, 0) + 1
+                )
+            await ws.send_str(json.dumps(payload))
+
+        await send(HELLO, {"heartbeat_interval": 41250})
+        async for msg in ws:
+            if msg.type != WSMsgType.TEXT:
+                break
+            payload = json.loads(msg.data)
+            op, data = payload["op"], payload["d"]
+            if op == HEARTBEAT:
+                await send(HEARTBEAT_ACK, None)
+            elif op == IDENTIFY:
+                self.identifies += 1
+                session_id = f"session-{next(self._session_ids)}"
+                shard_id, shard_count = data.get("shard", [0, 1])
+                guild_ids = self.shard_guilds(shard_id, shard_count)
+                await send(
+                    DISPATCH,
+                    {
+                        "v": 10,
+                        "user": self.user,
+                        "guilds": [
+                            {"id": str(g), "unavailable": True} for g in guild_ids
+                        ],
+                        "session_id": session_id,
+                        "resume_gateway_url": f"ws://{self.host}:{self.port}/gateway",
+                        "shard": [shard_id, shard_count],
+                        "application": {"id": str(APPLICATION_ID), "flags": 0},
+                    },
+                    "READY",
+                )
+                for guild_id in guild_ids:
+                    await send(DISPATCH, self.guild(guild_id), "GUILD_CREATE")
+            elif op == RESUME:
+                if data["session_id"] not in self.sessions:
+                    await send(INVALID_SESSION, False)
+                    continue
+                self.resumes += 1
+                session_id = data["session_id"]
+                await send(DISPATCH, {}, "RESUMED")
+            elif op == REQUEST_MEMBERS:
+                await send(
+                    DISPATCH,
+                    {
+                        "guild_id": str(data["guild_id"]),
+                        "members": [],
+                        "chunk_index": 0,
+                        "chunk_count": 1,
+                        "nonce": data.get("nonce"),
+                    },
+                    "GUILD_MEMBERS_CHUNK",
+                )
+
+        # Like Discord, closing normally ends the session
+        if ws.close_code == 1000:
+            self.sessions.pop(session_id, None)
+        return ws
+
+
+async def serve(args: argparse.Namespace) -> None:
+    fake = FakeDiscord(
+        guilds=args.guilds,
+        members=args.members,
+        shards=args.shards,
+        host=args.host,
+        port=args.port,
+        max_concurrency=args.max_concurrency,
+    )
+    await fake.start()
+    print(f"Fake Discord listening, set DISCORD_API_BASE={fake.url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await fake.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--guilds", type=int, default=100)
+    parser.add_argument("--members", type=int, default=0)
+    parser.add_argument("--shards", type=int, default=1)
+    parser.add_argument("--max-concurrency", type=int, default=1)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,540 @@
+"""An in-memory stand-in for the parts of MongoDB the bot uses.
+
+Implements enough of pymongo's async client, database and collection API
+for Beanie and the bot's models: inserts, finds with the common query
+operators, sorting and projections, updates with `$set`, `$setOnInsert`,
+`$inc` and `$unset` (including upserts), deletes, counts and bulk writes.
+Every operation completes immediately and atomically, and documents are
+copied on the way in and out like a real round trip would. Indexes are
+accepted but neither enforced nor used, so queries scan the collection.
+
+Lets benchmarks run the bot without a MongoDB server:
+    client = FakeMongoClient()
+    await init_beanie(client["my-bot"], document_models=[...])
+"""
+
+import copy
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+from bson import ObjectId
+from pymongo import DeleteMany, DeleteOne, InsertOne, ReplaceOne, ReturnDocument
+from pymongo import UpdateMany, UpdateOne
+from pymongo.errors import OperationFailure
+from pymongo.results import (
+    BulkWriteResult,
+    DeleteResult,
+    InsertManyResult,
+    InsertOneResult,
+    UpdateResult,
+)
+
+MISSING = object()
+
+
+def _get(document: Mapping[str, Any], path: str) -> Any:
+    value: Any = document
+    for part in path.split("."):
+        if not isinstance(value, Mapping) or part not in value:
+            return MISSING
+        value = value[part]
+    return value
+
+
+def _set(document: Dict[str, Any], path: str, value: Any) -> None:
+    *parents, last = path.split(".")
+    for part in parents:
+        document = document.setdefault(part, {})
+    document[last] = value
+
+
+def _unset(document: Dict[str, Any], path: str) -> None:
+    *parents, last = path.split(".")
+    for part in parents:
+        document = document.get(part)
+        if not isinstance(document, dict):
+            return
+    document.pop(last, None)
+
+
+def _equals(value: Any, expected: Any) -> bool:
+    if value is MISSING:
+        return expected is None
+    if isinstance(value, list) and not isinstance(expected, list):
+        return expected in value
+    return value == expected
+
+
+def _compare(value: Any, operator: str, argument: Any) -> bool:
+    if operator == "$eq":
+        return _equals(value, argument)
+    if operator == "$ne":
+        return not _equals(value, argument)
+    if operator == "$in":
+        return any(_equals(value, item) for item in argument)
+    if operator == "$nin":
+        return not any(_equals(value, item) for item in argument)
+    if operator == "$exists":
+        return (value is not MISSING) == bool(argument)
+    if operator in ("$gt", "$gte", "$lt", "$lte"):
+        if value is MISSING or value is None:
+            return False
+        try:
+            if operator == "$gt":
+                return value > argument
+            if operator == "$gte":
+                return value >= argument
+            if operator == "$lt":
+                return value < argument
+            return value <= argument
+        except TypeError:
+            return False
+    raise OperationFailure(f"Unsupported query operator {operator}")
+
+
+def _is_operators(condition: Any) -> bool:
+    return (
+        isinstance(condition, Mapping)
+        and bool(condition)
+        and all(key.startswith("$") for key in condition)
+    )
+
+
+def matches(document: Mapping[str, Any], query: Optional[Mapping[str, Any]]) -> bool:
+    """Check whether a document matches a query."""
+    for key, condition in (query or {}).items():
+        if key == "$and":
+            if not all(matches(document, q) for q in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(document, q) for q in condition):
+                return False
+        elif key == "$nor":
+            if any(matches(document, q) for q in condition):
+                return False
+        elif key.startswith("$"):
+            raise OperationFailure(f"Unsupported query operator {key}")
+        else:
+            value = _get(document, key)
+            if _is_operators(condition):
+                if not all(_compare(value, op, arg) for op, arg in condition.items()):
+                    return False
+            elif not _equals(value, condition):
+                return False
+    return True
+
+
+def _apply_update(
+    document: Dict[str, Any], update: Mapping[str, Any], inserting: bool
+) -> None:
+    for operator, fields in update.items():
+        if operator == "$set" or (operator == "$setOnInsert" and inserting):
+            for path, value in fields.items():
+                _set(document, path, copy.deepcopy(value))
+        elif operator == "$setOnInsert":
+            continue
+        elif operator == "$inc":
+            for path, amount in fields.items():
+                current = _get(document, path)
+                _set(document, path, (0 if current is MISSING else current) + amount)
+        elif operator == "$unset":
+            for path in fields:
+                _unset(document, path)
+        else:
+            raise OperationFailure(f"Unsupported update operator {operator}")
+
+
+def _upsert_base(query: Optional[Mapping[str, Any]]) -> Dict[str, Any]:
+    # An upserted document starts with the query's equality conditions
+    document: Dict[str, Any] = {}
+    for key, condition in (query or {}).items():
+        if key.startswith("$"):
+            continue
+        if _is_operators(condition):
+            if "$eq" in condition:
+                _set(document, key, copy.deepcopy(condition["$eq"]))
+        else:
+            _set(document, key, copy.deepcopy(condition))
+    return document
+
+
+def _project(
+    document: Dict[str, Any], projection: Optional[Mapping[str, Any]]
+) -> Dict[str, Any]:
+    if not projection:
+        return copy.deepcopy(document)
+    if not isinstance(projection, Mapping):
+        projection = {field: 1 for field in projection}
+    include_id = projection.get("_id", 1)
+    fields = {k: v for k, v in projection.items() if k != "_id"}
+    if fields and all(fields.values()):
+        result = {}
+        for path in fields:
+            value = _get(document, path)
+            if value is not MISSING:
+                _set(result, path, copy.deepcopy(value))
+        if include_id and "_id" in document:
+            result["_id"] = copy.deepcopy(document["_id"])
+        return result
+    result = copy.deepcopy(document)
+    for path in fields:
+        _unset(result, path)
+    if not include_id:
+        result.pop("_id", None)
+    return result
+
+
+class FakeCursor:
+    """The async cursor returned by :meth:`FakeCollection.find`."""
+
+    def __init__(self, documents: Iterable[Dict[str, Any]]) -> None:
+        self._documents = iter(documents)
+
+    def __aiter__(self) -> "FakeCursor":
+        return self
+
+    async def __anext__(self) -> Dict[str, Any]:
+        try:
+            return next(self._documents)
+        except StopIteration:
+            raise StopAsyncIteration from None
+
+    async def next(self) -> Dict[str, Any]:
+        return await self.__anext__()
+
+    async def to_list(self, length: Optional[int] = None) -> List[Dict[str, Any]]:
+        documents = []
+        async for document in self:
+            documents.append(document)
+            if length and len(documents) >= length:
+                break
+        return documents
+
+    async def close(self) -> None:
+        pass
+
+
+class FakeCollection:
+    """A collection kept in a dict, keyed by `_id`."""
+
+    def __init__(self, database: "FakeDatabase", name: str) -> None:
+        self.database = database
+        self.name = name
+        self._documents: Dict[Any, Dict[str, Any]] = {}
+        self._indexes: Dict[str, Dict[str, Any]] = {"_id_": {"key": [("_id", 1)]}}
+
+    def _count(self, operation: str) -> None:
+        self.database.client.operations[operation] += 1
+
+    def _find(
+        self,
+        query: Optional[Mapping[str, Any]],
+        sort: Optional[Sequence[Tuple[str, int]]] = None,
+    ) -> List[Dict[str, Any]]:
+        _id = (query or {}).get("_id", MISSING)
+        if _id is not MISSING and not _is_operators(_id):
+            document = self._documents.get(_id)
+            found = (
+                [document] if document is not None and matches(document, query) else []
+            )
+        else:
+            found = [d for d in self._documents.values() if matches(d, query)]
+        for key, direction in reversed(sort or []):
+            found.sort(
+                key=lambda d: (_get(d, key) not in (MISSING, None), _get(d, key)),
+                reverse=direction < 0,
+            )
+        return found
+
+    def find(
+        self,
+        filter: Optional[Mapping[str, Any]] = None,
+        projection: Optional[Mapping[str, Any]] = None,
+        skip: int = 0,
+        limit: int = 0,
+        sort: Optional[Sequence[Tuple[str, int]]] = None,
+        **kwargs: Any,
+    ) -> FakeCursor:
+        self._count("find")
+        found = self._find(filter, sort)[skip or 0 :]
+        if limit:
+            found = found[:limit]
+        return FakeCursor(_project(d, projection) for d in found)
+
+    async def find_one(
+        self,
+        filter: Optional[Mapping[str, Any]] = None,
+        projection: Optional[Mapping[str, Any]] = None,
+        sort: Optional[Sequence[Tuple[str, int]]] = None,
+        **kwargs: Any,
+    ) -> Optional[Dict[str, Any]]:
+        self._count("find")
+        found = self._find(filter, sort)
+        return _project(found[0], projection) if found else None
+
+    async def count_documents(
+        self, filter: Optional[Mapping[str, Any]] = None, **kwargs: Any
+    ) -> int:
+        self._count("count")
+        return len(self._find(filter))
+
+    def _insert(self, document: Mapping[str, Any]) -> Any:
+        document = copy.deepcopy(dict(document))
+        document.setdefault("_id", ObjectId())
+        if document["_id"] in self._documents:
+            raise OperationFailure("E11000 duplicate key error", code=11000)
+        self._documents[document["_id"]] = document
+        return document["_id"]
+
+    async def insert_one(
+        self, document: Mapping[str, Any], **kwargs: Any
+    ) -> InsertOneResult:
+        self._count("insert")
+        return InsertOneResult(self._insert(document), True)
+
+    async def insert_many(
+        self, documents: Iterable[Mapping[str, Any]], **kwargs: Any
+    ) -> InsertManyResult:
+        self._count("insert")
+        return InsertManyResult([self._insert(d) for d in documents], True)
+
+    def _update(
+        self,
+        query: Optional[Mapping[str, Any]],
+        update: Mapping[str, Any],
+        upsert: bool,
+        many: bool,
+        replace: bool = False,
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], Any]:
+        """Returns the matched documents before and after, and the upserted ID."""
+        found = self._find(query)
+        if not many:
+            found = found[:1]
+        before = [copy.deepcopy(d) for d in found]
+        for document in found:
+            if replace:
+                _id = document["_id"]
+                document.clear()
+                document.update(copy.deepcopy(dict(update)), _id=_id)
+            else:
+                _apply_update(document, update, inserting=False)
+        if found or not upsert:
+            return before, found, None
+
+        document = _upsert_base(query)
+        if replace:
+            document.update(copy.deepcopy(dict(update)))
+        else:
+            _apply_update(document, update, inserting=True)
+        _id = self._insert(document)
+        return [], [self._documents[_id]], _id
+
+    @staticmethod
+    def _update_result(before: list, upserted_id: Any) -> UpdateResult:
+        raw = {"n": len(before) or int(upserted_id is not None)}
+        raw["nModified"] = len(before)
+        if upserted_id is not None:
+            raw["upserted"] = upserted_id
+        return UpdateResult(raw, True)
+
+    async def update_one(
+        self,
+        filter: Mapping[str, Any],
+        update: Mapping[str, Any],
+        upsert: bool = False,
+        **kwargs: Any,
+    ) -> UpdateResult:
+        self._count("update")
+        before, _, upserted_id = self._update(filter, update, upsert, many=False)
+        return self._update_result(before, upserted_id)
+
+    async def update_many(
+        self,
+        filter: Mapping[str, Any],
+        update: Mapping[str, Any],
+        upsert: bool = False,
+        **kwargs: Any,
+    ) -> UpdateResult:
+        self._count("update")
+        before, _, upserted_id = self._update(filter, update, upsert, many=True)
+        return self._update_result(before, upserted_id)
+
+    async def replace_one(
+        self,
+        filter: Mapping[str, Any],
+        replacement: Mapping[str, Any],
+        upsert: bool = False,
+        **kwargs: Any,
+    ) -> UpdateResult:
+        self._count("update")
+        before, _, upserted_id = self._update(
+            filter, replacement, upsert, many=False, replace=True
+        )
+        return self._update_result(before, upserted_id)
+
+    async def find_one_and_update(
+        self,
+        filter: Mapping[str, Any],
+        update: Mapping[str, Any],
+        projection: Optional[Mapping[str, Any]] = None,
+        upsert: bool = False,
+        return_document: bool = ReturnDocument.BEFORE,
+        **kwargs: Any,
+    ) -> Optional[Dict[str, Any]]:
+        self._count("update")
+        before, after, _ = self._update(filter, update, upsert, many=False)
+        documents = after if return_document == ReturnDocument.AFTER else before
+        return _project(documents[0], projection) if documents else None
+
+    def _delete(self, query: Optional[Mapping[str, Any]], many: bool) -> int:
+        found = self._find(query)
+        if not many:
+            found = found[:1]
+        for document in found:
+            del self._documents[document["_id"]]
+        return len(found)
+
+    async def delete_one(
+        self, filter: Mapping[str, Any], **kwargs: Any
+    ) -> DeleteResult:
+        self._count("delete")
+        return DeleteResult({"n": self._delete(filter, many=False)}, True)
+
+    async def delete_many(
+        self, filter: Mapping[str, Any], **kwargs: Any
+    ) -> DeleteResult:
+        self._count("delete")
+        return DeleteResult({"n": self._delete(filter, many=True)}, True)
+
+    async def bulk_write(
+        self, requests: Sequence[Any], ordered: bool = True, **kwargs: Any
+    ) -> BulkWriteResult:
+        self._count("bulk_write")
+        result = {
+            "nInserted": 0,
+            "nMatched": 0,
+            "nModified": 0,
+            "nUpserted": 0,
+            "nRemoved": 0,
+            "upserted": [],
+            "writeErrors": [],
+            "writeConcernErrors": [],
+        }
+        for index, request in enumerate(requests):
+            if isinstance(request, InsertOne):
+                self._insert(request._doc)
+                result["nInserted"] += 1
+            elif isinstance(request, (UpdateOne, UpdateMany, ReplaceOne)):
+                before, _, upserted_id = self._update(
+                    request._filter,
+                    request._doc,
+                    bool(request._upsert),
+                    many=isinstance(request, UpdateMany),
+                    replace=isinstance(request, ReplaceOne),
+                )
+                result["nMatched"] += len(before)
+                result["nModified"] += len(before)
+                if upserted_id is not None:
+                    result["nUpserted"] += 1
+                    result["upserted"].append({"index": index, "_id": upserted_id})
+            elif isinstance(request, (DeleteOne, DeleteMany)):
+                result["nRemoved"] += self._delete(
+                    request._filter, many=isinstance(request, DeleteMany)
+                )
+            else:
+                raise OperationFailure(f"Unsupported bulk operation {request!r}")
+        return BulkWriteResult(result, True)
+
+    async def index_information(self, **kwargs: Any) -> Dict[str, Dict[str, Any]]:
+        return copy.deepcopy(self._indexes)
+
+    async def create_indexes(self, indexes: Sequence[Any], **kwargs: Any) -> List[str]:
+        names = []
+        for index in indexes:
+            spec = dict(index.document)
+            self._indexes[spec["name"]] = {
+                "key": list(spec.pop("key").items()),
+                **{k: v for k, v in spec.items() if k != "name"},
+            }
+            names.append(spec["name"])
+        return names
+
+    async def drop_index(self, name: str, **kwargs: Any) -> None:
+        self._indexes.pop(name, None)
+
+    async def watch(self, *args: Any, **kwargs: Any) -> None:
+        # Like a standalone server, which the bot falls back to polling for
+        raise OperationFailure(
+            "The $changeStream stage is only supported on replica sets", code=40573
+        )
+
+
+class FakeDatabase:
+    """A database holding :class:`FakeCollection` instances."""
+
+    def __init__(self, client: "FakeMongoClient", name: str) -> None:
+        self.client = client
+        self.name = name
+        self._collections: Dict[str, FakeCollection] = {}
+
+    def __getitem__(self, name: str) -> FakeCollection:
+        return self.get_collection(name)
+
+    def get_collection(self, name: str, **kwargs: Any) -> FakeCollection:
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self._collections[name] = FakeCollection(self, name)
+        return collection
+
+    async def create_collection(self, name: str, **kwargs: Any) -> FakeCollection:
+        return self.get_collection(name)
+
+    async def list_collection_names(self, **kwargs: Any) -> List[str]:
+        return list(self._collections)
+
+    async def drop_collection(self, name: str, **kwargs: Any) -> None:
+        self._collections.pop(name, None)
+
+    async def command(self, command: Any, **kwargs: Any) -> Dict[str, Any]:
+        name = next(iter(command)) if isinstance(command, Mapping) else command
+        if name == "buildInfo":
+            return {"version": "7.0.0", "versionArray": [7, 0, 0, 0], "ok": 1.0}
+        if name == "ping":
+            return {"ok": 1.0}
+        raise OperationFailure(f"Unsupported command {name}")
+
+
+class FakeMongoClient:
+    """Stands in for :class:`pymongo.AsyncMongoClient`.
+
+    Attributes
+    ----------
+    operations: :class:`collections.Counter`
+        The number of operations of each kind (`find`, `insert`,
+        `update`, `delete`, `count`, `bulk_write`) run so far.
+    """
+
+    def __init__(self) -> None:
+        self._databases: Dict[str, FakeDatabase] = {}
+        self.operations: Counter = Counter()
+
+    def __getitem__(self, name: str) -> FakeDatabase:
+        return self.get_database(name)
+
+    def get_database(self, name: str, **kwargs: Any) -> FakeDatabase:
+        database = self._databases.get(name)
+        if database is None:
+            database = self._databases[name] = FakeDatabase(self, name)
+        return database
+
+    async def list_database_names(self, **kwargs: Any) -> List[str]:
+        return [name for name, db in self._databases.items() if db._collections]
+
+    async def drop_database(self, name: str, **kwargs: Any) -> None:
+        self._databases.pop(name, None)
+
+    def append_metadata(self, metadata: Any) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
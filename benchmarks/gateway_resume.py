@@ -0,0 +1,94 @@
+"""Benchmark the time to ready of resumed vs. identified gateway sessions.
+
+Starts the fake Discord from `benchmarks/fake_discord.py` and boots the
+bot against it, alternating between identifying every shard (like a
+fresh start) and resuming the sessions the previous boot saved when it
+closed. Reports the p50 time from connecting to ready for both.
+
+The sessions are saved in the in-memory database of `benchmarks/handlers.py`,
+shared between the boots, so no MongoDB is needed.
+
+Usage (from the project root):
+    python -m benchmarks.gateway_resume [--runs 5] [--guilds 1000] [--shards 2]
+"""
+
+import time
+import shutil
+import asyncio
+import argparse
+import statistics
+from typing import Dict, List
+
+import disnake
+
+from bot import Config
+from benchmarks.fake_discord import FakeDiscord
+from benchmarks.fake_mongo import FakeMongoClient
+from benchmarks.handlers import BenchBot
+
+
+async def boot(
+    config: Config, database: FakeMongoClient, shard_count: int, resume: bool
+) -> float:
+    bot = BenchBot(config=config, database=database, shard_count=shard_count)
+    await bot.setup_hook("token")
+    if not resume:
+        # Identify, even though the last boot saved its sessions
+        bot.resumer._saved.clear()
+
+    start = time.perf_counter()
+    connect = asyncio.create_task(bot.connect())
+    await bot.wait_until_ready()
+    seconds = time.perf_counter() - start
+    await bot.close()
+    await connect
+    shutil.rmtree(bot.temp_dir, ignore_errors=True)
+    return seconds
+
+
+async def run(args: argparse.Namespace) -> None:
+    fake = FakeDiscord(guilds=args.guilds, shards=args.shards, port=args.port)
+    await fake.start()
+    disnake.http.Route.BASE = fake.url
+    config = Config(
+        DEBUG=False,
+        DISNAKE_LOGGING=False,
+        TEST_MODE=True,
+        DISCORD_BOT_TOKEN="token",
+        TEST_GUILDS=[],
+        DATABASE_URI="",
+        NASA_KEY="",
+        METRICS_PORT=0,
+        COMMAND_SYNC="never",
+        RESUME_WINDOW=60.0,
+    )
+
+    # Sessions saved when a bot closes are loaded by the next one
+    database = FakeMongoClient()
+    samples: Dict[str, List[float]] = {"identified": [], "resumed": []}
+    try:
+        # The first boot identifies and saves the sessions for the second
+        for _ in range(args.runs):
+            for mode in samples:
+                seconds = await boot(config, database, args.shards, mode == "resumed")
+                samples[mode].append(seconds * 1000)
+    finally:
+        await fake.close()
+
+    print(f"{args.guilds} guilds on {args.shards} shards, {args.runs} runs")
+    for mode, ms in samples.items():
+        print(f"{mode:<12} p50 {statistics.median(ms):9.1f} ms")
+    print(f"identifies: {fake.identifies}, resumes: {fake.resumes}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--guilds", type=int, default=1000)
+    parser.add_argument("--shards", type=int, default=2)
+    parser.add_argument("--port", type=int, default=8765)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Benchmark guild join handling as the guilds collection grows.
+
+Seeds a scratch database with an increasing number of guild documents and
+times `models.Guild.register` for both new and already registered guilds.
+With the unique `guild_id` index the latency should stay flat from 1k to
+100k documents. Pass `--legacy` to also time the old full-collection scan
+for comparison.
+
+Pass `--in-memory` to run against :class:`FakeMongoClient` instead of a
+MongoDB server. The fake doesn't use indexes, so its latency grows with
+the collection; use it to check the code path, not the index.
+
+Usage (from the project root, with `DATABASE_URI` set or in `.env`):
+    python -m benchmarks.guild_join [--sizes 1000,10000,100000] [--legacy]
+    python -m benchmarks.guild_join --in-memory [--sizes 1000,10000]
+"""
+
+import os
+import time
+import asyncio
+import argparse
+import statistics
+from typing import Awaitable, Callable, List
+from uuid import uuid4
+
+from beanie import init_beanie
+from bson import Binary
+from dotenv import load_dotenv
+from pymongo import AsyncMongoClient
+
+import models
+from benchmarks.fake_mongo import FakeMongoClient
+
+DATABASE_NAME = "bench-my-bot"
+
+
+async def seed(target: int) -> None:
+    collection = models.Guild.get_pymongo_collection()
+    count = await collection.count_documents({})
+    batch = []
+    for guild_id in range(count, target):
+        batch.append(
+            {
+                "_id": Binary.from_uuid(uuid4()),
+                "guild_id": guild_id,
+                "name": f"guild-{guild_id}",
+                "bot_log_channel_id": guild_id,
+            }
+        )
+        if len(batch) == 10000:
+            await collection.insert_many(batch, ordered=False)
+            batch.clear()
+    if batch:
+        await collection.insert_many(batch, ordered=False)
+
+
+async def time_calls(
+    func: Callable[[int], Awaitable[object]], guild_ids: List[int]
+) -> List[float]:
+    timings = []
+    for guild_id in guild_ids:
+        start = time.perf_counter()
+        await func(guild_id)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+async def register(guild_id: int) -> None:
+    await models.Guild.register(guild_id, f"guild-{guild_id}", guild_id)
+
+
+async def legacy_join(guild_id: int) -> None:
+    guild_docs = await models.Guild.find_all().to_list()
+    if guild_id in [guild_doc.guild_id for guild_doc in guild_docs]:
+        return
+
+
+def report(label: str, size: int, timings: List[float]) -> None:
+    timings = sorted(timings)
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    print(
+        f"{label:<16} {size:>8} docs  "
+        f"p50 {statistics.median(timings):8.3f} ms  p99 {p99:8.3f} ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--legacy", action="store_true")
+    parser.add_argument(
+        "--in-memory", action="store_true", help="use the in-memory database"
+    )
+    args = parser.parse_args()
+
+    if args.in_memory:
+        client = FakeMongoClient()
+    else:
+        load_dotenv()
+        client = AsyncMongoClient(os.environ["DATABASE_URI"])
+    await client.drop_database(DATABASE_NAME)
+    await init_beanie(client[DATABASE_NAME], document_models=[models.Guild])
+
+    try:
+        for size in map(int, args.sizes.split(",")):
+            await seed(size)
+            new_ids = list(range(10**12, 10**12 + args.iterations))
+            existing_ids = list(range(0, size, max(1, size // args.iterations)))
+
+            report("register/new", size, await time_calls(register, new_ids))
+            await models.Guild.find({"guild_id": {"$gte": 10**12}}).delete()
+            report("register/exists", size, await time_calls(register, existing_ids))
+            if args.legacy:
+                report("legacy scan", size, await time_calls(legacy_join, new_ids[:5]))
+    finally:
+        await client.drop_database(DATABASE_NAME)
+        await client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,419 @@
+"""Benchmark the cogs' handlers without Discord or MongoDB.
+
+Boots the bot against the fake Discord from `benchmarks/fake_discord.py`,
+the in-memory database from `benchmarks/fake_mongo.py` and a local
+stand-in for the external APIs the commands call. Each handler is then
+fed synthetic gateway events one at a time. They go through the shard's
+websocket parser like real events, and the benchmark waits until
+everything they started has finished, including the REST requests.
+
+It reports the throughput and p50/p99 latency of each handler, and the
+memory allocated per operation. Allocations are traced in a separate,
+shorter pass, since tracing slows everything down. Save a run with
+`--save` and compare later runs against it with `--baseline`. The
+benchmark fails if any handler got slower, allocates more than the
+tolerance allows, or raised an error.
+
+Usage (from the project root):
+    python -m benchmarks.handlers [--ops 500] [--guilds 100] [--only NAME,...]
+                                  [--save FILE | --baseline FILE]
+"""
+
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import contextlib
+import tempfile
+import threading
+import statistics
+import tracemalloc
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Set
+
+import disnake
+from aiohttp import web
+from loguru import logger
+
+import utils
+from bot import MyBot, Config
+from benchmarks.fake_discord import FakeDiscord, json_response
+from benchmarks.fake_mongo import FakeMongoClient
+
+# Builds the gateway event of the n-th operation
+EventFactory = Callable[[int], Dict[str, Any]]
+
+
+class Upstream:
+    """A local stand-in for the external APIs the commands call: NASA's
+    EPIC API and files to download."""
+
+    def __init__(self, port: int, images: int = 20, file_size: int = 256 * 1024):
+        self.port = port
+        self.images = [
+            {
+                "image": f"epic_1b_2024010100{i:04d}",
+                "date": "2024-01-01 00:00:00",
+                "identifier": f"2024010100{i:04d}",
+                "caption": "This image was taken by NASA's EPIC camera",
+                "coords": {"centroid_coordinates": {"lat": 1.0, "lon": -i * 10.0}},
+            }
+            for i in range(images)
+        ]
+        self.file = bytes(range(256)) * (file_size // 256)
+        self._runner = None
+
+        self.app = web.Application()
+        self.app.add_routes(
+            [
+                web.get("/api/natural", self.natural),
+                web.get("/files/{name}", self.download),
+            ]
+        )
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    async def start(self) -> None:
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, "127.0.0.1", self.port).start()
+
+    async def close(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def natural(self, request: web.Request) -> web.Response:
+        return json_response(self.images)
+
+    async def download(self, request: web.Request) -> web.Response:
+        return web.Response(body=self.file, content_type="image/png")
+
+
+class ServerThread:
+    """Runs the fake servers on their own event loop, so that their tasks
+    and work don't count towards the bot's."""
+
+    def __init__(self) -> None:
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def run(self, coro: Awaitable[Any]) -> Awaitable[Any]:
+        return asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self.loop))
+
+    def stop(self) -> None:
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+class BenchBot(MyBot):
+    """The bot, with an in-memory database and its own temp directory.
+
+    Pass `database=` to share one in-memory database between bots, e.g.
+    across restarts.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.database = kwargs.pop("database", None) or FakeMongoClient()
+        self.errors = 0
+        super().__init__(*args, **kwargs)
+        self.add_listener(self.count_error, "on_slash_command_error")
+
+    def create_database_client(self) -> FakeMongoClient:
+        return self.database
+
+    def create_temp_dir(self):
+        self.temp_dir = tempfile.mkdtemp(prefix="bench-my-bot-")
+
+    async def count_error(self, *args):
+        self.errors += 1
+
+    async def on_error(self, event_method: str, *args, **kwargs):
+        self.errors += 1
+        await super().on_error(event_method, *args, **kwargs)
+
+
+def dispatch(event: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    return {"op": 0, "t": event, "s": None, "d": data}
+
+
+async def settle(known: Set[asyncio.Task], timeout: float = 30.0) -> None:
+    """Wait for every task started since `known` was taken, and for the
+    tasks those start, until there are none left."""
+    current = asyncio.current_task()
+    deadline = time.perf_counter() + timeout
+    while True:
+        started = asyncio.all_tasks() - known - {current}
+        if not started:
+            return
+        known |= started
+        await asyncio.wait(started, timeout=max(0.0, deadline - time.perf_counter()))
+        if time.perf_counter() > deadline:
+            raise TimeoutError(f"Handler didn't finish within {timeout:.0f}s")
+
+
+class Harness:
+    def __init__(self, bot: BenchBot, fake: FakeDiscord, upstream: Upstream):
+        self.bot = bot
+        self.fake = fake
+        self.upstream = upstream
+
+    @property
+    def ws(self):
+        return self.bot._AutoShardedClient__shards[0].ws
+
+    async def feed(self, raw: str) -> None:
+        """Handle a gateway event like the shard would and wait until the
+        handlers are done."""
+        known = asyncio.all_tasks()
+        await self.ws.received_message(raw)
+        await settle(known)
+
+    def guild_id(self, n: int) -> int:
+        return self.fake.guild_ids[n % len(self.fake.guild_ids)]
+
+    async def scenarios(self) -> Dict[str, EventFactory]:
+        fake = self.fake
+
+        def earth(n: int) -> Dict[str, Any]:
+            return dispatch(
+                "INTERACTION_CREATE", fake.slash_command("earth", self.guild_id(n))
+            )
+
+        def download_file(n: int) -> Dict[str, Any]:
+            # A few distinct files, so most requests are served from disk
+            url = f"{self.upstream.url}/files/image-{n % 10}.png"
+            return dispatch(
+                "INTERACTION_CREATE",
+                fake.slash_command(
+                    "download_file",
+                    self.guild_id(n),
+                    options=[{"name": "url", "type": 3, "value": url}],
+                ),
+            )
+
+        def bind_log_channel(n: int) -> Dict[str, Any]:
+            guild_id = self.guild_id(n)
+            channel = {**fake.channel(guild_id), "permissions": str(2**53 - 1)}
+            return dispatch(
+                "INTERACTION_CREATE",
+                fake.slash_command(
+                    "bind_log_channel",
+                    guild_id,
+                    options=[{"name": "channel", "type": 7, "value": channel["id"]}],
+                    resolved={"channels": {channel["id"]: channel}},
+                ),
+            )
+
+        # Send one paginator to turn the pages of
+        interaction = earth(0)
+        await self.feed(json.dumps(interaction))
+        message = fake.responses[interaction["d"]["token"]]
+        buttons = message["components"][0]["components"]
+        next_page = next(b["custom_id"] for b in buttons if b["emoji"]["name"] == "▶")
+
+        def paginator(n: int) -> Dict[str, Any]:
+            return dispatch(
+                "INTERACTION_CREATE",
+                fake.button_click(self.guild_id(0), message, next_page),
+            )
+
+        def guild_update(n: int) -> Dict[str, Any]:
+            guild = fake.guild(self.guild_id(n), name=f"renamed-{n}")
+            # Like Discord, without the lists only sent in GUILD_CREATE
+            for key in ("members", "channels", "threads", "presences", "voice_states"):
+                del guild[key]
+            return dispatch("GUILD_UPDATE", guild)
+
+        joined = iter(range(len(fake.guild_ids), 2**21))
+
+        def guild_join(n: int) -> Dict[str, Any]:
+            i = next(joined)
+            guild = fake.guild((i + 1) << 22 | i)
+            # Guilds that become available again after an outage have this
+            del guild["unavailable"]
+            return dispatch("GUILD_CREATE", guild)
+
+        return {
+            "commands.earth": earth,
+            "commands.download_file": download_file,
+            "admin.bind_log_channel": bind_log_channel,
+            "paginator.next_page": paginator,
+            "events.guild_update": guild_update,
+            "events.guild_join": guild_join,
+        }
+
+    async def time_ops(self, factory: EventFactory, ops: int) -> List[float]:
+        latencies = []
+        for n in range(ops):
+            raw = json.dumps(factory(n))
+            start = time.perf_counter()
+            await self.feed(raw)
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    async def trace_ops(self, factory: EventFactory, ops: int) -> List[int]:
+        """Get the peak number of bytes allocated while handling each event."""
+        peaks = []
+        tracemalloc.start()
+        try:
+            for n in range(ops):
+                raw = json.dumps(factory(n))
+                tracemalloc.reset_peak()
+                before, _ = tracemalloc.get_traced_memory()
+                await self.feed(raw)
+                peaks.append(tracemalloc.get_traced_memory()[1] - before)
+        finally:
+            tracemalloc.stop()
+        return peaks
+
+
+def percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+@contextlib.asynccontextmanager
+async def local_bot(
+    fake: FakeDiscord, upstream: Upstream, profile: str = "full"
+) -> AsyncIterator[BenchBot]:
+    """Start the fake servers and a bot connected to them, and stop
+    everything when done.
+
+    Parameters
+    ----------
+    fake: :class:`FakeDiscord`
+        The fake Discord to connect to.
+    upstream: :class:`Upstream`
+        The stand-in for the external APIs.
+    profile: :class:`str`
+        The bot's `CACHE_PROFILE`. (Default: full)
+    """
+    servers = ServerThread()
+    await servers.run(fake.start())
+    await servers.run(upstream.start())
+    disnake.http.Route.BASE = fake.url
+
+    config = Config(
+        DEBUG=False,
+        DISNAKE_LOGGING=False,
+        TEST_MODE=True,
+        DISCORD_BOT_TOKEN="token",
+        TEST_GUILDS=[],
+        DATABASE_URI="",
+        NASA_KEY="",
+        METRICS_PORT=0,
+        COMMAND_SYNC="never",
+        CACHE_PROFILE=profile,
+    )
+    cache_profile = utils.get_cache_profile(config.CACHE_PROFILE)
+    bot = BenchBot(config=config, shard_count=1, **cache_profile.bot_kwargs())
+    connect = None
+    try:
+        await bot.setup_hook("token")
+        sys.modules["cogs.commands"].EPIC_URL = upstream.url
+        connect = asyncio.create_task(bot.connect())
+        await bot.wait_until_ready()
+        await bot._deferred_setup
+        yield bot
+    finally:
+        await bot.close()
+        if connect is not None and not bot.is_closed():
+            connect.cancel()
+        await servers.run(fake.close())
+        await servers.run(upstream.close())
+        servers.stop()
+        shutil.rmtree(bot.temp_dir, ignore_errors=True)
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Dict[str, float]]:
+    fake = FakeDiscord(guilds=args.guilds, members=args.members, port=args.port)
+    upstream = Upstream(port=args.port + 1)
+    results = {}
+    async with local_bot(fake, upstream, args.profile) as bot:
+        harness = Harness(bot, fake, upstream)
+        scenarios = await harness.scenarios()
+        only = set(args.only.split(",")) if args.only else set(scenarios)
+        for name, factory in scenarios.items():
+            if name not in only:
+                continue
+            errors = bot.errors
+            queries = sum(bot.database.operations.values())
+            await harness.time_ops(factory, args.warmup)
+            latencies = await harness.time_ops(factory, args.ops)
+            queries = sum(bot.database.operations.values()) - queries
+            peaks = await harness.trace_ops(factory, args.traced_ops)
+            results[name] = {
+                "ops_per_sec": len(latencies) / sum(latencies),
+                "p50_ms": statistics.median(latencies) * 1000,
+                "p99_ms": percentile(latencies, 0.99) * 1000,
+                "peak_kib": statistics.median(peaks) / 1024,
+                "queries": queries / (args.warmup + args.ops),
+                "errors": bot.errors - errors,
+            }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ops", type=int, default=500, help="timed ops per handler")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument(
+        "--traced-ops", type=int, default=50, help="ops per handler to trace"
+    )
+    parser.add_argument("--guilds", type=int, default=100)
+    parser.add_argument("--members", type=int, default=10)
+    parser.add_argument("--profile", default="full", help="the CACHE_PROFILE")
+    parser.add_argument("--only", help="comma-separated handlers to run")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--save", help="save the results to this file")
+    parser.add_argument("--baseline", help="compare the results to this file")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.2, help="allowed regression (Default: 0.2)"
+    )
+    args = parser.parse_args()
+
+    # Every handler logs, which would drown out the results
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+    results = asyncio.run(run(args))
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    print(
+        f"{'handler':<24} {'ops/s':>8} {'p50 ms':>8} {'p99 ms':>8} "
+        f"{'peak KiB':>9} {'queries':>8} {'errors':>6}"
+    )
+    regressions = []
+    for name, r in results.items():
+        line = (
+            f"{name:<24} {r['ops_per_sec']:8.0f} {r['p50_ms']:8.2f} {r['p99_ms']:8.2f} "
+            f"{r['peak_kib']:9.1f} {r['queries']:8.2f} {r['errors']:6d}"
+        )
+        if r["errors"]:
+            regressions.append(f"{name} raised {r['errors']} errors")
+        if name in baseline:
+            base = baseline[name]
+            line += f"  (baseline {base['ops_per_sec']:.0f} ops/s, "
+            line += f"{r['ops_per_sec'] / base['ops_per_sec'] - 1:+.0%})"
+            if r["ops_per_sec"] < base["ops_per_sec"] / (1 + args.tolerance):
+                regressions.append(f"{name} got slower")
+            if r["peak_kib"] > base["peak_kib"] * (1 + args.tolerance):
+                regressions.append(f"{name} allocates more")
+        print(line)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if regressions:
+        sys.exit("Regressed: " + ", ".join(regressions))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""Replay recorded gateway traffic against the bot, without Discord or MongoDB.
+
+Feeds the events recorded with `RECORD_PATH` (see `utils/recorder.py`) to
+the bot, wired to the same local stand-ins as `benchmarks/handlers.py`.
+Events are fed at the pace they were recorded (`--speed 1`), N times
+faster (`--speed N`) or as fast as the bot takes them (`--speed max`),
+and without waiting for the previous ones to be handled, like the
+gateway does. Guilds that the recording uses before their GUILD_CREATE
+(e.g. it started mid-session) are created by the fake Discord on connect.
+
+It reports how far the bot fell behind the recorded pace (a bot that
+keeps up stays within a few milliseconds, a latency spike shows up as
+the seconds of the recording it fell behind in), the time every command
+took, and the database queries and errors.
+
+Recorded URLs are anonymized to placeholders that the local stand-in
+serves, and the paginators in the recording don't exist in the replay's
+database, so clicking their buttons only removes them, as if they expired.
+
+Usage (from the project root):
+    python -m benchmarks.replay FILE... [--speed 1|N|max] [--limit N]
+"""
+
+import sys
+import time
+import json
+import asyncio
+import argparse
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from loguru import logger
+
+import utils
+from benchmarks.fake_discord import FakeDiscord
+from benchmarks.handlers import (
+    BenchBot,
+    Harness,
+    Upstream,
+    dispatch,
+    local_bot,
+    percentile,
+    settle,
+)
+
+# Events that refer to their guild by `id` rather than `guild_id`
+GUILD_EVENTS = ("GUILD_CREATE", "GUILD_UPDATE", "GUILD_DELETE")
+
+
+def load(
+    paths: List[str], limit: Optional[int] = None
+) -> Tuple[List[Tuple[float, str, str]], Set[int]]:
+    """Read a recording into gateway messages, ready to feed.
+
+    Parameters
+    ----------
+    paths: List[:class:`str`]
+        The recording files.
+    limit: Optional[:class:`int`]
+        The maximum number of events to read.
+
+    Returns
+    -------
+    Tuple[List[Tuple[:class:`float`, :class:`str`, :class:`str`]], Set[:class:`int`]]
+        The seconds since the first event, name and gateway message of
+        every event, and the IDs of the guilds used before their
+        GUILD_CREATE.
+    """
+    records = []
+    created: Set[str] = set()
+    missing: Set[int] = set()
+    start = None
+    for timestamp, event, data in utils.read_recording(paths):
+        if limit is not None and len(records) >= limit:
+            break
+        start = timestamp if start is None else start
+        if isinstance(data, dict):
+            guild_id = data.get("id") if event in GUILD_EVENTS else data.get("guild_id")
+            if event == "GUILD_CREATE":
+                created.add(guild_id)
+            elif guild_id is not None and guild_id not in created:
+                missing.add(int(guild_id))
+        records.append(
+            ((timestamp - start) / 1000, event, json.dumps(dispatch(event, data)))
+        )
+    return records, missing
+
+
+async def replay(
+    harness: Harness, records: List[Tuple[float, str, str]], speed: Optional[float]
+) -> Dict[str, Any]:
+    """Feed the events to the bot on their schedule and wait until they're handled.
+
+    Parameters
+    ----------
+    harness: :class:`Harness`
+        The harness of the bot.
+    records: List[Tuple[:class:`float`, :class:`str`, :class:`str`]]
+        The events, from :func:`load`.
+    speed: Optional[:class:`float`]
+        How many times faster than recorded to feed the events, or `None`
+        to feed them as fast as possible.
+
+    Returns
+    -------
+    Dict[:class:`str`, Any]
+        The time it took to feed and to handle every event, how late each
+        event was fed, and the number of events fed in each second of the
+        recording.
+    """
+    lags: List[float] = []
+    seconds: Dict[int, List[float]] = defaultdict(list)
+    known = asyncio.all_tasks()
+    start = time.perf_counter()
+    for offset, _, raw in records:
+        if speed is not None:
+            due = start + offset / speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            lag = time.perf_counter() - due
+            lags.append(lag)
+            seconds[int(offset)].append(lag)
+        await harness.ws.received_message(raw)
+        # Let the handlers run between events, like between gateway messages
+        await asyncio.sleep(0)
+    fed = time.perf_counter() - start
+
+    unfinished = False
+    try:
+        await settle(known, timeout=60.0)
+    except TimeoutError:
+        unfinished = True
+    return {
+        "fed": fed,
+        "handled": time.perf_counter() - start,
+        "unfinished": unfinished,
+        "lags": lags,
+        "seconds": seconds,
+    }
+
+
+async def run(args: argparse.Namespace) -> None:
+    records, missing = load(args.files, args.limit)
+    if not records:
+        sys.exit("The recording is empty")
+    speed = None if args.speed == "max" else float(args.speed)
+
+    fake = FakeDiscord(guilds=0, members=args.members, port=args.port)
+    fake.guild_ids = sorted(missing)
+    upstream = Upstream(port=args.port + 1)
+    # Recorded URLs point to a placeholder, serve them locally instead
+    records = [
+        (offset, event, raw.replace(utils.recorder.PLACEHOLDER_URL, upstream.url))
+        for offset, event, raw in records
+    ]
+
+    async with local_bot(fake, upstream, args.profile) as bot:
+        # Like the guilds that already had entries in production
+        await bot.reconcile_guilds()
+        async with bot._reconcile_lock:
+            pass
+
+        errors = bot.errors
+        queries = sum(bot.database.operations.values())
+        result = await replay(Harness(bot, fake, upstream), records, speed)
+        report(args, bot, records, result)
+        print(
+            f"{'database queries':<24} {sum(bot.database.operations.values()) - queries}"
+        )
+        print(f"{'errors':<24} {bot.errors - errors}")
+
+
+def report(
+    args: argparse.Namespace,
+    bot: BenchBot,
+    records: List[Tuple[float, str, str]],
+    result: Dict[str, Any],
+) -> None:
+    duration = records[-1][0]
+    print(
+        f"Replayed {len(records)} events ({duration:.1f}s recorded) "
+        f"at {args.speed}{'x' if args.speed != 'max' else ''}"
+    )
+    print(f"{'fed in':<24} {result['fed']:.2f}s")
+    print(
+        f"{'handled in':<24} {result['handled']:.2f}s "
+        f"({len(records) / result['handled']:.0f} events/s)"
+        + (" (some still running after 60s)" if result["unfinished"] else "")
+    )
+
+    lags = result["lags"]
+    if lags:
+        print(
+            f"{'behind schedule':<24} p50 {percentile(lags, 0.5) * 1000:.1f}ms, "
+            f"p99 {percentile(lags, 0.99) * 1000:.1f}ms, max {max(lags) * 1000:.1f}ms"
+        )
+        worst = sorted(
+            result["seconds"].items(), key=lambda item: max(item[1]), reverse=True
+        )[:5]
+        print("Seconds of the recording the bot fell furthest behind in:")
+        for second, second_lags in sorted(worst):
+            print(
+                f"  {second:>6}s {len(second_lags):6d} events, "
+                f"up to {max(second_lags) * 1000:.1f}ms late"
+            )
+
+    print("Events:")
+    for event, count in Counter(event for _, event, _ in records).most_common():
+        print(f"  {event:<30} {count:8d}")
+
+    commands = bot.command_metrics.summary()
+    if commands:
+        print(f"{'command':<24} {'calls':>6} {'errors':>6} {'p50 ms':>8} {'p99 ms':>8}")
+        for entry in commands:
+            p50, p99 = entry["p50"], entry["p99"]
+            print(
+                f"{entry['command']:<24} {entry['calls']:6d} {entry['errors']:6d} "
+                f"{p50 * 1000 if p50 is not None else float('nan'):8.1f} "
+                f"{p99 * 1000 if p99 is not None else float('nan'):8.1f}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("files", nargs="+", help="the recording files")
+    parser.add_argument(
+        "--speed", default="1", help="how many times faster, or max (Default: 1)"
+    )
+    parser.add_argument("--limit", type=int, help="replay only the first N events")
+    parser.add_argument(
+        "--members", type=int, default=10, help="members of the created guilds"
+    )
+    parser.add_argument("--profile", default="full", help="the CACHE_PROFILE")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    if args.speed != "max" and float(args.speed) <= 0:
+        parser.error("--speed must be positive or max")
+
+    # Every handler logs, which would drown out the report
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
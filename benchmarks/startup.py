@@ -0,0 +1,125 @@
+"""Benchmark the bot's cold start.
+
+Starts a fresh Python process for every run, which imports the bot and
+runs `MyBot.setup_hook` (without logging in to Discord) in test mode, then
+reports the p50 of the import time, every startup phase and the total.
+Save a run with `--save` and compare later runs against it with
+`--baseline`; the benchmark fails if the total got slower than the
+tolerance allows.
+
+Pass `--in-memory` to start the bot with :class:`FakeMongoClient` instead
+of a MongoDB server. The database phase is then nearly free, so compare
+such runs only with baselines saved the same way.
+
+Usage (from the project root, with `DATABASE_URI` set or in `.env`):
+    python -m benchmarks.startup [--runs 10] [--save FILE | --baseline FILE]
+    python -m benchmarks.startup --in-memory [--runs 10]
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+import subprocess
+from collections import defaultdict
+from typing import Dict, List
+
+
+async def child(in_memory: bool) -> None:
+    start = time.perf_counter()
+    from dotenv import load_dotenv
+
+    from bot import MyBot, Config
+
+    imported = time.perf_counter() - start
+
+    bot_class = MyBot
+    if in_memory:
+        from benchmarks.fake_mongo import FakeMongoClient
+
+        class InMemoryBot(MyBot):
+            def create_database_client(self) -> FakeMongoClient:
+                return FakeMongoClient()
+
+        bot_class = InMemoryBot
+
+    load_dotenv()
+    config = Config(
+        DEBUG=False,
+        DISNAKE_LOGGING=False,
+        TEST_MODE=True,
+        DISCORD_BOT_TOKEN="",
+        TEST_GUILDS=[],
+        DATABASE_URI="" if in_memory else os.environ["DATABASE_URI"],
+        NASA_KEY="",
+        METRICS_PORT=0,
+    )
+    bot = bot_class(config=config)
+    await bot.setup_hook()
+    timings = {"import": imported, "total": time.perf_counter() - start}
+    timings.update({name: duration for name, _, duration in bot.startup.phases})
+    await bot.close()
+    print(json.dumps(timings))
+
+
+def run(runs: int, in_memory: bool) -> Dict[str, List[float]]:
+    command = [sys.executable, "-m", "benchmarks.startup", "--child"]
+    if in_memory:
+        command.append("--in-memory")
+    samples = defaultdict(list)
+    for _ in range(runs):
+        output = subprocess.run(
+            command,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        for name, seconds in json.loads(output.splitlines()[-1]).items():
+            samples[name].append(seconds * 1000)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--save", help="save the p50s to this file")
+    parser.add_argument("--baseline", help="compare the p50s to this file")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.2, help="allowed slowdown (Default: 0.2)"
+    )
+    parser.add_argument(
+        "--in-memory", action="store_true", help="use the in-memory database"
+    )
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return asyncio.run(child(args.in_memory))
+
+    samples = run(args.runs, args.in_memory)
+    p50s = {name: statistics.median(ms) for name, ms in samples.items()}
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    for name, ms in sorted(p50s.items(), key=lambda item: item[0] != "total"):
+        line = f"{name:<20} p50 {ms:8.1f} ms"
+        if name in baseline:
+            line += (
+                f"  (baseline {baseline[name]:8.1f} ms, {ms / baseline[name] - 1:+.0%})"
+            )
+        print(line)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(p50s, f, indent=2)
+    if "total" in baseline and p50s["total"] > baseline["total"] * (1 + args.tolerance):
+        sys.exit(f"Startup regressed by more than {args.tolerance:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Benchmark matching a word list against messages.
+
+Compares checking every word with `utils.match_word` (which normalizes the
+message again for each word) against a single `utils.WordMatcher` pass,
+for word lists of increasing size. Both must find the same words.
+
+Usage (from the project root, no database needed):
+    python -m benchmarks.word_matching [--sizes 1000,10000] [--messages 500]
+"""
+
+import time
+import random
+import string
+import argparse
+import statistics
+from types import SimpleNamespace
+from typing import Callable, List, Set
+
+import utils
+
+
+def random_words(rng: random.Random, count: int) -> List[str]:
+    words = set()
+    while len(words) < count:
+        words.add("".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 10))))
+    return list(words)
+
+
+def random_message(rng: random.Random, words: List[str]) -> str:
+    parts = []
+    for _ in range(rng.randint(5, 40)):
+        if rng.random() < 0.05:
+            # Mangle some words the way people dodge filters
+            parts.append("-".join(rng.choice(words).upper()))
+        else:
+            parts.append(
+                "".join(rng.choices(string.ascii_letters, k=rng.randint(1, 8)))
+            )
+        parts.append(rng.choice(" ,.!? "))
+    return "".join(parts)
+
+
+def time_calls(func: Callable[[str], Set[str]], messages: List[str]) -> List[float]:
+    timings = []
+    for message in messages:
+        start = time.perf_counter()
+        func(message)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def report(label: str, size: int, timings: List[float]) -> None:
+    timings = sorted(timings)
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    print(
+        f"{label:<16} {size:>8} words  "
+        f"p50 {statistics.median(timings):8.3f} ms  p99 {p99:8.3f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000")
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    for size in map(int, args.sizes.split(",")):
+        words = random_words(rng, size)
+        messages = [random_message(rng, words) for _ in range(args.messages)]
+
+        def legacy(content: str) -> Set[str]:
+            message = SimpleNamespace(content=content)
+            return {word for word in words if utils.match_word(message, word)}
+
+        start = time.perf_counter()
+        matcher = utils.WordMatcher(words)
+        matcher.find("")
+        print(
+            f"{'build':<16} {size:>8} words  "
+            f"{(time.perf_counter() - start) * 1000:8.3f} ms"
+        )
+
+        for message in messages[:50]:
+            assert legacy(message) == matcher.find(message), message
+
+        report("match_word loop", size, time_calls(legacy, messages))
+        report("WordMatcher", size, time_calls(matcher.find, messages))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,13 @@
 import os
-import shutil
+import time
+import asyncio
 import tempfile
 import platform
 import tomllib
+import functools
 from collections import namedtuple
+from typing import Any, Awaitable, Callable, Optional, TypeVar
 
-import aiohttp
 import disnake
 from disnake.ext import commands
 from loguru import logger
@@ -14,7 +16,9 @@ from pymongo import AsyncMongoClient
 
 import models
 import utils
+import views
 
+T = TypeVar("T")
 
 Config = namedtuple(
     "Config",
@@ -26,22 +30,267 @@ Config = namedtuple(
         "TEST_GUILDS",
         "DATABASE_URI",
         "NASA_KEY",
+        "GUILD_CACHE_SIZE",
+        "GUILD_CACHE_TTL",
+        "RECONCILE_BATCH_SIZE",
+        "RECONCILE_CONCURRENCY",
+        "WRITE_BEHIND_INTERVAL",
+        "WRITE_BEHIND_MAX_PENDING",
+        "SETTINGS_POLL_INTERVAL",
+        "TEMP_DIR_MAX_BYTES",
+        "TEMP_DIR_MAX_AGE",
+        "PAGINATOR_MEMORY_BUDGET",
+        "LOG_SAMPLE_RATES",
+        "LOG_QUEUE_SIZE",
+        "METRICS_HOST",
+        "METRICS_PORT",
+        "COMMAND_SYNC",
+        "SHARD_COUNT",
+        "SHARD_IDS",
+        "CLUSTER_COUNT",
+        "CLUSTER_ID",
+        "RESUME_WINDOW",
+        "CACHE_PROFILE",
+        "HTTP_POOL_SIZE",
+        "HTTP_HOST_CONCURRENCY",
+        "HTTP_HOST_RATE",
+        "HTTP_TIMEOUT",
+        "HTTP_RETRIES",
+        "RECORD_PATH",
+        "RECORD_MAX_BYTES",
+        "RECORD_FILES",
+        "RECORD_EVENTS",
+        "THREAD_POOL_SIZE",
+        "PROCESS_POOL_SIZE",
+        "POOL_QUEUE_SIZE",
     ],
+    defaults=(
+        10000,
+        None,
+        1000,
+        4,
+        1.0,
+        500,
+        30.0,
+        1024**3,
+        3600.0,
+        16 * 1024**2,
+        None,
+        10000,
+        "127.0.0.1",
+        0,
+        "auto",
+        None,
+        None,
+        1,
+        None,
+        0.0,
+        "full",
+        100,
+        8,
+        None,
+        30.0,
+        3,
+        None,
+        64 * 1024**2,
+        10,
+        None,
+        8,
+        2,
+        256,
+    ),
 )
 
 
-class MyBot(commands.InteractionBot):
+@functools.cache
+def read_version(pyproject_path: str = "pyproject.toml") -> str:
+    """Read the project's version from `pyproject.toml`, only once."""
+    with open(pyproject_path, "rb") as f:
+        data = tomllib.load(f)
+        return data.get("project", {}).get("version")
+
+
+class MyBot(commands.AutoShardedInteractionBot):
     def __init__(self, *args, **kwargs):
         self.config: Config = kwargs.pop("config", None)
+        # The IPC channel to the cluster supervisor, if running in cluster mode
+        self.cluster: Optional[utils.ClusterLink] = kwargs.pop("cluster", None)
+        self.startup = utils.StartupTimer()
         self.version = self.get_version()
+        # Commands are synced by `self.command_syncer` instead, which skips
+        # the requests when nothing changed
+        kwargs.setdefault("command_sync_flags", commands.CommandSyncFlags.none())
         super().__init__(*args, **kwargs)
 
-    async def setup_hook(self):
-        # Initialize temporary directory
-        self.create_temp_dir()
-        logger.debug(f"Initialized temp directory {self.temp_dir}")
+        # Per-command timings and the counters of the bot's components,
+        # served in the Prometheus format
+        self.metrics = utils.MetricsRegistry()
+        self.command_metrics = utils.CommandMetrics(self.metrics)
+
+        # Workers for blocking and CPU-bound work, so it never delays the
+        # gateway heartbeats or interaction responses. See `run_blocking`.
+        # Neither pool starts its threads or processes until it's first used
+        self.thread_pool = utils.WorkerPool(
+            self.metrics,
+            "threads",
+            workers=self.config.THREAD_POOL_SIZE,
+            queue_size=self.config.POOL_QUEUE_SIZE,
+        )
+        self.process_pool = utils.WorkerPool(
+            self.metrics,
+            "processes",
+            workers=self.config.PROCESS_POOL_SIZE,
+            queue_size=self.config.POOL_QUEUE_SIZE,
+            processes=True,
+        )
+
+        # Buffer high-volume database updates (e.g. from gateway events)
+        self.write_behind = utils.WriteBehindQueue(
+            flush_interval=self.config.WRITE_BEHIND_INTERVAL,
+            max_pending=self.config.WRITE_BEHIND_MAX_PENDING,
+            batch_size=self.config.RECONCILE_BATCH_SIZE,
+        )
+
+        # Guild documents are read on most interactions, so keep them in memory
+        self.guild_cache = utils.GuildCache(
+            maxsize=self.config.GUILD_CACHE_SIZE,
+            ttl=self.config.GUILD_CACHE_TTL,
+            write_behind=self.write_behind,
+        )
+        self._reconcile_lock = asyncio.Lock()
+
+        # Compiled AutoMod keyword rules, so checks don't need a REST request.
+        # utils.check_automod_block uses them unless it's given another cache
+        self.automod = utils.AutoModCache(
+            maxsize=self.config.GUILD_CACHE_SIZE, pool=self.thread_pool
+        )
+        utils.set_default_automod_cache(self.automod)
+
+        # Compiled per-guild word lists, matched against messages in one pass
+        self.word_matchers = utils.WordMatcherCache()
+
+        # The global bot settings, loaded once and kept up to date in memory
+        self.settings = utils.SettingsStore(
+            poll_interval=self.config.SETTINGS_POLL_INTERVAL
+        )
+        self.command_syncer = utils.CommandSyncer(
+            self, self.settings, kwargs.get("test_guilds")
+        )
+
+        # Background jobs registered by the cogs, started once the bot is ready
+        self.scheduler = utils.Scheduler(
+            self.metrics,
+            instance=(
+                "main"
+                if self.config.CLUSTER_ID is None
+                else f"cluster-{self.config.CLUSTER_ID}"
+            ),
+            pool=self.thread_pool,
+        )
+
+        # Gateway sessions saved on shutdown, resumed on the next startup
+        self.resumer = utils.SessionResumer(
+            self, self.config.RESUME_WINDOW, self.metrics
+        )
+        self.metrics_server = None
+        self._deferred_setup = None
+        self._cluster_stats = None
+
+        # Every paginator's buttons are handled here, so they survive restarts
+        self.paginators = views.PaginatorStore(
+            memory_budget=self.config.PAGINATOR_MEMORY_BUDGET
+        )
+        self.add_listener(self.paginators.on_button_click, "on_button_click")
+
+        # Anonymized gateway traffic for `benchmarks/replay.py`, if enabled
+        self.recorder = None
+        if self.config.RECORD_PATH:
+            self.recorder = utils.TrafficRecorder(
+                self,
+                utils.recording_path(self.config.RECORD_PATH, self.config.CLUSTER_ID),
+                max_bytes=self.config.RECORD_MAX_BYTES,
+                max_files=self.config.RECORD_FILES,
+                events=self.config.RECORD_EVENTS,
+            )
+
+    async def start(
+        self,
+        token: str,
+        *,
+        reconnect: bool = True,
+        ignore_session_start_limit: bool = False,
+    ) -> None:
+        # Logging in happens during the setup, alongside the other phases
+        await self.setup_hook(token)
+        self.startup.mark("connecting")
+        await self.connect(
+            reconnect=reconnect, ignore_session_start_limit=ignore_session_start_limit
+        )
+
+    async def setup_hook(self, token: Optional[str] = None):
+        """Get everything the bot needs before it connects to the gateway.
+
+        Phases that don't depend on each other run concurrently, and phases
+        the gateway connection doesn't need run in the background once the
+        bot has connected. Every phase is timed for the startup report.
 
-        # Load cogs
+        Parameters
+        ----------
+        token: Optional[:class:`str`]
+            The bot token to log in with. Logging in is skipped if `None`.
+        """
+        async with self.startup.phase("setup"):
+            # Initialize temporary directory. The files already in it are
+            # indexed after connecting
+            async with self.startup.phase("temp_dir"):
+                self.create_temp_dir()
+                self.disk_cache = utils.DiskCache(
+                    self.temp_dir,
+                    max_bytes=self.config.TEMP_DIR_MAX_BYTES,
+                    max_age=self.config.TEMP_DIR_MAX_AGE,
+                    pool=self.thread_pool,
+                )
+                logger.debug(f"Initialized temp directory {self.temp_dir}")
+
+            # Cogs configure the HTTP client (e.g. limits of the hosts
+            # they use), so it comes before them
+            await self.setup_http()
+
+            # Load cogs. Logging in prepares their commands, so this goes first
+            async with self.startup.phase("cogs"):
+                self.load_cogs()
+
+            phases = [self.setup_database()]
+            if token is not None:
+                phases.append(self.timed_login(token))
+            await asyncio.gather(*phases)
+
+        # Expose the counters of the bot's components alongside its metrics
+        for name, component in (
+            ("startup", self.startup),
+            ("guild_cache", self.guild_cache),
+            ("write_behind", self.write_behind),
+            ("disk_cache", self.disk_cache),
+            ("http", self.http_client),
+            ("json_cache", self.json_cache),
+            ("downloads", self.downloads),
+            ("paginators", self.paginators),
+            ("automod", self.automod),
+            ("word_matchers", self.word_matchers),
+            ("sessions", self.resumer),
+            ("scheduler", self.scheduler),
+            ("thread_pool", self.thread_pool),
+            ("process_pool", self.process_pool),
+        ):
+            self.metrics.add_collector(name, component.stats)
+        if self.cluster is not None:
+            self.metrics.add_collector("cluster", self.cluster.stats)
+        if self.recorder is not None:
+            self.metrics.add_collector("recorder", self.recorder.stats)
+
+        self._deferred_setup = self.loop.create_task(self.deferred_setup())
+
+    def load_cogs(self):
         for extension in utils.get_cog_names():
             try:
                 self.load_extension(extension)
@@ -50,33 +299,155 @@ class MyBot(commands.InteractionBot):
                 exception = f"{type(e).__name__}: {e}"
                 logger.exception(f"Failed to load extension {extension}!\t{exception}")
 
+    async def timed_login(self, token: str):
+        async with self.startup.phase("login"):
+            await self.login(token)
+
+    def create_database_client(self) -> AsyncMongoClient:
+        """Create the MongoDB client. Override to use another database, e.g.
+        the in-memory one of the benchmarks."""
+        return AsyncMongoClient(self.config.DATABASE_URI)
+
+    async def setup_database(self):
         # Initialize database connection
-        self.client = AsyncMongoClient(self.config.DATABASE_URI)
-        db_list = await self.client.list_database_names()
-        if "my-bot" not in db_list:
-            db = self.client["my-bot"]
-            await db.create_collection("settings")
-            await db.create_collection("guilds")
-        if self.config.TEST_MODE:
-            await init_beanie(
-                self.client["test-my-bot"],
-                document_models=[models.BotSettings, models.Guild],
+        async with self.startup.phase("database"):
+            self.client = self.create_database_client()
+            db_list = await self.client.list_database_names()
+            if "my-bot" not in db_list:
+                db = self.client["my-bot"]
+                await asyncio.gather(
+                    db.create_collection("settings"),
+                    db.create_collection("guilds"),
+                    db.create_collection("paginators"),
+                    db.create_collection("sessions"),
+                    db.create_collection("jobs"),
+                )
+            if self.config.TEST_MODE:
+                await init_beanie(
+                    self.client["test-my-bot"],
+                    document_models=[
+                        models.BotSettings,
+                        models.Guild,
+                        models.PaginatorPages,
+                        models.GatewaySession,
+                        models.JobState,
+                    ],
+                )
+                logger.warning("Running in test mode. Connected to test database.")
+            else:
+                await init_beanie(
+                    self.client["my-bot"],
+                    document_models=[
+                        models.BotSettings,
+                        models.Guild,
+                        models.PaginatorPages,
+                        models.GatewaySession,
+                        models.JobState,
+                    ],
+                )
+                logger.success("Connected to database.")
+
+        # Load the global bot settings entry, creating it if it doesn't exist
+        async with self.startup.phase("settings"):
+            await self.settings.load()
+            self.settings.start()
+
+        # Load the gateway sessions the last run saved on shutdown
+        if self.config.RESUME_WINDOW:
+            async with self.startup.phase("sessions"):
+                count = await self.resumer.load(self.shard_ids)
+                logger.info(f"Loaded {count} gateway sessions to resume")
+
+        # Start flushing buffered database writes
+        self.write_behind.start()
+
+    async def setup_http(self):
+        async with self.startup.phase("http"):
+            # Initialize the HTTP client for external APIs, with per-host
+            # limits so a slow host can't stall requests to the others
+            self.http_client = utils.HTTPClient(
+                self.metrics,
+                pool_size=self.config.HTTP_POOL_SIZE,
+                host_concurrency=self.config.HTTP_HOST_CONCURRENCY,
+                host_rate=self.config.HTTP_HOST_RATE,
+                timeout=self.config.HTTP_TIMEOUT,
+                retries=self.config.HTTP_RETRIES,
             )
-            logger.warning("Running in test mode. Connected to test database.")
-        else:
-            await init_beanie(
-                self.client["my-bot"],
-                document_models=[models.BotSettings, models.Guild],
+
+            # Initialize the cache for responses from external JSON APIs
+            self.json_cache = utils.JSONCache(self.http_client)
+
+            # Initialize the download manager, storing files in the temp directory
+            self.downloads = utils.DownloadManager(
+                self.http_client,
+                os.path.join(self.temp_dir, "downloads"),
+                self.disk_cache,
+                self.metrics,
             )
-            logger.success("Connected to database.")
 
-        # Create the global bot settings entry if it doesn't exist
-        await self.create_settings_entry()
+    async def deferred_setup(self):
+        """Run the startup phases the gateway connection doesn't need, once
+        the bot has connected, then log the startup report."""
+        await self.wait_until_first_connect()
+        self.startup.mark("connected")
 
-        # Initialize aiohttp session
-        self.session = aiohttp.ClientSession(loop=self.loop)
+        # Share this cluster's stats with the others through the supervisor
+        if self.cluster is not None:
+            self._cluster_stats = self.loop.create_task(
+                self.cluster.run(lambda: utils.bot_stats(self), interval=15.0)
+            )
+
+        # Register the commands of every scope whose definitions changed.
+        # Commands belong to the application, so only the first cluster does
+        if self.config.COMMAND_SYNC != "never" and not self.config.CLUSTER_ID:
+            await self.deferred_phase(
+                "command_sync",
+                self.command_syncer.sync(force=self.config.COMMAND_SYNC == "always"),
+            )
+
+        # Index the files left in the temp directory by a previous run
+        await self.deferred_phase("disk_cache_scan", self.disk_cache.scan())
+
+        if self.config.METRICS_PORT:
+            await self.deferred_phase("metrics_server", self.start_metrics_server())
+
+        await self.wait_until_ready()
+        # Every phase above handles its own errors, so the jobs always start
+        self.scheduler.start()
+        logger.info(f"Startup report:\n{self.startup.report()}")
+
+    async def deferred_phase(self, name: str, coro: Awaitable[Any]) -> None:
+        """Run a startup phase that the bot can work without, logging it
+        if it fails instead of skipping the phases after it."""
+        async with self.startup.phase(name):
+            try:
+                await coro
+            except Exception as e:
+                logger.exception(
+                    f"Startup phase {name} failed!\t{type(e).__name__}: {e}"
+                )
+
+    async def start_metrics_server(self):
+        # Every cluster serves its own metrics, on consecutive ports
+        server = utils.MetricsServer(
+            self.metrics,
+            self.config.METRICS_HOST,
+            self.config.METRICS_PORT + (self.config.CLUSTER_ID or 0),
+        )
+        # Raises if the port is taken, and the bot works fine without it
+        await server.start()
+        self.metrics_server = server
+
+    async def process_application_commands(
+        self, interaction: disnake.ApplicationCommandInteraction
+    ) -> None:
+        # Runs in the interaction's own task, so only its responses are timed
+        self.command_metrics.track_responses()
+        await super().process_application_commands(interaction)
 
     async def on_ready(self):
+        self.startup.mark("ready")
+
         # fmt: off
         logger.info("------")
         logger.info(f"{self.user.name} v{self.version}")
@@ -84,38 +455,143 @@ class MyBot(commands.InteractionBot):
         logger.info(f"Python version: {platform.python_version()}")
         logger.info(f"Disnake API version: {disnake.__version__}")
         logger.info(f"Running on: {platform.system()} {platform.release()} ({os.name})")
+        logger.info(f"Shards: {sorted(self.shards)} of {self.shard_count}")
         logger.info("------")
         # fmt: on
 
+        if self.cluster is not None:
+            self.cluster.send("ready")
+
+        # READY fires again after a reconnect that needed a new session, so
+        # this also catches up on anything that happened while disconnected
+        self.loop.create_task(self.reconcile_guilds())
+
+    async def launch_shard(
+        self, gateway: str, shard_id: int, *, initial: bool = False
+    ) -> None:
+        # Resume the shard's session from the last run, instead of identifying
+        if not await self.resumer.resume(shard_id, initial=initial):
+            await super().launch_shard(gateway, shard_id, initial=initial)
+
     async def close(self):
-        await self.session.close()
+        for task in (self._deferred_setup, self._cluster_stats):
+            if task is not None:
+                task.cancel()
+        await self.scheduler.close()
+
+        # Disconnect the shards without ending their sessions, so the next
+        # startup can resume them
+        if self.config.RESUME_WINDOW and not self.is_closed():
+            try:
+                await self.resumer.save()
+            except Exception as e:
+                logger.exception(
+                    f"Failed to save gateway sessions!\t{type(e).__name__}: {e}"
+                )
+
+        # Drain buffered database writes before anything shuts down
+        try:
+            await self.write_behind.close()
+        except Exception as e:
+            logger.exception(
+                f"Failed to flush buffered writes!\t{type(e).__name__}: {e}"
+            )
+        await self.settings.close()
+        if self.metrics_server is not None:
+            await self.metrics_server.close()
+        await self.http_client.close()
         await super().close()
+        if self.recorder is not None:
+            self.recorder.close()
+        # Last, everything above may still hand work to the pools
+        await asyncio.gather(self.thread_pool.close(), self.process_pool.close())
 
     def create_temp_dir(self):
-        self.temp_dir = os.path.join(tempfile.gettempdir(), "tmp-my-bot")
+        # Clusters on the same machine each get their own directory
+        name = "tmp-my-bot"
+        if self.config.CLUSTER_ID is not None:
+            name += f"-cluster-{self.config.CLUSTER_ID}"
+        self.temp_dir = os.path.join(tempfile.gettempdir(), name)
         if not os.path.exists(self.temp_dir):
             os.mkdir(self.temp_dir)
 
-    def clear_temp_dir(self):
-        for file in os.listdir(self.temp_dir):
-            file_path = os.path.join(self.temp_dir, file)
+    async def clear_temp_dir(self):
+        """Delete every file in the temp directory that isn't in use."""
+        await self.disk_cache.clear()
+
+    def get_version(self, pyproject_path: str = "pyproject.toml") -> str:
+        return read_version(pyproject_path)
+
+    async def run_blocking(self, func: Callable[..., T], *args, **kwargs) -> T:
+        """Run a blocking function (file system work, a library without
+        async support) in the bot's thread pool.
+
+        Parameters
+        ----------
+        func: Callable[..., T]
+            The function.
+        *args, **kwargs
+            The arguments to call it with.
+
+        Returns
+        -------
+        T
+            What the function returned.
+        """
+        return await self.thread_pool.run(func, *args, **kwargs)
+
+    async def run_cpu(self, func: Callable[..., T], *args, **kwargs) -> T:
+        """Run a CPU-bound function (e.g. image processing) in the bot's
+        process pool, so it doesn't hold the GIL the event loop needs.
+
+        The function and its arguments are sent to another process, so they
+        must be picklable: define the function at the top level of a module.
+
+        Parameters
+        ----------
+        func: Callable[..., T]
+            The function.
+        *args, **kwargs
+            The arguments to call it with.
+
+        Returns
+        -------
+        T
+            What the function returned.
+        """
+        return await self.process_pool.run(func, *args, **kwargs)
+
+    async def reconcile_guilds(self):
+        """Create and rename guild database entries to match the guilds the
+        bot is currently in."""
+        if self._reconcile_lock.locked():
+            return
+        async with self._reconcile_lock:
+            start = time.perf_counter()
+            guild_docs = [
+                models.Guild(
+                    guild_id=guild.id,
+                    name=guild.name,
+                    bot_log_channel_id=getattr(guild.system_channel, "id", None),
+                )
+                for guild in self.guilds
+            ]
             try:
-                if os.path.isfile(file_path) or os.path.islink(file_path):
-                    os.unlink(file_path)
-                elif os.path.isdir(file_path):
-                    shutil.rmtree(file_path)
+                created, renamed = await models.Guild.reconcile(
+                    guild_docs,
+                    batch_size=self.config.RECONCILE_BATCH_SIZE,
+                    concurrency=self.config.RECONCILE_CONCURRENCY,
+                )
             except Exception as e:
-                logger.error(f"Error deleting {file}: {e}")
+                logger.exception(
+                    f"Failed to reconcile guilds!\t{type(e).__name__}: {e}"
+                )
+                return
 
-    def get_version(self, pyproject_path: str = "pyproject.toml") -> str:
-        with open(pyproject_path, "rb") as f:
-            data = tomllib.load(f)
-            return data.get("project", {}).get("version")
-
-    async def create_settings_entry(self):
-        settings_doc = await models.BotSettings.find_all().to_list()
-        if len(settings_doc) == 0:
-            settings_doc = await models.BotSettings.insert_one(
-                models.BotSettings(toggle=False)
+            # Renamed entries in the cache are stale now
+            for guild_id in renamed:
+                self.guild_cache.invalidate(guild_id)
+            logger.info(
+                f"Reconciled {len(guild_docs)} guilds in {time.perf_counter() - start:.2f}s "
+                f"({len(created)} created, {len(renamed)} renamed)"
             )
-            logger.success(f"Created settings entry for my-bot [{settings_doc.id}]")
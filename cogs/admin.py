@@ -4,7 +4,7 @@ from loguru import logger
 
 import models
 from bot import MyBot
-from helpers import SuccessEmbed
+from helpers import SuccessEmbed, ErrorEmbed
 
 
 class Admin(commands.Cog):
@@ -32,16 +32,14 @@ class Admin(commands.Cog):
         """
         await inter.response.defer()
 
-        # Find the database entry for this guild
-        guild_doc = await models.Guild.find_one(
-            models.Guild.bot_log_channel_id == inter.guild.id
+        # Set the ID on the database entry for this guild
+        guild_doc = await self.bot.guild_cache.set(
+            inter.guild.id, {models.Guild.bot_log_channel_id: channel.id}
         )
-
-        # Set the ID
-        guild_doc.bot_log_channel_id = channel.id
-
-        # Commit changes to the database
-        await guild_doc.save()
+        if guild_doc is None:
+            return await inter.edit_original_response(
+                embed=ErrorEmbed("This server has no database entry yet!")
+            )
 
         # Log it and send a message in Discord as well
         logger.info(
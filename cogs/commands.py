@@ -1,14 +1,14 @@
 import os
-import json
 
-import aiofiles
 import disnake
 from disnake.ext import commands
-from loguru import logger
 
+import utils
 from bot import MyBot
 from helpers import ErrorEmbed
-from views import Paginator
+
+# NASA's EPIC API, for `/earth`
+EPIC_URL = "https://epic.gsfc.nasa.gov"
 
 
 class Commands(commands.Cog):
@@ -17,14 +17,19 @@ class Commands(commands.Cog):
     This class creates a basic slash command.
     https://docs.disnake.dev/en/latest/ext/commands/slash_commands.html#basic-slash-command
 
-    This class shows how to perform API requests with aiohttp (with error handling).
+    This class shows how to perform cached API requests through the bot's HTTP client (with error handling).
 
-    This class shows how to download files to the bot's temporary directory with aiofiles.
-    Refer to tasks.py to see how the temporary directory is periodically cleaned.
+    This class shows how to stream files to the bot's temporary directory with aiofiles.
+    Refer to tasks.py to see how old files are periodically evicted from the temporary directory.
     """
 
     def __init__(self, bot: MyBot):
         self.bot = bot
+        self.bot.paginators.register_renderer("earth", self.render_earth_image)
+        # Give NASA's API its own entry in the HTTP metrics, with the default
+        # limits. Other hosts (e.g. from /download_file) are counted as "other"
+        http = self.bot.http_client
+        http.limit_host("epic.gsfc.nasa.gov", *http.default_limit)
 
     @commands.slash_command()
     async def download_file(
@@ -42,59 +47,67 @@ class Commands(commands.Cog):
         # Extract the filename from the URL
         filename = os.path.basename(url).split("?")[0]
 
-        # Create the file system path to save the file at
-        # Note the use of self.bot.temp_dir to save the
-        # file in a temporary location.
-        filepath = os.path.join(self.bot.temp_dir, filename)
-
-        # Check if the file already exists; download it if not
-        if os.path.exists(filepath):
-            logger.info(f"File at {url} already exists at {filepath}")
-        else:
-            try:
-                # GET request using the aiohttp session
-                async with self.bot.session.get(url) as response:
-                    if response.status != 200:
-                        return await inter.edit_original_response(
-                            embed=ErrorEmbed(
-                                f"Downloading media {url} returned status code `{response.status}`"
-                            )
-                        )
-
-                    # Write the returned data to the file system
-                    async with aiofiles.open(filepath, mode="wb") as f:
-                        await f.write(await response.read())
-                    logger.info(f"Downloaded file at {url} to {filepath}")
-            except Exception as err:
-                return await inter.edit_original_response(
-                    embed=ErrorEmbed(f"Downloading media returned invalid data! {err}")
+        try:
+            # Get the file from the bot's download manager. It saves files in
+            # the bot's temporary directory under the hash of their contents,
+            # shares one download between concurrent requests for a URL and
+            # serves URLs that were downloaded before straight from disk.
+            # The download is abandoned as soon as the file can't fit
+            # Discord's upload limit for this interaction. The file comes
+            # back pinned, so it can't be cleaned up until it's released.
+            download = await self.bot.downloads.fetch(
+                url, max_bytes=inter.attachment_size_limit
+            )
+        except utils.DownloadTooLarge:
+            return await inter.edit_original_response(
+                embed=ErrorEmbed(
+                    f"That file is larger than the upload limit of "
+                    f"{utils.humanbytes(inter.attachment_size_limit)}!"
                 )
+            )
+        except utils.DownloadError as err:
+            return await inter.edit_original_response(embed=ErrorEmbed(str(err)))
+        except utils.HTTPUnavailable as err:
+            return await inter.edit_original_response(
+                embed=ErrorEmbed(f"`{err.host}` can't be reached, try again later!")
+            )
+        except Exception as err:
+            return await inter.edit_original_response(
+                embed=ErrorEmbed(f"Downloading media returned invalid data! {err}")
+            )
 
-        # Create a file object that can be uploaded to Discord
-        file = disnake.File(filepath)
-
-        # Finally, send the file to Discord
-        await inter.edit_original_response(file=file)
+        # Finally, send the file to Discord, releasing it once it's uploaded
+        with download:
+            # Create a file object that can be uploaded to Discord. Opening a
+            # file can block on a slow disk, so it's done in a worker thread
+            file = await self.bot.run_blocking(
+                disnake.File, download.path, filename=filename or None
+            )
+            await inter.edit_original_response(file=file)
 
     @commands.slash_command()
     async def earth(self, inter: disnake.ApplicationCommandInteraction):
         """Get images of earth via NASA's EPIC camera on the NOAA DSCOVR."""
         await inter.response.defer()
 
-        # GET request using the aiohttp session
+        # GET request through the bot's JSON cache. The EPIC API only updates
+        # a few times a day, so responses are reused for 10 minutes and then
+        # revalidated in the background while the cached copy keeps being served
         try:
-            async with self.bot.session.get(
-                url=f"https://epic.gsfc.nasa.gov/api/natural?api_key={self.nasa_key}"
-            ) as response:
-                if response.status != 200:
-                    return await inter.edit_original_response(
-                        embed=ErrorEmbed(
-                            f"NASA API returned status code `{response.status}`"
-                        )
-                    )
-                body = await response.json()
-                data = json.dumps(body)
-                output = json.loads(data)
+            output = await self.bot.json_cache.get(
+                f"{EPIC_URL}/api/natural?api_key={self.bot.config.NASA_KEY}",
+                ttl=600,
+            )
+        except utils.HTTPStatusError as err:
+            return await inter.edit_original_response(
+                embed=ErrorEmbed(f"NASA API returned status code `{err.status}`")
+            )
+        except utils.HTTPUnavailable:
+            return await inter.edit_original_response(
+                embed=ErrorEmbed(
+                    "NASA API can't be reached right now, try again later!"
+                )
+            )
         except Exception as err:
             return await inter.edit_original_response(
                 embed=ErrorEmbed(
@@ -102,28 +115,41 @@ class Commands(commands.Cog):
                 )
             )
 
-        # Create a list of embeds with the data returned
-        embeds = []
-        for img_info in output[::2]:
-            img_lbl = img_info["image"]
-            img_date = img_info["date"]
-            img_id = img_info["identifier"]
-            img_cap = img_info["caption"]
-            img_lat = img_info["coords"]["centroid_coordinates"]["lat"]
-            img_lon = img_info["coords"]["centroid_coordinates"]["lon"]
-            img_url = f"https://epic.gsfc.nasa.gov/archive/natural/{img_id[:4]}/{img_id[4:6]}/{img_id[6:8]}/png/{img_lbl}.png"
-            embed = disnake.Embed(
-                color=disnake.Color.dark_purple(),
-                title=img_cap,
-                description=f"Date: {img_date}\nLatitude: {img_lat}\nLongitude: {img_lon}",
+        # Only every other image is shown
+        images = output[::2]
+        if not images:
+            return await inter.edit_original_response(
+                embed=ErrorEmbed("NASA API didn't return any images!")
             )
-            embed.set_image(url=img_url)
-            embeds.append(embed)
 
-        # Create a paginator and add the view to the message
-        page_view = Paginator(embeds, inter.author)
-        message = await inter.edit_original_response(embed=embeds[0], view=page_view)
-        page_view.message = message
+        # Only the fields shown on a page are stored, and each page's embed
+        # is created when it is opened
+        items = [
+            {
+                "image": img_info["image"],
+                "date": img_info["date"],
+                "identifier": img_info["identifier"],
+                "caption": img_info["caption"],
+                "lat": img_info["coords"]["centroid_coordinates"]["lat"],
+                "lon": img_info["coords"]["centroid_coordinates"]["lon"],
+            }
+            for img_info in images
+        ]
+        await self.bot.paginators.send(inter, items, renderer="earth")
+
+    @staticmethod
+    def render_earth_image(img_info: dict) -> disnake.Embed:
+        """Create the embed for a page of the `/earth` paginator."""
+        img_lbl = img_info["image"]
+        img_id = img_info["identifier"]
+        img_url = f"{EPIC_URL}/archive/natural/{img_id[:4]}/{img_id[4:6]}/{img_id[6:8]}/png/{img_lbl}.png"
+        embed = disnake.Embed(
+            color=disnake.Color.dark_purple(),
+            title=img_info["caption"],
+            description=f"Date: {img_info['date']}\nLatitude: {img_info['lat']}\nLongitude: {img_info['lon']}",
+        )
+        embed.set_image(url=img_url)
+        return embed
 
 
 def setup(bot: commands.Bot):
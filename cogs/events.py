@@ -1,5 +1,5 @@
 import disnake
-from disnake import commands
+from disnake.ext import commands
 from loguru import logger
 
 import models
@@ -24,11 +24,44 @@ class Events(commands.Cog):
     @commands.Cog.listener()
     async def on_slash_command(self, inter: disnake.ApplicationCommandInteraction):
         """Client event when a command is used."""
-        logger.info(
-            f"{inter.guild.name}[{inter.guild.id}] | "
-            f"{inter.channel.name}[{inter.channel.id}] | "
-            f"{inter.author}[{inter.author.id}] | "
-            f"Invoked {inter.application_command.cog_name}::{inter.application_command.name}"
+        self.bot.command_metrics.start(inter)
+        # Logged with fields, so the JSON log can be filtered and aggregated
+        logger.bind(
+            event="slash_command",
+            guild_id=inter.guild_id,
+            channel_id=inter.channel_id,
+            user_id=inter.author.id,
+        ).info(
+            "Invoked {cog}::{command}",
+            cog=inter.application_command.cog_name,
+            command=inter.application_command.qualified_name,
+        )
+
+    @commands.Cog.listener()
+    async def on_slash_command_completion(
+        self, inter: disnake.ApplicationCommandInteraction
+    ):
+        """Client event when a command finishes without an error."""
+        self.bot.command_metrics.finish(inter)
+
+    @commands.Cog.listener()
+    async def on_slash_command_error(
+        self, inter: disnake.ApplicationCommandInteraction, error: commands.CommandError
+    ):
+        """Client event when a command raises an error."""
+        self.bot.command_metrics.finish(inter, error=True)
+
+        # Listening to this event replaces disnake's default handler, which
+        # printed the traceback
+        logger.opt(exception=error).bind(
+            event="slash_command_error",
+            guild_id=inter.guild_id,
+            channel_id=inter.channel_id,
+            user_id=inter.author.id,
+        ).error(
+            "Error in {command}: {error}",
+            command=inter.application_command.qualified_name,
+            error=f"{type(error).__name__}: {error}",
         )
 
     @commands.Cog.listener()
@@ -36,21 +69,18 @@ class Events(commands.Cog):
         """Client event when it creates or joins a guild."""
         logger.info(f"Joined {guild.name}[{guild.id}]")
 
-        # Check if this guild already has a database entry
-        guild_docs = await models.Guild.find_all().to_list()
-        existing_guild_ids = [guild_doc.guild_id for guild_doc in guild_docs]
-        if guild.id in existing_guild_ids:
-            return
-
-        # If the guild doesn't have a database entry, create one
-        await models.Guild.insert_one(
-            models.Guild(
-                guild_id=guild.id,
-                name=guild.name,
-                bot_log_channel_id=guild.system_channel.id,
-            )
+        # Create a database entry for this guild if it doesn't already have one
+        guild_doc, created = await models.Guild.register(
+            guild_id=guild.id,
+            name=guild.name,
+            bot_log_channel_id=getattr(guild.system_channel, "id", None),
         )
+        self.bot.guild_cache.put(guild_doc)
+        if not created:
+            return
         logger.info(f"Created database entries for guild {guild.name}[{guild.id}]")
+        if guild.system_channel is None:
+            return
 
         # Send a message to the guild to say hello!
         await guild.system_channel.send(
@@ -68,17 +98,48 @@ class Events(commands.Cog):
     async def on_guild_update(self, before: disnake.Guild, after: disnake.Guild):
         """Client event when a guild is updated."""
         if before.name != after.name:
-            await models.Guild.find_one(models.Guild.guild_id == after.id).set(
-                {models.Guild.name: after.name}
-            )
+            # Renames can arrive in bursts, so buffer the database write
+            self.bot.guild_cache.set_later(after.id, {models.Guild.name: after.name})
             logger.info(
                 f"{before.name}[{before.id}] | Changed guild name to {after.name}"
             )
 
     @commands.Cog.listener()
-    async def on_connect(self):
-        """Client event when it connects."""
-        logger.success("CONNECTED TO DISCORD")
+    async def on_guild_remove(self, guild: disnake.Guild):
+        """Client event when it leaves or is removed from a guild."""
+        self.bot.automod.invalidate(guild.id)
+        self.bot.word_matchers.invalidate(guild.id)
+
+    @commands.Cog.listener()
+    async def on_automod_rule_create(self, rule: disnake.AutoModRule):
+        """Client event when an AutoMod rule is created."""
+        self.bot.automod.invalidate(rule.guild.id)
+
+    @commands.Cog.listener()
+    async def on_automod_rule_update(self, rule: disnake.AutoModRule):
+        """Client event when an AutoMod rule is updated."""
+        self.bot.automod.invalidate(rule.guild.id)
+
+    @commands.Cog.listener()
+    async def on_automod_rule_delete(self, rule: disnake.AutoModRule):
+        """Client event when an AutoMod rule is deleted."""
+        self.bot.automod.invalidate(rule.guild.id)
+
+    @commands.Cog.listener()
+    async def on_shard_connect(self, shard_id: int):
+        """Client event when a shard connects."""
+        logger.success(f"SHARD {shard_id} CONNECTED TO DISCORD")
+
+    @commands.Cog.listener()
+    async def on_shard_ready(self, shard_id: int):
+        """Client event when a shard received all of its guilds."""
+        logger.info(f"SHARD {shard_id} READY")
+
+        # A new session (unlike a resumed one) doesn't replay the AutoMod rule
+        # events missed while disconnected, so the shard's rules may be stale
+        for guild in self.bot.guilds:
+            if guild.shard_id == shard_id:
+                self.bot.automod.invalidate(guild.id)
 
     @commands.Cog.listener()
     async def on_reconnect(self):
@@ -86,9 +147,9 @@ class Events(commands.Cog):
         logger.info("RECONNECTING TO DISCORD")
 
     @commands.Cog.listener()
-    async def on_disconnect(self):
-        """Client event when it disconnects."""
-        logger.warning("DISCONNECTED FROM DISCORD")
+    async def on_shard_disconnect(self, shard_id: int):
+        """Client event when a shard disconnects."""
+        logger.warning(f"SHARD {shard_id} DISCONNECTED FROM DISCORD")
 
 
 def setup(bot: commands.Bot):
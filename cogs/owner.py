@@ -1,8 +1,11 @@
+from typing import Optional
+
 import disnake
 from disnake.ext import commands
 from loguru import logger
 
 import models
+import utils
 from bot import MyBot
 from helpers import SuccessEmbed
 
@@ -73,26 +76,105 @@ class Owner(commands.Cog):
         bot is a member in (global settings).
         """
         # There is only one entry in the settings collection, since
-        # these settings are global and not per-guild
-        settings_doc = await models.BotSettings.find_all().to_list()
-        settings_doc = settings_doc[0]
-
-        # Simply toggle the boolean
-        settings_doc.toggle = not settings_doc.toggle
-
-        # Save the settings to the database
-        settings_doc.save()
+        # these settings are global and not per-guild. The bot keeps it
+        # in memory, so simply toggle the boolean and save it to the database
+        settings_doc = await self.bot.settings.modify(
+            lambda settings_doc: {models.BotSettings.toggle: not settings_doc.toggle}
+        )
 
         # Send a message with the new settings
         await inter.response.send_message(
             content=f"Toggled settings.toggle to `{settings_doc.toggle}`!"
         )
 
+    @owner.sub_command()
+    async def stats(self, inter: disnake.ApplicationCommandInteraction):
+        """Show how often the bot's commands are used and how long they take."""
+
+        def ms(seconds: Optional[float]) -> str:
+            return "-" if seconds is None else f"{seconds * 1000:.0f}ms"
+
+        embed = disnake.Embed(title="Command stats", color=disnake.Color.blurple())
+        # Embeds can have at most 25 fields
+        for entry in self.bot.command_metrics.summary()[:25]:
+            embed.add_field(
+                name=f"/{entry['command']}",
+                value=(
+                    f"Uses: `{entry['calls']}` (errors: `{entry['errors']}`, "
+                    f"running: `{entry['in_flight']:.0f}`)\n"
+                    f"p50: `{ms(entry['p50'])}` p99: `{ms(entry['p99'])}`\n"
+                    f"First response p50: `{ms(entry['first_response_p50'])}`"
+                ),
+                inline=False,
+            )
+        if not embed.fields:
+            embed.description = "No commands have been used yet."
+        if self.bot.cluster is not None:
+            # Usage is per cluster, but the totals cover every cluster
+            totals = self.bot.cluster.stats()
+            embed.set_footer(
+                text=(
+                    f"Cluster {self.bot.cluster.cluster_id} of {totals['clusters']}, "
+                    f"{totals['guilds']} guilds on {totals['shards']} shards, "
+                    f"latency {ms(totals['latency'])}"
+                )
+            )
+        await inter.response.send_message(embed=embed, ephemeral=True)
+
+    @owner.sub_command()
+    async def memory(self, inter: disnake.ApplicationCommandInteraction):
+        """Show roughly how much memory each of the bot's caches uses."""
+        embed = disnake.Embed(
+            title="Cache memory",
+            description=f"Cache profile: `{self.bot.config.CACHE_PROFILE}`",
+            color=disnake.Color.blurple(),
+        )
+        caches = utils.cache_memory(self.bot)
+        paginators = self.bot.paginators.stats()
+        caches["paginators"] = (paginators["entries"], paginators["memory_used"])
+        for name, (count, size) in caches.items():
+            embed.add_field(
+                name=name.capitalize(),
+                value=(
+                    f"`{count}` cached, ~`{utils.humanbytes(size)}`\n"
+                    f"~`{utils.humanbytes(size // count if count else 0)}` each"
+                ),
+            )
+
+        rss = utils.rss_bytes()
+        if rss is not None:
+            embed.set_footer(text=f"Process memory: {utils.humanbytes(rss)}")
+        await inter.response.send_message(embed=embed, ephemeral=True)
+
+    @owner.sub_command()
+    async def jobs(self, inter: disnake.ApplicationCommandInteraction):
+        """Show the background jobs, when they run next and how their runs went."""
+        embed = disnake.Embed(title="Background jobs", color=disnake.Color.blurple())
+        for entry in self.bot.scheduler.summary()[:25]:
+            next_run = entry["next_run"]
+            value = (
+                f"Schedule: `{entry['schedule']}`\n"
+                f"Next run: {disnake.utils.format_dt(next_run, 'R') if next_run else '-'}\n"
+                f"Runs: `{entry['runs']}` (failed: `{entry['failures']}`, "
+                f"skipped: `{entry['skipped']}`, running: `{entry['running']}`)"
+            )
+            if entry["stuck"]:
+                value += f"\nStuck after timing out: `{entry['stuck']}`"
+            if entry["last_duration"] is not None:
+                value += f"\nLast run took `{entry['last_duration']:.2f}s`"
+            if entry["last_error"] is not None:
+                value += f"\nLast error: `{entry['last_error'][:200]}`"
+            embed.add_field(name=entry["job"], value=value, inline=False)
+        if not embed.fields:
+            embed.description = "No jobs are registered."
+        await inter.response.send_message(embed=embed, ephemeral=True)
+
     @owner.sub_command()
     async def download_log(self, inter: disnake.ApplicationCommandInteraction):
-        """Download the current log file."""
+        """Download the current log file (of this cluster, in cluster mode)."""
         return await inter.response.send_message(
-            file=disnake.File("logs/my-bot.log"), ephemeral=True
+            file=disnake.File(utils.log_path(self.bot.config.CLUSTER_ID)),
+            ephemeral=True,
         )
 
 
@@ -1,44 +1,49 @@
-from disnake.ext import commands, tasks
+from disnake.ext import commands
 from loguru import logger
 
 from bot import MyBot
 
 
 class Tasks(commands.Cog):
-    """An example cog to create scheduled background tasks.
+    """An example cog to create scheduled background jobs.
 
-    This class uses disnake's tasks.
-    https://docs.disnake.dev/en/latest/ext/tasks/index.html
+    Jobs are registered with the bot's scheduler (see `utils/scheduler.py`)
+    and start running once the bot is ready. The scheduler remembers when
+    every job last ran across restarts, never runs a job twice at once and
+    records how long each run took.
+
+    A job can run on an interval (`every=` seconds) or a cron schedule
+    (`cron="0 4 * * *"`), in every process or, with `shared=True`, in
+    only one of the bot's processes. Functions that aren't coroutines are
+    run in a worker thread, so they can block.
     """
 
     def __init__(self, bot: MyBot):
         self.bot = bot
-        self.clean_temp_dir.start()
+        # Every process has its own temp directory, so this isn't shared
+        self.bot.scheduler.add(
+            "clean_temp_dir",
+            self.clean_temp_dir,
+            every=5 * 60.0,
+            jitter=30.0,
+            timeout=120.0,
+        )
+
+    def cog_unload(self):
+        self.bot.scheduler.remove("clean_temp_dir")
 
-    @tasks.loop(hours=1.0)
     async def clean_temp_dir(self):
-        """Clears all files from the bot's temporary directory."""
-        logger.debug(
-            f"Cleaning temp directory... [loop #{self.clean_temp_dir.current_loop}]"
+        """Evicts old and excess files from the bot's temporary directory."""
+        logger.debug("Cleaning temp directory...")
+
+        # Delete files that are too old or over the size budget.
+        # Files that are being uploaded are left alone.
+        evicted = await self.bot.disk_cache.evict()
+        logger.info(
+            f"Finished cleaning temp directory. [{evicted} files evicted, "
+            f"{self.bot.disk_cache.stats()['files']} remaining]"
         )
 
-        # The first iteration of this task is executed when
-        # the bot starts. This checks if we are in that
-        # initial loop
-        if self.clean_temp_dir.current_loop == 0:
-            # If there is anything that needs to
-            # happen on the first iteration of a
-            # task, then put it here.
-            pass
-
-        # Delete all files from the temporary directory
-        self.bot.clear_temp_dir()
-        logger.info("Finished clearing temp directory.")
-
-    @clean_temp_dir.before_loop
-    async def wait_before_tasks(self):
-        await self.bot.wait_until_ready()
-
 
 def setup(bot: commands.Bot):
     bot.add_cog(Tasks(bot))
@@ -1,19 +1,26 @@
 import os
+import signal
 import asyncio
+from typing import List, Optional
 
 import disnake
 from loguru import logger
 from dotenv import load_dotenv
 
+import utils
 from bot import MyBot, Config
 
 
-async def main():
+def load_config(cluster_id: Optional[int] = None) -> Config:
     # Load the environment variables
     load_dotenv()
 
+    # Talk to another API than Discord's, e.g. `benchmarks/fake_discord.py`
+    if os.environ.get("DISCORD_API_BASE"):
+        disnake.http.Route.BASE = os.environ["DISCORD_API_BASE"]
+
     # Create config
-    config = Config(
+    return Config(
         DEBUG=os.environ["DEBUG"] in ("1", "True", "true"),
         DISNAKE_LOGGING=os.environ["DISNAKE_LOGGING"] in ("1", "True", "true"),
         TEST_MODE=os.environ["TEST_MODE"] in ("1", "True", "true"),
@@ -21,29 +28,119 @@ async def main():
         TEST_GUILDS=list(map(int, os.environ["TEST_GUILDS"].split(","))),
         DATABASE_URI=os.environ["DATABASE_URI"],
         NASA_KEY=os.environ["NASA_KEY"],
+        GUILD_CACHE_SIZE=int(os.environ.get("GUILD_CACHE_SIZE") or 10000),
+        GUILD_CACHE_TTL=float(os.environ.get("GUILD_CACHE_TTL") or 0) or None,
+        RECONCILE_BATCH_SIZE=int(os.environ.get("RECONCILE_BATCH_SIZE") or 1000),
+        RECONCILE_CONCURRENCY=int(os.environ.get("RECONCILE_CONCURRENCY") or 4),
+        WRITE_BEHIND_INTERVAL=float(os.environ.get("WRITE_BEHIND_INTERVAL") or 1.0),
+        WRITE_BEHIND_MAX_PENDING=int(os.environ.get("WRITE_BEHIND_MAX_PENDING") or 500),
+        SETTINGS_POLL_INTERVAL=float(os.environ.get("SETTINGS_POLL_INTERVAL") or 30.0),
+        TEMP_DIR_MAX_BYTES=int(os.environ.get("TEMP_DIR_MAX_BYTES") or 1024**3),
+        TEMP_DIR_MAX_AGE=float(os.environ.get("TEMP_DIR_MAX_AGE") or 3600.0),
+        PAGINATOR_MEMORY_BUDGET=int(
+            os.environ.get("PAGINATOR_MEMORY_BUDGET") or 16 * 1024**2
+        ),
+        LOG_SAMPLE_RATES=utils.parse_sample_rates(os.environ.get("LOG_SAMPLE_RATES")),
+        LOG_QUEUE_SIZE=int(os.environ.get("LOG_QUEUE_SIZE") or 10000),
+        METRICS_HOST=os.environ.get("METRICS_HOST") or "127.0.0.1",
+        METRICS_PORT=int(os.environ.get("METRICS_PORT") or 0),
+        COMMAND_SYNC=os.environ.get("COMMAND_SYNC") or "auto",
+        SHARD_COUNT=int(os.environ.get("SHARD_COUNT") or 0) or None,
+        SHARD_IDS=(
+            list(map(int, os.environ["SHARD_IDS"].split(",")))
+            if os.environ.get("SHARD_IDS")
+            else None
+        ),
+        CLUSTER_COUNT=int(os.environ.get("CLUSTER_COUNT") or 1),
+        CLUSTER_ID=cluster_id,
+        RESUME_WINDOW=float(os.environ.get("RESUME_WINDOW") or 0.0),
+        CACHE_PROFILE=os.environ.get("CACHE_PROFILE") or "full",
+        HTTP_POOL_SIZE=int(os.environ.get("HTTP_POOL_SIZE") or 100),
+        HTTP_HOST_CONCURRENCY=int(os.environ.get("HTTP_HOST_CONCURRENCY") or 8),
+        HTTP_HOST_RATE=float(os.environ.get("HTTP_HOST_RATE") or 0) or None,
+        HTTP_TIMEOUT=float(os.environ.get("HTTP_TIMEOUT") or 30.0),
+        HTTP_RETRIES=int(os.environ.get("HTTP_RETRIES") or 3),
+        RECORD_PATH=os.environ.get("RECORD_PATH") or None,
+        RECORD_MAX_BYTES=int(os.environ.get("RECORD_MAX_BYTES") or 64 * 1024**2),
+        RECORD_FILES=int(os.environ.get("RECORD_FILES") or 10),
+        RECORD_EVENTS=(
+            os.environ["RECORD_EVENTS"].split(",")
+            if os.environ.get("RECORD_EVENTS")
+            else None
+        ),
+        THREAD_POOL_SIZE=int(os.environ.get("THREAD_POOL_SIZE") or 8),
+        PROCESS_POOL_SIZE=int(os.environ.get("PROCESS_POOL_SIZE") or 2),
+        POOL_QUEUE_SIZE=int(os.environ.get("POOL_QUEUE_SIZE") or 256),
     )
 
-    # Create logging file
-    logger.add(
-        "logs/my-bot.log", level="DEBUG" if config.DEBUG else "INFO", rotation="12:00"
+
+async def main(
+    cluster_id: Optional[int] = None,
+    shard_ids: Optional[List[int]] = None,
+    shard_count: Optional[int] = None,
+    cluster: Optional[utils.ClusterLink] = None,
+):
+    config = load_config(cluster_id)
+
+    # Log to the console and a JSON lines file from background threads
+    utils.setup_logging(
+        debug=config.DEBUG,
+        disnake_logging=config.DISNAKE_LOGGING,
+        path=utils.log_path(config.CLUSTER_ID),
+        sample_rates=config.LOG_SAMPLE_RATES,
+        queue_size=config.LOG_QUEUE_SIZE,
     )
-    if config.DISNAKE_LOGGING:
-        pass  # TODO
 
-    # Create intents
-    intents = disnake.Intents.default()
-    intents.members = True
-    intents.message_content = True
+    # Get the intents and what to cache
+    profile = utils.get_cache_profile(config.CACHE_PROFILE)
 
-    # Create bot
+    # Create bot. Without a shard count, the one Discord recommends is used
     bot = MyBot(
         config=config,
+        cluster=cluster,
+        shard_ids=shard_ids or config.SHARD_IDS,
+        shard_count=shard_count or config.SHARD_COUNT,
         test_guilds=config.TEST_GUILDS,
-        intents=intents,
         reload=config.DEBUG,
+        **profile.bot_kwargs(),
     )
-    await bot.setup_hook()
-    await bot.start(config.DISCORD_BOT_TOKEN)
+    if cluster is not None:
+        # The supervisor stops its clusters with SIGTERM
+        asyncio.get_running_loop().add_signal_handler(
+            signal.SIGTERM, lambda: asyncio.ensure_future(bot.close())
+        )
+    try:
+        # Runs the bot's setup hook before connecting
+        await bot.start(config.DISCORD_BOT_TOKEN)
+    finally:
+        # Write out everything still queued for the log sinks
+        logger.remove()
+
+
+def run_cluster(
+    cluster_id: int, shard_ids: List[int], shard_count: int, link: utils.ClusterLink
+):
+    """Run one cluster of shards. The entry point of the worker processes."""
+    # Ctrl+C reaches every process, but only the supervisor should handle it
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(main(cluster_id, shard_ids, shard_count, link))
+
+
+def supervise(config: Config):
+    """Run the bot in `CLUSTER_COUNT` worker processes and keep them running."""
+    utils.setup_logging(debug=config.DEBUG, queue_size=config.LOG_QUEUE_SIZE)
+    try:
+        shard_count = config.SHARD_COUNT or asyncio.run(
+            utils.fetch_shard_count(config.DISCORD_BOT_TOKEN, disnake.http.Route.BASE)
+        )
+        utils.ClusterSupervisor(run_cluster, shard_count, config.CLUSTER_COUNT).run()
+    finally:
+        logger.remove()
 
 
-asyncio.run(main())
+if __name__ == "__main__":
+    config = load_config()
+    if config.CLUSTER_COUNT > 1:
+        supervise(config)
+    else:
+        asyncio.run(main())
@@ -1,2 +1,5 @@
-from .guild import Guild
-from .settings import BotSettings
+from .guild import Guild, GuildSummary
+from .paginator import PaginatorPages
+from .session import GatewaySession
+from .settings import BotSettings, SettingsVersion
+from .job import JobState
@@ -1,7 +1,17 @@
+import asyncio
+from typing import Annotated, Iterable, List, Optional, Tuple
 from uuid import UUID, uuid4
 
-from pydantic import Field
-from beanie import Document
+from pydantic import BaseModel, Field
+from beanie import BulkWriter, Document, Indexed, UpdateResponse
+from beanie.operators import In, Set, SetOnInsert
+
+
+class GuildSummary(BaseModel):
+    """Projection of :class:`Guild` with only the fields needed to reconcile it."""
+
+    guild_id: int
+    name: str
 
 
 class Guild(Document):
@@ -9,6 +19,122 @@ class Guild(Document):
         name = "guilds"
 
     id: UUID = Field(default_factory=uuid4)
-    guild_id: int
+    guild_id: Annotated[int, Indexed(unique=True)]
     name: str
-    bot_log_channel_id: int
+    bot_log_channel_id: Optional[int] = None
+
+    def _set_on_insert(self) -> SetOnInsert:
+        return SetOnInsert(
+            {
+                "_id": self.id,
+                "name": self.name,
+                "bot_log_channel_id": self.bot_log_channel_id,
+            }
+        )
+
+    @classmethod
+    async def register(
+        cls, guild_id: int, name: str, bot_log_channel_id: Optional[int]
+    ) -> Tuple["Guild", bool]:
+        """Create the database entry for a guild if it doesn't have one.
+
+        This is a single atomic upsert on the unique `guild_id` index, so
+        concurrent joins can never create duplicate entries.
+
+        Parameters
+        ----------
+        guild_id: :class:`int`
+            The ID of the guild.
+        name: :class:`str`
+            The name of the guild.
+        bot_log_channel_id: Optional[:class:`int`]
+            The ID of the channel for bot logs.
+
+        Returns
+        -------
+        Tuple[:class:`Guild`, :class:`bool`]
+            The guild's database entry and whether it was just created.
+        """
+        guild_doc = cls(
+            guild_id=guild_id, name=name, bot_log_channel_id=bot_log_channel_id
+        )
+        existing_doc = await cls.find_one(cls.guild_id == guild_id).update(
+            guild_doc._set_on_insert(),
+            upsert=True,
+            response_type=UpdateResponse.OLD_DOCUMENT,
+        )
+        if existing_doc is not None:
+            return existing_doc, False
+        return guild_doc, True
+
+    @classmethod
+    async def reconcile(
+        cls,
+        guild_docs: Iterable["Guild"],
+        batch_size: int = 1000,
+        concurrency: int = 4,
+    ) -> Tuple[List[int], List[int]]:
+        """Bring the collection in line with the guilds the bot is actually in.
+
+        Guilds without a database entry are created and guilds whose name
+        changed are renamed. The current state is read with one projected
+        query and all changes are written with unordered bulk writes.
+
+        Parameters
+        ----------
+        guild_docs: Iterable[:class:`Guild`]
+            The expected state of every guild, built from the gateway.
+        batch_size: :class:`int`
+            The maximum number of operations per bulk write. (Default: 1000)
+        concurrency: :class:`int`
+            The maximum number of bulk writes in flight. (Default: 4)
+
+        Returns
+        -------
+        Tuple[List[:class:`int`], List[:class:`int`]]
+            The IDs of the guilds that were created and renamed.
+        """
+        expected = {guild_doc.guild_id: guild_doc for guild_doc in guild_docs}
+        if not expected:
+            return [], []
+
+        known = {}
+        async for summary in cls.find(In(cls.guild_id, list(expected))).project(
+            GuildSummary
+        ):
+            known[summary.guild_id] = summary.name
+
+        created = [guild_id for guild_id in expected if guild_id not in known]
+        renamed = [
+            guild_id
+            for guild_id, name in known.items()
+            if expected[guild_id].name != name
+        ]
+        changed = created + renamed
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def write_batch(guild_ids: List[int]) -> None:
+            async with semaphore:
+                async with BulkWriter(ordered=False, object_class=cls) as bulk_writer:
+                    for guild_id in guild_ids:
+                        guild_doc = expected[guild_id]
+                        query = cls.find_one(cls.guild_id == guild_id)
+                        if guild_id in known:
+                            await query.update(
+                                Set({cls.name: guild_doc.name}),
+                                bulk_writer=bulk_writer,
+                            )
+                        else:
+                            await query.update(
+                                guild_doc._set_on_insert(),
+                                upsert=True,
+                                bulk_writer=bulk_writer,
+                            )
+
+        await asyncio.gather(
+            *(
+                write_batch(changed[i : i + batch_size])
+                for i in range(0, len(changed), batch_size)
+            )
+        )
+        return created, renamed
@@ -0,0 +1,22 @@
+from datetime import datetime
+from typing import Annotated, Optional
+from uuid import UUID, uuid4
+
+from pydantic import Field
+from beanie import Document, Indexed
+
+
+class JobState(Document):
+    class Settings:
+        name = "jobs"
+
+    id: UUID = Field(default_factory=uuid4)
+    # the job's name, followed by the instance it runs on if not shared
+    key: Annotated[str, Indexed(unique=True)]
+    next_run: datetime
+    last_run: Optional[datetime] = None
+    last_duration: Optional[float] = None  # in seconds
+    last_error: Optional[str] = None  # of the last run, `None` if it succeeded
+    # the process running the job and until when, if it can't overlap
+    lease_owner: Optional[str] = None
+    lease_until: Optional[datetime] = None
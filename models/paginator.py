@@ -0,0 +1,27 @@
+from datetime import datetime, timezone
+from typing import Annotated, Optional
+from uuid import UUID, uuid4
+
+import pymongo
+from pydantic import Field
+from beanie import Document, Indexed
+
+
+class PaginatorPages(Document):
+    class Settings:
+        name = "paginators"
+        indexes = [
+            # Forget paginators a week after they were sent
+            pymongo.IndexModel(
+                [("created_at", pymongo.ASCENDING)],
+                expireAfterSeconds=7 * 24 * 60 * 60,
+            )
+        ]
+
+    id: UUID = Field(default_factory=uuid4)
+    key: Annotated[str, Indexed(unique=True)]
+    author_id: int
+    renderer: Optional[str] = None  # name of the renderer for `items`, if any
+    items: bytes  # zlib-compressed JSON list of embed dicts or renderer items
+    total: int
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
@@ -0,0 +1,20 @@
+from datetime import datetime, timezone
+from typing import Annotated, Optional
+from uuid import UUID, uuid4
+
+from pydantic import Field
+from beanie import Document, Indexed
+
+
+class GatewaySession(Document):
+    class Settings:
+        name = "sessions"
+
+    id: UUID = Field(default_factory=uuid4)
+    shard_id: Annotated[int, Indexed(unique=True)]
+    shard_count: int  # a session can only be resumed with the same shard count
+    application_id: Optional[int] = None  # only sent in READY, so kept for resumes
+    session_id: str
+    sequence: Optional[int] = None  # the last event received
+    resume_url: str
+    saved_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
@@ -1,12 +1,22 @@
+from typing import Dict
 from uuid import UUID, uuid4
 
-from pydantic import Field
+from pydantic import BaseModel, Field
 from beanie import Document
 
 
+class SettingsVersion(BaseModel):
+    """Projection of :class:`BotSettings` with only its version."""
+
+    version: int = 0
+
+
 class BotSettings(Document):
     class Settings:
         name = "settings"
 
     id: UUID = Field(default_factory=uuid4)
+    version: int = 0  # incremented on every update, used to detect changes
     toggle: bool  # example field for global settings, just a toggle
+    # hash of the registered commands in each scope (guild ID or "global")
+    command_hashes: Dict[str, str] = Field(default_factory=dict)
@@ -0,0 +1,75 @@
+import asyncio
+from types import SimpleNamespace
+
+import disnake
+
+import utils
+from utils import automod, cache
+
+
+class FakeGuild:
+    def __init__(self, *patterns: str) -> None:
+        self.id = 1
+        self.patterns = list(patterns)
+        self.fetches = 0
+
+    async def fetch_automod_rules(self):
+        self.fetches += 1
+        patterns = list(self.patterns)
+        await asyncio.sleep(0.01)
+        return [
+            SimpleNamespace(
+                trigger_type=disnake.AutoModTriggerType.keyword,
+                trigger_metadata=SimpleNamespace(regex_patterns=patterns),
+            )
+        ]
+
+
+def test_default_cache_fetches_once(monkeypatch):
+    monkeypatch.setattr(automod, "_default_cache", None)
+    guild = FakeGuild("bad")
+
+    async def main():
+        assert await utils.check_automod_block(guild, "bad word")
+        assert not await utils.check_automod_block(guild, "good word")
+
+    asyncio.run(main())
+    assert guild.fetches == 1
+
+
+def test_rules_expire(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(cache, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    guild = FakeGuild("bad")
+    rules = utils.AutoModCache(ttl=60)
+
+    async def main():
+        await rules.check(guild, "bad")
+        guild.patterns = ["worse"]
+        assert await rules.check(guild, "bad")
+        now[0] = 60.0
+        assert not await rules.check(guild, "bad")
+        assert await rules.check(guild, "worse")
+
+    asyncio.run(main())
+    assert guild.fetches == 2
+
+
+def test_invalidate_during_fetch_discards_old_rules():
+    guild = FakeGuild("bad")
+    rules = utils.AutoModCache()
+
+    async def main():
+        check = asyncio.create_task(rules.check(guild, "bad"))
+        await asyncio.sleep(0.001)
+        # The rules change while the first fetch is in flight
+        guild.patterns = ["worse"]
+        rules.invalidate(guild.id)
+        assert await check
+
+        assert not await rules.check(guild, "bad")
+        assert await rules.check(guild, "worse")
+
+    asyncio.run(main())
+    assert guild.fetches == 2
+    assert rules._generations == {}
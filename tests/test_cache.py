@@ -0,0 +1,87 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from loguru import logger
+
+import utils
+from utils import cache
+
+
+def test_lru_evicts_least_recently_used():
+    lru = utils.LRUCache(maxsize=2)
+    lru.put("a", 1)
+    lru.put("b", 2)
+    assert lru.get("a") == 1  # "b" is now the least recently used
+    lru.put("c", 3)
+
+    assert "b" not in lru
+    assert lru.get("a") == 1
+    assert lru.get("c") == 3
+    assert lru.stats()["evictions"] == 1
+
+
+def test_lru_replacing_does_not_evict():
+    lru = utils.LRUCache(maxsize=2)
+    lru.put("a", 1)
+    lru.put("b", 2)
+    lru.put("a", 3)
+
+    assert len(lru) == 2
+    assert lru.get("a") == 3
+    assert lru.get("b") == 2
+
+
+def test_lru_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(cache, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    lru = utils.LRUCache(maxsize=2, ttl=10)
+    lru.put("a", 1)
+
+    now[0] = 109.0
+    assert lru.get("a") == 1
+    now[0] = 110.0
+    assert "a" not in lru
+    assert lru.get("a", "missing") == "missing"
+    assert len(lru) == 0
+
+
+def test_lru_counts_hits_and_misses():
+    lru = utils.LRUCache(maxsize=2)
+    lru.put("a", 1)
+    lru.get("a")
+    lru.get("b")
+    lru.pop("a")
+
+    stats = lru.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 0.5)
+
+
+def test_lru_rejects_empty_size():
+    with pytest.raises(ValueError):
+        utils.LRUCache(maxsize=0)
+
+
+def test_guild_cache_set_later_logs_failed_writes(monkeypatch):
+    guilds = utils.GuildCache()
+    messages = []
+    sink = logger.add(messages.append, level="ERROR")
+
+    async def fail(guild_id, fields):
+        raise RuntimeError("database is down")
+
+    monkeypatch.setattr(guilds, "set", fail)
+
+    async def main():
+        guilds.set_later(1, {"name": "new"})
+        assert len(guilds._writes) == 1
+        await asyncio.gather(*guilds._writes, return_exceptions=True)
+        await asyncio.sleep(0)
+
+    try:
+        asyncio.run(main())
+    finally:
+        logger.remove(sink)
+    assert guilds._writes == set()
+    assert len(messages) == 1
+    assert "database is down" in messages[0]
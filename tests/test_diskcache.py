@@ -0,0 +1,25 @@
+import os
+import time
+import asyncio
+
+import utils
+
+
+def test_scan_deletes_abandoned_partial_files(tmp_path):
+    old = time.time() - utils.DiskCache.IN_PROGRESS_MAX_AGE - 60
+    (tmp_path / "kept").write_bytes(b"12345")
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "file").write_bytes(b"123")
+    (tmp_path / "writing.part").write_bytes(b"1")
+    (tmp_path / "abandoned.part").write_bytes(b"1")
+    (tmp_path / "abandoned.download").write_bytes(b"1")
+    for name in ("abandoned.part", "abandoned.download"):
+        os.utime(tmp_path / name, (old, old))
+
+    cache = utils.DiskCache(str(tmp_path))
+    asyncio.run(cache.scan())
+
+    assert sorted(os.listdir(tmp_path)) == ["kept", "sub", "writing.part"]
+    assert len(cache) == 2
+    assert cache.total_bytes == 8
+    assert str(tmp_path / "writing.part") not in cache
@@ -0,0 +1,95 @@
+import asyncio
+import contextlib
+import hashlib
+from types import SimpleNamespace
+
+import utils
+
+
+def test_normalize_url():
+    assert (
+        utils.normalize_url(" HTTPS://Example.COM:443/a?b=2&a=1#frag ")
+        == "https://example.com/a?a=1&b=2"
+    )
+    assert utils.normalize_url("http://example.com") == "http://example.com/"
+    assert utils.normalize_url("http://example.com:8080/") == "http://example.com:8080/"
+
+
+def test_normalize_url_keeps_blank_values():
+    assert utils.normalize_url("https://example.com/?b&a=") == (
+        "https://example.com/?a=&b="
+    )
+
+
+class FakeContent:
+    """A response body the network delivers in bursts of `ahead` chunks."""
+
+    def __init__(self, chunks, ahead):
+        self.chunks = chunks
+        self.ahead = ahead
+        self.total_bytes = 0
+
+    async def iter_chunked(self, size):
+        for i, chunk in enumerate(self.chunks):
+            if i % self.ahead == 0:
+                self.total_bytes += sum(map(len, self.chunks[i : i + self.ahead]))
+            yield chunk
+
+
+def fake_http(chunks, ahead=1):
+    requested = []
+
+    @contextlib.asynccontextmanager
+    async def get(url):
+        requested.append(url)
+        body = [chunk + url.encode() for chunk in chunks]
+        yield SimpleNamespace(
+            status=200, content_length=None, content=FakeContent(body, ahead)
+        )
+
+    return SimpleNamespace(get=get, requested=requested)
+
+
+def test_stream_download_tracks_peak_buffered(tmp_path):
+    chunks = [b"a" * 9, b"b" * 19, b"c" * 4, b"d" * 4]
+    filepath = tmp_path / "file"
+
+    stats = asyncio.run(
+        utils.stream_download(fake_http(chunks, ahead=2), "u", str(filepath), 100)
+    )
+
+    body = b"".join(chunk + b"u" for chunk in chunks)
+    assert stats.size == 40
+    assert filepath.read_bytes() == body
+    assert stats.sha256 == hashlib.sha256(body).hexdigest()
+    # The first burst held both of its chunks while the first was written
+    assert stats.peak_buffered == 30
+    assert not (tmp_path / "file.part").exists()
+
+
+def test_fetch_returns_pinned_files_and_bounds_urls(tmp_path):
+    http = fake_http([b"data"])
+    cache = utils.DiskCache(str(tmp_path))
+    downloads = utils.DownloadManager(
+        http, str(tmp_path), cache, utils.MetricsRegistry(), max_urls=1
+    )
+
+    async def main():
+        with await downloads.fetch("https://a/", 100) as download:
+            assert download.path in cache
+            assert cache.stats()["pinned"] == 1
+            # Pinned files survive even an eviction of everything
+            assert await cache.evict(everything=True) == 0
+        assert cache.stats()["pinned"] == 0
+
+        with await downloads.fetch("https://a/", 100):
+            pass
+        with await downloads.fetch("https://b/", 100):
+            pass
+        # Only the most recent URL is remembered
+        with await downloads.fetch("https://a/", 100):
+            pass
+
+    asyncio.run(main())
+    assert http.requested == ["https://a/", "https://b/", "https://a/"]
+    assert downloads.stats()["indexed"] == 1
@@ -0,0 +1,23 @@
+import utils
+
+
+def test_strip_secrets_hashes_credentials():
+    url = "https://api.nasa.gov/planetary/apod?api_key=hunter2&date=2024-01-01"
+    stripped = utils.strip_secrets(url)
+
+    assert "hunter2" not in stripped
+    assert "date=2024-01-01" in stripped
+    assert stripped == utils.strip_secrets(
+        "https://API.nasa.gov/planetary/apod?date=2024-01-01&api_key=hunter2"
+    )
+
+
+def test_strip_secrets_tells_credentials_apart():
+    first = utils.strip_secrets("https://example.com/?token=a")
+    second = utils.strip_secrets("https://example.com/?token=b")
+    assert first != second
+
+
+def test_strip_secrets_keeps_other_parameters():
+    url = "https://example.com/search?q=cats&page=2"
+    assert utils.strip_secrets(url) == utils.normalize_url(url)
@@ -0,0 +1,46 @@
+import asyncio
+from types import SimpleNamespace
+
+from utils import httpclient
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+        self.slept = 0.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float) -> None:
+        self.now += seconds
+        self.slept += seconds
+
+
+def test_token_bucket(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(httpclient, "time", clock)
+    monkeypatch.setattr(httpclient, "asyncio", SimpleNamespace(sleep=clock.sleep))
+
+    async def main():
+        bucket = httpclient.TokenBucket(rate=2, burst=3)
+        # The burst is free
+        for _ in range(3):
+            await bucket.acquire()
+        assert clock.slept == 0
+
+        # Then one token every 1 / rate seconds
+        await bucket.acquire()
+        assert clock.slept == 0.5
+        await bucket.acquire()
+        assert clock.slept == 1.0
+
+        # Tokens saved up while idle are capped at the burst
+        clock.now += 60
+        for _ in range(3):
+            await bucket.acquire()
+        assert clock.slept == 1.0
+        await bucket.acquire()
+        assert clock.slept == 1.5
+
+    asyncio.run(main())
@@ -0,0 +1,68 @@
+import random
+import string
+from types import SimpleNamespace
+
+import pytest
+
+import utils
+
+
+def legacy(words, content):
+    message = SimpleNamespace(content=content)
+    return {word for word in words if utils.match_word(message, word)}
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        "",
+        "nothing to see here",
+        "Buy CHEAP pills now",
+        "c-h-e-a-p p.i.l.l.s",
+        "spam spam spammer",
+        "cheapest!!!",
+    ],
+)
+def test_matches_like_match_word(content):
+    words = ["cheap", "pills", "spam", "spammer", "eap"]
+    assert utils.WordMatcher(words).find(content) == legacy(words, content)
+
+
+def test_matches_like_match_word_on_random_messages():
+    rng = random.Random(0)
+    words = [
+        "".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 6)))
+        for _ in range(200)
+    ]
+    matcher = utils.WordMatcher(words)
+    for _ in range(200):
+        content = "".join(rng.choices(string.ascii_letters + " -.!", k=60))
+        assert matcher.find(content) == legacy(set(words), content)
+
+
+def test_add_and_remove():
+    matcher = utils.WordMatcher(["cheap", "pills"])
+    matcher.remove(["cheap"])
+    matcher.add(["spam"])
+
+    assert matcher.words == {"pills", "spam"}
+    assert matcher.find("cheap pills and spam") == {"pills", "spam"}
+    assert matcher.search("cheap") is False
+
+
+def test_cache_applies_changed_word_lists():
+    matchers = utils.WordMatcherCache()
+    assert matchers.find(1, "cheap pills") == set()
+
+    matcher = matchers.set(1, ["cheap", "pills"])
+    assert matchers.find(1, "cheap pills") == {"cheap", "pills"}
+
+    # The guild keeps its matcher, updated to the new list
+    assert matchers.set(1, ["Pills", "spam", " "]) is matcher
+    assert matchers.find(1, "cheap pills and spam") == {"pills", "spam"}
+    assert matchers.find(2, "spam") == set()
+
+    matchers.invalidate(1)
+    assert 1 not in matchers
+    assert matchers.find(1, "spam") == set()
+    assert matchers.stats() == {"guilds": 0, "words": 0}
@@ -0,0 +1,46 @@
+import asyncio
+import contextvars
+
+import disnake.webhook.async_ as webhook_async
+
+import utils
+
+
+class FakeAdapter:
+    def __init__(self) -> None:
+        self.responses = []
+
+    async def create_interaction_response(self, interaction_id, token, **kwargs):
+        self.responses.append(interaction_id)
+
+
+def test_track_responses_only_in_the_current_task(monkeypatch):
+    adapter = FakeAdapter()
+    monkeypatch.setattr(
+        webhook_async,
+        "async_context",
+        contextvars.ContextVar("async_webhook_context", default=adapter),
+    )
+    metrics = utils.CommandMetrics(utils.MetricsRegistry())
+    metrics._running[1] = ("ping", 0.0, False)
+    metrics._running[2] = ("ping", 0.0, False)
+
+    async def handle(interaction_id, track):
+        if track:
+            metrics.track_responses()
+            metrics.track_responses()
+        await webhook_async.async_context.get().create_interaction_response(
+            interaction_id, "token"
+        )
+
+    async def main():
+        await asyncio.create_task(handle(1, track=True))
+        await asyncio.create_task(handle(2, track=False))
+
+    asyncio.run(main())
+
+    assert adapter.responses == [1, 2]
+    assert metrics._running[1][2] is True
+    assert metrics._running[2][2] is False
+    assert sum(metrics.first_response.values[("ping",)]) == 1
+    assert webhook_async.async_context.get() is adapter
@@ -0,0 +1,72 @@
+import asyncio
+from types import SimpleNamespace
+
+import disnake
+
+import views
+
+AUTHOR = SimpleNamespace(id=1)
+
+
+def page(index: int) -> disnake.Embed:
+    return disnake.Embed(title=str(index))
+
+
+def test_renders_pages_lazily_and_caches_them():
+    async def main():
+        rendered = []
+
+        def render(index):
+            rendered.append(index)
+            return page(index) if index < 100 else None
+
+        paginator = views.Paginator(render, AUTHOR, cache_size=2)
+        assert (await paginator.get_page(5)).title == "5"
+        assert (await paginator.get_page(5)).title == "5"
+        assert rendered == [5]
+
+        await paginator.get_page(6)
+        await paginator.get_page(7)
+        await paginator.get_page(5)
+        # Only the 2 most recently rendered pages are kept
+        assert rendered == [5, 6, 7, 5]
+
+        # Past the last page, which sets the total
+        assert await paginator.get_page(100) is None
+        assert paginator.total == 100
+
+    asyncio.run(main())
+
+
+def test_prefetches_the_next_page():
+    async def main():
+        rendered = []
+
+        async def render(index):
+            rendered.append(index)
+            return page(index)
+
+        paginator = views.Paginator(render, AUTHOR, total=10)
+        first = await paginator.initial_page()
+        assert first.footer.text == "Page 1 of 10"
+        await asyncio.sleep(0)
+        assert rendered == [0, 1]
+        assert paginator.prev_page.disabled and not paginator.next_page.disabled
+
+    asyncio.run(main())
+
+
+def test_async_iterator_without_a_total():
+    async def main():
+        async def pages():
+            for index in range(3):
+                yield page(index)
+
+        paginator = views.Paginator(pages(), AUTHOR)
+        assert (await paginator.get_page(1)).title == "1"
+        assert paginator.total is None
+        assert await paginator.get_page(5) is None
+        assert paginator.total == 3
+        assert (await paginator.get_page(0)).title == "0"
+
+    asyncio.run(main())
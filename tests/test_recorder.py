@@ -0,0 +1,91 @@
+import utils
+
+
+def test_ids_are_hashed_consistently():
+    anonymize = utils.Anonymizer(key=b"k" * 32)
+    data = anonymize(
+        "GUILD_CREATE",
+        {"id": "1234", "roles": [{"id": "1234", "name": "@everyone"}]},
+    )
+
+    assert data["id"] != "1234"
+    assert data["id"].isdigit()
+    assert data["roles"][0]["id"] == data["id"]
+    assert utils.Anonymizer(key=b"k" * 32).snowflake("1234") == data["id"]
+    assert utils.Anonymizer(key=b"j" * 32).snowflake("1234") != data["id"]
+
+
+def test_text_is_anonymized_by_default():
+    anonymize = utils.Anonymizer()
+    data = anonymize(
+        "AUTO_MODERATION_ACTION_EXECUTION",
+        {
+            "content": "my secret",
+            "matched_keyword": "secret",
+            "matched_content": "secret",
+            "trigger_metadata": {"keyword_filter": ["secret"], "allow_list": ["ok"]},
+        },
+    )
+
+    assert data["content"] == "x" * len("my secret")
+    assert data["matched_keyword"] == "xxxxxx"
+    assert data["matched_content"] == "xxxxxx"
+    assert data["trigger_metadata"] == {
+        "keyword_filter": ["xxxxxx"],
+        "allow_list": ["xx"],
+    }
+
+
+def test_session_details_are_anonymized():
+    data = utils.Anonymizer()(
+        "READY",
+        {
+            "session_id": "abcdef",
+            "resume_gateway_url": "wss://gateway.discord.gg",
+        },
+    )
+    assert data["session_id"] == "xxxxxx"
+    assert "discord.gg" not in data["resume_gateway_url"]
+
+
+def test_kept_keys_and_timestamps_are_not_changed():
+    payload = {
+        "type": 0,
+        "permissions": "2048",
+        "locale": "en-US",
+        "joined_at": "2024-01-01T00:00:00+00:00",
+        "features": ["COMMUNITY"],
+    }
+    assert utils.Anonymizer()("GUILD_MEMBER_ADD", dict(payload)) == payload
+
+
+def test_urls_keep_their_extension():
+    data = utils.Anonymizer()(
+        "MESSAGE_CREATE",
+        {"attachments": [{"url": "https://cdn.discordapp.com/a/b/cat.png?ex=1"}]},
+    )
+    url = data["attachments"][0]["url"]
+    assert url.startswith("http://recorded.invalid/files/")
+    assert url.endswith(".png")
+
+
+def test_interaction_commands_are_kept():
+    data = utils.Anonymizer()(
+        "INTERACTION_CREATE",
+        {
+            "id": "99",
+            "data": {
+                "name": "download_file",
+                "type": 1,
+                "options": [
+                    {"name": "url", "type": 3, "value": "https://example.com/f.txt"},
+                    {"name": "user", "type": 6, "value": "1234"},
+                ],
+            },
+        },
+    )
+    options = data["data"]["options"]
+    assert data["data"]["name"] == "download_file"
+    assert [option["name"] for option in options] == ["url", "user"]
+    assert options[0]["value"].endswith(".txt")
+    assert options[1]["value"] != "1234"
@@ -0,0 +1,98 @@
+import time
+import asyncio
+import threading
+from datetime import datetime, timezone
+
+import pytest
+from beanie import init_beanie
+
+import models
+import utils
+from benchmarks.fake_mongo import FakeMongoClient
+
+
+def at(*args) -> datetime:
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+@pytest.mark.parametrize(
+    "expression, after, expected",
+    [
+        ("* * * * *", at(2024, 1, 1, 12, 0, 30), at(2024, 1, 1, 12, 1)),
+        ("0 4 * * *", at(2024, 1, 1, 4, 0), at(2024, 1, 2, 4, 0)),
+        ("*/15 * * * *", at(2024, 1, 1, 12, 7), at(2024, 1, 1, 12, 15)),
+        ("5/20 * * * *", at(2024, 1, 1, 12, 30), at(2024, 1, 1, 12, 45)),
+        ("0 0 1 * *", at(2024, 1, 15), at(2024, 2, 1)),
+        ("0 0 29 2 *", at(2024, 3, 1), at(2028, 2, 29)),
+        ("30 9 * * 1-5", at(2024, 1, 5, 10, 0), at(2024, 1, 8, 9, 30)),
+        # Sunday can be 0 or 7
+        ("0 0 * * 7", at(2024, 1, 1), at(2024, 1, 7)),
+        # Either day field matches when both are restricted
+        ("0 0 15 * 0", at(2024, 1, 1), at(2024, 1, 7)),
+        ("0 0 1,15 * *", at(2024, 1, 2), at(2024, 1, 15)),
+    ],
+)
+def test_cron_next_after(expression, after, expected):
+    assert utils.CronSchedule(expression).next_after(after) == expected
+
+
+@pytest.mark.parametrize(
+    "expression", ["* * * *", "60 * * * *", "* 24 * * *", "5-1 * * * *", "*/0 * * * *"]
+)
+def test_cron_rejects_invalid_expressions(expression):
+    with pytest.raises(ValueError):
+        utils.CronSchedule(expression)
+
+
+def test_cron_that_never_matches():
+    with pytest.raises(ValueError):
+        utils.CronSchedule("0 0 30 2 *").next_after(at(2024, 1, 1))
+
+
+def test_interval_schedule():
+    schedule = utils.IntervalSchedule(90)
+    assert schedule.next_after(at(2024, 1, 1)) == at(2024, 1, 1, 0, 1, 30)
+
+
+def test_timed_out_blocking_job_keeps_running_and_its_lease():
+    async def wait_for(condition):
+        for _ in range(100):
+            if condition():
+                return
+            await asyncio.sleep(0.05)
+        raise AssertionError("timed out")
+
+    async def lease_owner(job):
+        state = await models.JobState.find_one(models.JobState.key == job.key)
+        return state.lease_owner
+
+    async def main():
+        await init_beanie(
+            FakeMongoClient()["my-bot"], document_models=[models.JobState]
+        )
+        release = threading.Event()
+        started = []
+
+        def work():
+            started.append(time.monotonic())
+            release.wait(10)
+
+        scheduler = utils.Scheduler(utils.MetricsRegistry())
+        job = scheduler.add("slow", work, every=0.1, timeout=0.1)
+        scheduler.start()
+        try:
+            await wait_for(lambda: job.stuck == 1)
+            await asyncio.sleep(0.5)
+            assert len(started) == 1
+            assert job.running == 1
+            assert job.last_error == "Timed out after 0.1s"
+            assert await lease_owner(job) == scheduler.owner
+
+            release.set()
+            await wait_for(lambda: job.stuck == 0)
+            await wait_for(lambda: len(started) == 2)
+        finally:
+            release.set()
+            await scheduler.close()
+
+    asyncio.run(main())
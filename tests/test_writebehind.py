@@ -0,0 +1,85 @@
+import asyncio
+
+from beanie import init_beanie
+
+import models
+import utils
+from benchmarks.fake_mongo import FakeMongoClient
+
+
+async def fake_database() -> FakeMongoClient:
+    client = FakeMongoClient()
+    await init_beanie(client["my-bot"], document_models=[models.Guild])
+    return client
+
+
+def test_coalesces_updates_to_one_document():
+    queue = utils.WriteBehindQueue()
+    queue.set(models.Guild, {"guild_id": 1}, {"name": "a", "bot_log_channel_id": 5})
+    queue.set(models.Guild, {"guild_id": 1}, {"name": "b"})
+    queue.set(models.Guild, {"guild_id": 2}, {"name": "c"})
+
+    assert len(queue) == 2
+    assert queue.pending(models.Guild, {"guild_id": 1}) == {
+        "name": "b",
+        "bot_log_channel_id": 5,
+    }
+    assert queue.pending(models.Guild, {"guild_id": 3}) == {}
+    stats = queue.stats()
+    assert (stats["queued"], stats["coalesced"]) == (3, 1)
+
+
+def test_flush_writes_the_last_value():
+    async def main():
+        client = await fake_database()
+        await models.Guild(guild_id=1, name="old").insert()
+        queue = utils.WriteBehindQueue()
+        queue.set(models.Guild, {"guild_id": 1}, {"name": "a"})
+        queue.set(models.Guild, {"guild_id": 1}, {"name": "b"})
+        await queue.flush()
+
+        guild_doc = await models.Guild.find_one(models.Guild.guild_id == 1)
+        assert guild_doc.name == "b"
+        assert len(queue) == 0
+        assert queue.stats()["written"] == 1
+        assert client.operations["bulk_write"] == 1
+
+    asyncio.run(main())
+
+
+def test_drops_updates_that_keep_failing(monkeypatch):
+    async def main():
+        await fake_database()
+
+        async def bulk_write(*args, **kwargs):
+            raise ConnectionError("database unreachable")
+
+        monkeypatch.setattr(
+            models.Guild.get_pymongo_collection(), "bulk_write", bulk_write
+        )
+        queue = utils.WriteBehindQueue(max_attempts=3)
+        queue.set(models.Guild, {"guild_id": 1}, {"name": "a"})
+        for _ in range(3):
+            assert len(queue) == 1
+            try:
+                await queue.flush()
+            except ConnectionError:
+                pass
+
+        assert len(queue) == 0
+        assert queue.stats()["dropped"] == 1
+
+    asyncio.run(main())
+
+
+def test_cache_fill_applies_pending_updates():
+    async def main():
+        await fake_database()
+        await models.Guild(guild_id=1, name="old").insert()
+        guild_cache = utils.GuildCache(write_behind=utils.WriteBehindQueue())
+        guild_cache.set_later(1, {"name": "new"})
+
+        guild_doc = await guild_cache.get(1)
+        assert guild_doc.name == "new"
+
+    asyncio.run(main())
@@ -1 +1,68 @@
 from .utilities import *
+from .cache import LRUCache, GuildCache
+from .writebehind import WriteBehindQueue
+from .settings import SettingsStore, SettingsConflict
+from .executor import WorkerPool, PoolClosed
+from .diskcache import DiskCache, PinnedFile
+from .downloads import (
+    DownloadError,
+    DownloadTooLarge,
+    DownloadStats,
+    DownloadManager,
+    normalize_url,
+    stream_download,
+)
+from .httpclient import (
+    HTTPClient,
+    HTTPResponse,
+    HTTPUnavailable,
+    HostLimit,
+    TokenBucket,
+)
+from .httpcache import JSONCache, HTTPStatusError, strip_secrets
+from .automod import (
+    AutoModCache,
+    CompiledRules,
+    check_automod_block,
+    compile_automod_rules,
+    set_default_automod_cache,
+)
+from .matcher import WordMatcher, WordMatcherCache
+from .logs import (
+    QueuedSink,
+    EventSampler,
+    InterceptHandler,
+    setup_logging,
+    log_path,
+    parse_sample_rates,
+    logging_stats,
+)
+from .metrics import (
+    Counter,
+    Gauge,
+    Histogram,
+    MetricsRegistry,
+    CommandMetrics,
+    MetricsServer,
+)
+from .startup import StartupTimer
+from .commandsync import CommandSyncer, command_tree, hash_commands
+from .cluster import (
+    ClusterLink,
+    ClusterSupervisor,
+    plan_clusters,
+    fetch_shard_count,
+    bot_stats,
+)
+from .resume import SessionResumer
+from .profiles import CacheProfile, CACHE_PROFILES, get_cache_profile
+from .memory import object_size, cache_memory, rss_bytes
+from .scheduler import CronSchedule, IntervalSchedule, Job, Scheduler
+from .recorder import (
+    Anonymizer,
+    RecordingFile,
+    TrafficRecorder,
+    encode_record,
+    read_recording,
+    recording_path,
+)
@@ -0,0 +1,244 @@
+import re
+import time
+import asyncio
+from typing import Any, Dict, Iterable, NamedTuple, Optional, Tuple
+
+import disnake
+from loguru import logger
+
+from .cache import LRUCache
+from .executor import WorkerPool
+from .utilities import strip_extra
+
+
+# Flags like `(?i)` at the start of a pattern apply to the whole expression,
+# so they have to be scoped to their pattern before patterns are combined
+GLOBAL_FLAGS = re.compile(r"^\(\?([aiLmsux]+)\)")
+
+# The cache `check_automod_block` uses when it isn't given one. The bot
+# replaces it with its own, which the rule gateway events keep up to date
+_default_cache: Optional["AutoModCache"] = None
+
+
+class CompiledRules(NamedTuple):
+    """A guild's keyword AutoMod rules, combined into as few matchers as
+    possible (usually one)."""
+
+    patterns: Tuple[re.Pattern, ...]
+    pattern_count: int
+
+    def match(self, string: str) -> bool:
+        """Check if a string, stripped with :func:`strip_extra`, is blocked."""
+        if not self.patterns:
+            return False
+        stripped = strip_extra(string)
+        return any(pattern.match(stripped) for pattern in self.patterns)
+
+
+def compile_automod_rules(rules: Iterable[disnake.AutoModRule]) -> CompiledRules:
+    """Combine the regex patterns of keyword AutoMod rules into one pattern.
+
+    Discord validates patterns with Rust's regex syntax, so a pattern that
+    Python can't compile is skipped (and logged) rather than breaking the
+    whole rule set. If the valid patterns can't be combined (e.g. they reuse
+    a group name), they are kept as separate matchers instead.
+
+    Parameters
+    ----------
+    rules: Iterable[:class:`disnake.AutoModRule`]
+        A guild's AutoMod rules.
+
+    Returns
+    -------
+    :class:`CompiledRules`
+        The combined patterns.
+    """
+    patterns = []
+    for rule in rules:
+        if rule.trigger_type != disnake.AutoModTriggerType.keyword:
+            continue
+        for pattern in rule.trigger_metadata.regex_patterns or ():
+            try:
+                patterns.append(re.compile(pattern))
+            except re.error as e:
+                logger.warning(f"Skipping AutoMod pattern {pattern!r}: {e}")
+
+    if len(patterns) <= 1:
+        return CompiledRules(tuple(patterns), len(patterns))
+    try:
+        combined = re.compile(
+            "|".join(
+                GLOBAL_FLAGS.sub(r"(?\1:", pattern.pattern) + ")"
+                if GLOBAL_FLAGS.match(pattern.pattern)
+                else f"(?:{pattern.pattern})"
+                for pattern in patterns
+            )
+        )
+    except re.error:
+        return CompiledRules(tuple(patterns), len(patterns))
+    return CompiledRules((combined,), len(patterns))
+
+
+class AutoModCache:
+    """Keeps each guild's keyword AutoMod rules compiled in memory.
+
+    A guild's rules are fetched and compiled the first time it is checked,
+    and concurrent first checks share one fetch. After that, checks don't
+    leave the process until the rules expire. Call :meth:`invalidate` when a
+    guild's rules change (the AutoMod rule create, update and delete gateway
+    events) or its events may have been missed (a shard's new session).
+
+    Compiling a guild's patterns can take milliseconds, so it is done in
+    `pool` if one is given. Checks are a single match of the compiled
+    patterns, which is cheaper than handing them to a worker.
+
+    Parameters
+    ----------
+    maxsize: :class:`int`
+        The maximum number of guilds whose rules are kept in memory.
+    ttl: Optional[:class:`float`]
+        How many seconds a guild's rules are kept before they are fetched
+        again, in case an invalidation was missed. (Default: 1 hour)
+    pool: Optional[:class:`WorkerPool`]
+        The pool to compile rules in (e.g. the bot's thread pool).
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 10000,
+        ttl: Optional[float] = 3600.0,
+        pool: Optional[WorkerPool] = None,
+    ) -> None:
+        self.pool = pool
+        self._rules: LRUCache[int, CompiledRules] = LRUCache(maxsize, ttl)
+        self._inflight: Dict[int, asyncio.Task] = {}
+        # Bumped when a guild is invalidated during a fetch, so a fetch that
+        # started before a rule changed doesn't cache the old rules
+        self._generations: Dict[int, int] = {}
+
+        self.fetches = 0
+        self.fetch_latency = 0.0
+
+    async def get(self, guild: disnake.Guild) -> CompiledRules:
+        """Get a guild's compiled rules, fetching them if needed.
+
+        Parameters
+        ----------
+        guild: :class:`disnake.Guild`
+            The guild.
+
+        Returns
+        -------
+        :class:`CompiledRules`
+            The guild's compiled keyword rules.
+        """
+        rules = self._rules.get(guild.id)
+        if rules is not None:
+            return rules
+
+        task = self._inflight.get(guild.id)
+        if task is None:
+            task = asyncio.create_task(self._fetch(guild))
+            self._inflight[guild.id] = task
+            task.add_done_callback(lambda _: self._forget(guild.id))
+        return await asyncio.shield(task)
+
+    def _forget(self, guild_id: int) -> None:
+        self._inflight.pop(guild_id, None)
+        # Only a fetch in flight compares generations
+        self._generations.pop(guild_id, None)
+
+    async def _fetch(self, guild: disnake.Guild) -> CompiledRules:
+        generation = self._generations.get(guild.id, 0)
+        start = time.perf_counter()
+        fetched = await guild.fetch_automod_rules()
+        if self.pool is not None:
+            rules = await self.pool.run(compile_automod_rules, fetched)
+        else:
+            rules = compile_automod_rules(fetched)
+        self.fetches += 1
+        self.fetch_latency = time.perf_counter() - start
+        if self._generations.get(guild.id, 0) == generation:
+            self._rules.put(guild.id, rules)
+        return rules
+
+    async def check(self, guild: disnake.Guild, string: str) -> bool:
+        """Check if a string contains words blocked by a guild's AutoMod.
+
+        Parameters
+        ----------
+        guild: :class:`disnake.Guild`
+            The guild being checked.
+        string: :class:`str`
+            The string to check AutoMod against.
+
+        Returns
+        -------
+        :class:`bool`
+            True if a blocked word was present, False otherwise.
+        """
+        rules = await self.get(guild)
+        return rules.match(string)
+
+    def invalidate(self, guild_id: int) -> None:
+        """Forget a guild's rules, so they are fetched again on the next check."""
+        if guild_id in self._inflight:
+            self._generations[guild_id] = self._generations.get(guild_id, 0) + 1
+        self._rules.pop(guild_id)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the counters of this cache.
+
+        Returns
+        -------
+        Dict[:class:`str`, Any]
+            The number of cached guilds, hits, misses, fetches and the
+            latency of the last fetch.
+        """
+        return {
+            **self._rules.stats(),
+            "fetches": self.fetches,
+            "last_fetch_latency": self.fetch_latency,
+        }
+
+
+def set_default_automod_cache(cache: Optional[AutoModCache]) -> None:
+    """Set the cache :func:`check_automod_block` uses when it isn't given one.
+
+    Parameters
+    ----------
+    cache: Optional[:class:`AutoModCache`]
+        The cache (e.g. `bot.automod`), or None to use a private one.
+    """
+    global _default_cache
+    _default_cache = cache
+
+
+async def check_automod_block(
+    guild: disnake.Guild, string: str, cache: Optional[AutoModCache] = None
+) -> bool:
+    """Queries a guild's AutoMod rules to see
+        if a given string contains blocked words.
+
+    Parameters
+    ----------
+    guild: :class:`disnake.Guild`
+        The guild being checked.
+    string: :class:`str`
+        The string to check AutoMod against.
+    cache: Optional[:class:`AutoModCache`]
+        The cache to get the guild's rules from. (Default: the bot's
+        `bot.automod`, see :func:`set_default_automod_cache`)
+
+    Returns
+    -------
+    :class:`bool`
+        True if a blocked word was present, False otherwise.
+    """
+    global _default_cache
+    if cache is None:
+        if _default_cache is None:
+            # Outside the bot, rules still expire with the cache's TTL
+            _default_cache = AutoModCache()
+        cache = _default_cache
+    return await cache.check(guild, string)
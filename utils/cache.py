@@ -0,0 +1,274 @@
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Any, Dict, Generic, Hashable, Mapping, Optional, Set, Tuple, TypeVar
+
+from loguru import logger
+
+import models
+from .writebehind import WriteBehindQueue
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class LRUCache(Generic[K, V]):
+    """A bounded mapping with least-recently-used eviction and an optional TTL.
+
+    Parameters
+    ----------
+    maxsize: :class:`int`
+        The maximum number of entries kept before the least recently
+        used one is evicted.
+    ttl: Optional[:class:`float`]
+        How many seconds an entry stays valid for. Entries never
+        expire if this is `None`.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None) -> None:
+        if maxsize <= 0:
+            raise ValueError("maxsize must be greater than 0")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: OrderedDict[K, Tuple[V, Optional[float]]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: K) -> bool:
+        entry = self._data.get(key)
+        return entry is not None and not self._expired(entry)
+
+    def _expired(self, entry: Tuple[V, Optional[float]]) -> bool:
+        expires_at = entry[1]
+        return expires_at is not None and expires_at <= time.monotonic()
+
+    def get(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        """Get an entry and mark it as the most recently used.
+
+        Parameters
+        ----------
+        key: :class:`Hashable`
+            The key to look up.
+        default: Optional[Any]
+            The value to return on a miss. (Default: None)
+
+        Returns
+        -------
+        Optional[Any]
+            The cached value or `default`.
+        """
+        entry = self._data.get(key)
+        if entry is None or self._expired(entry):
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key: K, value: V) -> None:
+        """Insert or replace an entry, evicting the least recently used
+        entry if the cache is full.
+
+        Parameters
+        ----------
+        key: :class:`Hashable`
+            The key to store the value under.
+        value: Any
+            The value to store.
+        """
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        """Remove an entry without counting it as a hit or miss."""
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the counters of this cache.
+
+        Returns
+        -------
+        Dict[:class:`str`, Any]
+            The size, capacity, hits, misses, evictions and hit rate.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class GuildCache:
+    """A write-through cache of :class:`models.Guild` documents keyed by `guild_id`.
+
+    Reads are served from memory and fall back to MongoDB on a miss.
+    Writes go to MongoDB first and then update the cached document, so
+    the cache never holds data the database doesn't.
+
+    Parameters
+    ----------
+    maxsize: :class:`int`
+        The maximum number of guild documents kept in memory.
+    ttl: Optional[:class:`float`]
+        How many seconds a cached document is trusted for before it is
+        read from the database again. Never expires if `None`.
+    write_behind: Optional[:class:`WriteBehindQueue`]
+        The queue used by :meth:`set_later` to buffer database writes.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 10000,
+        ttl: Optional[float] = None,
+        write_behind: Optional[WriteBehindQueue] = None,
+    ) -> None:
+        self._cache: LRUCache[int, models.Guild] = LRUCache(maxsize, ttl)
+        self.write_behind = write_behind
+        # Immediate writes started by set_later(), kept so they aren't
+        # garbage collected before they finish
+        self._writes: Set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    async def get(self, guild_id: int) -> Optional[models.Guild]:
+        """Get the database entry for a guild.
+
+        Parameters
+        ----------
+        guild_id: :class:`int`
+            The ID of the guild.
+
+        Returns
+        -------
+        Optional[:class:`models.Guild`]
+            The guild document or `None` if the guild has no database entry.
+        """
+        guild_doc = self._cache.get(guild_id)
+        if guild_doc is None:
+            guild_doc = await models.Guild.find_one(models.Guild.guild_id == guild_id)
+            if guild_doc is not None:
+                if self.write_behind is not None:
+                    # The database may not have the latest set_later() yet
+                    self._apply(
+                        guild_doc,
+                        self.write_behind.pending(models.Guild, {"guild_id": guild_id}),
+                    )
+                self._cache.put(guild_id, guild_doc)
+        return guild_doc
+
+    @staticmethod
+    def _apply(guild_doc: models.Guild, fields: Mapping[Any, Any]) -> None:
+        for field, value in fields.items():
+            setattr(guild_doc, str(field), value)
+
+    def put(self, guild_doc: models.Guild) -> None:
+        """Cache a guild document that is already known to be in the database."""
+        self._cache.put(guild_doc.guild_id, guild_doc)
+
+    async def save(self, guild_doc: models.Guild) -> models.Guild:
+        """Save a guild document to the database and cache it.
+
+        Parameters
+        ----------
+        guild_doc: :class:`models.Guild`
+            The document to save.
+
+        Returns
+        -------
+        :class:`models.Guild`
+            The saved document.
+        """
+        await guild_doc.save()
+        self.put(guild_doc)
+        return guild_doc
+
+    async def set(
+        self, guild_id: int, fields: Mapping[Any, Any]
+    ) -> Optional[models.Guild]:
+        """Set fields on a guild's database entry and its cached copy.
+
+        Parameters
+        ----------
+        guild_id: :class:`int`
+            The ID of the guild.
+        fields: Mapping[Any, Any]
+            The fields to set, keyed by name or by model field
+            (e.g. `models.Guild.name`).
+
+        Returns
+        -------
+        Optional[:class:`models.Guild`]
+            The updated document or `None` if the guild has no database entry.
+        """
+        guild_doc = await self.get(guild_id)
+        if guild_doc is None:
+            return None
+        try:
+            await guild_doc.set(fields)
+        except Exception:
+            # The cached copy may now disagree with the database
+            self.invalidate(guild_id)
+            raise
+        return guild_doc
+
+    def set_later(self, guild_id: int, fields: Mapping[Any, Any]) -> None:
+        """Set fields on a guild's cached copy now and on its database entry
+        with the next write-behind flush.
+
+        Use this for high-volume updates (e.g. from gateway events) where
+        a short delay before the write reaches the database is acceptable.
+        Reads before the flush see the new fields, even if the guild
+        wasn't cached.
+        Falls back to an immediate write in the background, whose failure
+        is logged, if there is no write-behind queue.
+
+        Parameters
+        ----------
+        guild_id: :class:`int`
+            The ID of the guild.
+        fields: Mapping[Any, Any]
+            The fields to set, keyed by name or by model field.
+        """
+        if self.write_behind is None:
+            task = asyncio.create_task(self.set(guild_id, fields))
+            self._writes.add(task)
+            task.add_done_callback(self._write_done)
+            return
+        guild_doc = self._cache.pop(guild_id)
+        if guild_doc is not None:
+            self._apply(guild_doc, fields)
+            self._cache.put(guild_id, guild_doc)
+        self.write_behind.set(models.Guild, {"guild_id": guild_id}, fields)
+
+    def _write_done(self, task: asyncio.Task) -> None:
+        self._writes.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.opt(exception=task.exception()).error(
+                f"Failed to update guild document!\t{task.exception()}"
+            )
+
+    def invalidate(self, guild_id: int) -> None:
+        """Drop a guild from the cache so the next read goes to the database."""
+        self._cache.pop(guild_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return self._cache.stats()
@@ -0,0 +1,362 @@
+import math
+import time
+import queue
+import signal
+import asyncio
+import multiprocessing
+from multiprocessing.process import BaseProcess
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import aiohttp
+from loguru import logger
+
+
+def plan_clusters(shard_count: int, cluster_count: int) -> List[List[int]]:
+    """Split the shards into contiguous ranges, one per cluster.
+
+    Parameters
+    ----------
+    shard_count: :class:`int`
+        The total number of shards.
+    cluster_count: :class:`int`
+        The number of clusters. Capped at the number of shards.
+
+    Returns
+    -------
+    List[List[:class:`int`]]
+        The shard IDs of each cluster. Their sizes differ by at most one.
+    """
+    cluster_count = max(1, min(cluster_count, shard_count))
+    size, extra = divmod(shard_count, cluster_count)
+    clusters, start = [], 0
+    for cluster_id in range(cluster_count):
+        end = start + size + (cluster_id < extra)
+        clusters.append(list(range(start, end)))
+        start = end
+    return clusters
+
+
+async def fetch_shard_count(token: str, api_base: str) -> int:
+    """Get the number of shards Discord recommends for the bot.
+
+    Parameters
+    ----------
+    token: :class:`str`
+        The bot token.
+    api_base: :class:`str`
+        The base URL of the REST API.
+
+    Returns
+    -------
+    :class:`int`
+        The recommended shard count.
+    """
+    async with aiohttp.ClientSession() as session:
+        async with session.get(
+            f"{api_base}/gateway/bot", headers={"Authorization": f"Bot {token}"}
+        ) as response:
+            response.raise_for_status()
+            return (await response.json(content_type=None))["shards"]
+
+
+class ClusterLink:
+    """A worker's end of the IPC channel to the cluster supervisor.
+
+    The worker reports its own stats periodically and gets the latest
+    stats of every cluster back. Both directions are non-blocking
+    `multiprocessing` queues, so a slow supervisor never stalls the
+    worker's event loop.
+
+    Parameters
+    ----------
+    cluster_id: :class:`int`
+        The ID of the worker's cluster.
+    outbox: :class:`multiprocessing.Queue`
+        The queue shared by every worker, read by the supervisor.
+    inbox: :class:`multiprocessing.Queue`
+        The queue the supervisor sends this worker the aggregated stats on.
+    """
+
+    def __init__(
+        self,
+        cluster_id: int,
+        outbox: multiprocessing.Queue,
+        inbox: multiprocessing.Queue,
+    ) -> None:
+        self.cluster_id = cluster_id
+        self.outbox = outbox
+        self.inbox = inbox
+        # The latest stats of every cluster, keyed by cluster ID
+        self.clusters: Dict[int, Dict[str, Any]] = {}
+
+    def send(self, kind: str, payload: Optional[Dict[str, Any]] = None) -> None:
+        """Send a message to the supervisor, dropping it if the queue is full."""
+        try:
+            self.outbox.put_nowait((self.cluster_id, kind, payload or {}))
+        except queue.Full:
+            pass
+
+    async def run(self, collect: Callable[[], Dict[str, Any]], interval: float):
+        """Report this cluster's stats and receive everyone's until cancelled.
+
+        Parameters
+        ----------
+        collect: Callable[[], Dict[:class:`str`, Any]]
+            Gets this cluster's current stats.
+        interval: :class:`float`
+            The number of seconds between reports.
+        """
+        while True:
+            self.send("stats", collect())
+            while True:
+                try:
+                    self.clusters = self.inbox.get_nowait()
+                except queue.Empty:
+                    break
+            await asyncio.sleep(interval)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the totals across every cluster that reported its stats.
+
+        Returns
+        -------
+        Dict[:class:`str`, Any]
+            The number of clusters, shards and guilds, and the mean latency.
+        """
+        return aggregate(self.clusters)
+
+
+def aggregate(clusters: Dict[int, Dict[str, Any]]) -> Dict[str, Any]:
+    """Sum up the stats reported by each cluster."""
+    latencies = [c["latency"] for c in clusters.values() if c.get("latency")]
+    return {
+        "clusters": len(clusters),
+        "shards": sum(c.get("shards", 0) for c in clusters.values()),
+        "guilds": sum(c.get("guilds", 0) for c in clusters.values()),
+        "latency": sum(latencies) / len(latencies) if latencies else None,
+    }
+
+
+def bot_stats(bot) -> Dict[str, Any]:
+    """Collect the stats a cluster reports to the supervisor."""
+    latency = bot.latency
+    return {
+        "guilds": len(bot.guilds),
+        "shards": len(bot.shards),
+        "latency": None if math.isnan(latency) or math.isinf(latency) else latency,
+        "ready": bot.is_ready(),
+    }
+
+
+class ClusterSupervisor:
+    """Runs the bot's shards in several worker processes and keeps them up.
+
+    Each cluster is a process owning a contiguous range of shards. The
+    clusters are started one at a time: the next one only starts once the
+    previous one reported that it's ready (or `identify_timeout` passed),
+    so their shards don't identify at the same time and run into Discord's
+    identify rate limit. Within a cluster, disnake already waits between
+    its shards.
+
+    A cluster that exits with an error is restarted, after a backoff that
+    doubles with every crash in a row. A cluster that exits cleanly is not.
+    SIGINT and SIGTERM stop every cluster.
+
+    Parameters
+    ----------
+    target: Callable[..., None]
+        The worker's entry point, called in the new process with the
+        cluster ID, its shard IDs, the shard count and its
+        :class:`ClusterLink`. Must be importable (picklable).
+    shard_count: :class:`int`
+        The total number of shards.
+    cluster_count: :class:`int`
+        The number of worker processes.
+    identify_timeout: :class:`float`
+        The maximum number of seconds to wait for a cluster to get ready
+        before starting the next one. (Default: 120.0)
+    max_backoff: :class:`float`
+        The maximum number of seconds to wait before restarting a crashed
+        cluster. (Default: 60.0)
+    """
+
+    def __init__(
+        self,
+        target: Callable[..., None],
+        shard_count: int,
+        cluster_count: int,
+        identify_timeout: float = 120.0,
+        max_backoff: float = 60.0,
+    ) -> None:
+        self.target = target
+        self.shard_count = shard_count
+        self.plan = plan_clusters(shard_count, cluster_count)
+        self.identify_timeout = identify_timeout
+        self.max_backoff = max_backoff
+
+        # Spawned workers don't inherit the supervisor's event loop or sockets
+        self._context = multiprocessing.get_context("spawn")
+        self._outbox = self._context.Queue()
+        self._inboxes = [self._context.Queue() for _ in self.plan]
+        self._processes: Dict[int, BaseProcess] = {}
+        self._crashes = [0] * len(self.plan)
+        self._restarts = [0] * len(self.plan)
+        # (cluster ID, earliest start time), in start order
+        self._pending: List[Tuple[int, float]] = [
+            (i, 0.0) for i in range(len(self.plan))
+        ]
+        # The cluster that is identifying and when it was started
+        self._starting: Optional[Tuple[int, float]] = None
+        self._stopping = False
+        self.clusters: Dict[int, Dict[str, Any]] = {}
+
+    def run(self) -> None:
+        """Start the clusters and supervise them until told to stop."""
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGTERM, self._stop)
+        logger.info(
+            f"Running {self.shard_count} shards in {len(self.plan)} clusters: "
+            + ", ".join(f"{i}: {s[0]}-{s[-1]}" for i, s in enumerate(self.plan))
+        )
+        try:
+            while not self._stopping:
+                self._start_next()
+                self._receive(timeout=1.0)
+                self._check_processes()
+        finally:
+            self._shutdown()
+
+    def _stop(self, signum: int, frame: Any) -> None:
+        logger.info(f"Received {signal.Signals(signum).name}, stopping clusters")
+        self._stopping = True
+
+    def _start_next(self) -> None:
+        now = time.monotonic()
+        if self._starting is not None:
+            cluster_id, started = self._starting
+            if now - started < self.identify_timeout:
+                return
+            logger.warning(
+                f"Cluster {cluster_id} isn't ready after {self.identify_timeout:.0f}s, "
+                "starting the next one"
+            )
+            self._starting = None
+
+        for index, (cluster_id, not_before) in enumerate(self._pending):
+            if not_before <= now:
+                del self._pending[index]
+                break
+        else:
+            return
+
+        # Stats sent to the cluster's last process must not reach the new one
+        self._drain(self._inboxes[cluster_id])
+        process = self._context.Process(
+            target=self.target,
+            args=(
+                cluster_id,
+                self.plan[cluster_id],
+                self.shard_count,
+                ClusterLink(cluster_id, self._outbox, self._inboxes[cluster_id]),
+            ),
+            name=f"cluster-{cluster_id}",
+        )
+        process.start()
+        self._processes[cluster_id] = process
+        self._starting = (cluster_id, now)
+        logger.info(
+            f"Started cluster {cluster_id} (pid {process.pid}) "
+            f"with shards {self.plan[cluster_id]}"
+        )
+
+    def _receive(self, timeout: float) -> None:
+        try:
+            message = self._outbox.get(timeout=timeout)
+        except queue.Empty:
+            return
+        while True:
+            cluster_id, kind, payload = message
+            if kind == "ready":
+                logger.info(f"Cluster {cluster_id} is ready")
+                self._crashes[cluster_id] = 0
+                if self._starting and self._starting[0] == cluster_id:
+                    self._starting = None
+            elif kind == "stats":
+                self.clusters[cluster_id] = payload
+                self._broadcast()
+            try:
+                message = self._outbox.get_nowait()
+            except queue.Empty:
+                return
+
+    def _broadcast(self) -> None:
+        # Nothing reads the inboxes of clusters that exited or are waiting
+        # to restart, so they would only pile up
+        for cluster_id, process in self._processes.items():
+            if not process.is_alive():
+                continue
+            try:
+                self._inboxes[cluster_id].put_nowait(dict(self.clusters))
+            except queue.Full:
+                pass
+
+    @staticmethod
+    def _drain(inbox: multiprocessing.Queue) -> None:
+        while True:
+            try:
+                inbox.get_nowait()
+            except queue.Empty:
+                return
+
+    def _check_processes(self) -> None:
+        for cluster_id, process in list(self._processes.items()):
+            if process.is_alive():
+                continue
+            del self._processes[cluster_id]
+            self.clusters.pop(cluster_id, None)
+            if self._starting and self._starting[0] == cluster_id:
+                self._starting = None
+            if process.exitcode == 0 or self._stopping:
+                logger.info(f"Cluster {cluster_id} exited")
+                continue
+
+            self._crashes[cluster_id] += 1
+            self._restarts[cluster_id] += 1
+            backoff = min(2 ** (self._crashes[cluster_id] - 1), self.max_backoff)
+            logger.error(
+                f"Cluster {cluster_id} crashed with exit code {process.exitcode}, "
+                f"restarting in {backoff:.0f}s"
+            )
+            self._pending.append((cluster_id, time.monotonic() + backoff))
+
+    def _shutdown(self, timeout: float = 30.0) -> None:
+        for process in self._processes.values():
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + timeout
+        for cluster_id, process in self._processes.items():
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning(f"Cluster {cluster_id} didn't stop in time, killing it")
+                process.kill()
+                process.join()
+        self._processes.clear()
+        for inbox in self._inboxes:
+            # Don't wait at exit to flush stats nobody will read
+            inbox.cancel_join_thread()
+        logger.info("Stopped all clusters")
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the supervisor's counters and the totals across clusters.
+
+        Returns
+        -------
+        Dict[:class:`str`, Any]
+            The totals of :func:`aggregate`, plus the number of running
+            clusters and restarts.
+        """
+        return {
+            **aggregate(self.clusters),
+            "running": len(self._processes),
+            "restarts": sum(self._restarts),
+        }
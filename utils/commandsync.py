@@ -0,0 +1,172 @@
+import json
+import time
+import asyncio
+import hashlib
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import disnake
+from disnake.ext import commands
+from loguru import logger
+
+import models
+from .settings import SettingsStore
+
+GLOBAL_SCOPE = "global"
+
+
+def command_tree(
+    bot: commands.InteractionBot, test_guilds: Optional[Sequence[int]] = None
+) -> Dict[str, List[disnake.ApplicationCommand]]:
+    """Sort the bot's application commands by the scope they are registered in.
+
+    Parameters
+    ----------
+    bot: :class:`commands.InteractionBot`
+        The bot.
+    test_guilds: Optional[Sequence[:class:`int`]]
+        The guilds that commands without their own `guild_ids` are
+        registered in. They are registered globally if `None`.
+
+    Returns
+    -------
+    Dict[:class:`str`, List[:class:`disnake.ApplicationCommand`]]
+        The commands of each scope, keyed by guild ID or `"global"`.
+    """
+    tree = {}
+    for command in bot.application_commands:
+        guild_ids = command.guild_ids or test_guilds
+        for scope in map(str, guild_ids) if guild_ids else [GLOBAL_SCOPE]:
+            tree.setdefault(scope, []).append(command.body)
+    return tree
+
+
+def hash_commands(
+    bodies: Sequence[disnake.ApplicationCommand], application_id: Optional[int] = None
+) -> str:
+    """Hash the definitions of a scope's commands, independent of their order.
+
+    Parameters
+    ----------
+    bodies: Sequence[:class:`disnake.ApplicationCommand`]
+        The commands.
+    application_id: Optional[:class:`int`]
+        The ID of the application the commands are registered to, so
+        another bot using the same database doesn't share the hashes.
+
+    Returns
+    -------
+    :class:`str`
+        The hex digest of the hash.
+    """
+    payloads = sorted(
+        json.dumps(body.to_dict(), sort_keys=True, separators=(",", ":"))
+        for body in bodies
+    )
+    payloads.insert(0, str(application_id))
+    return hashlib.sha256("\n".join(payloads).encode()).hexdigest()
+
+
+class CommandSyncer:
+    """Registers the bot's application commands only where they changed.
+
+    The hash of each scope's command definitions is stored in the global
+    settings after a sync. On startup, only scopes whose hash changed (or
+    that no longer have commands) are overwritten, so a restart without
+    command changes makes no command requests at all. disnake's own sync,
+    which fetches every scope's commands on every connect, should be
+    disabled with :meth:`commands.CommandSyncFlags.none`.
+
+    Because unchanged scopes aren't fetched either, disnake's cache of
+    registered commands (e.g. :meth:`commands.InteractionBot.get_global_command_named`)
+    only holds the scopes that were synced.
+
+    Parameters
+    ----------
+    bot: :class:`commands.InteractionBot`
+        The bot.
+    settings: :class:`SettingsStore`
+        The store of the global settings, which holds the hashes.
+    test_guilds: Optional[Sequence[:class:`int`]]
+        The guilds that commands without their own `guild_ids` are
+        registered in.
+    """
+
+    def __init__(
+        self,
+        bot: commands.InteractionBot,
+        settings: SettingsStore,
+        test_guilds: Optional[Sequence[int]] = None,
+    ) -> None:
+        self.bot = bot
+        self.settings = settings
+        self.test_guilds = test_guilds
+
+    async def sync(self, force: bool = False) -> Dict[str, str]:
+        """Overwrite the commands of every scope whose definitions changed.
+
+        Parameters
+        ----------
+        force: :class:`bool`
+            Overwrite every scope, even if its hash is unchanged.
+            (Default: False)
+
+        Returns
+        -------
+        Dict[:class:`str`, :class:`str`]
+            What happened to each scope: `"unchanged"`, `"synced"`,
+            `"removed"` or `"failed"`.
+        """
+        start = time.perf_counter()
+        tree = command_tree(self.bot, self.test_guilds)
+        hashes = {
+            scope: hash_commands(bodies, self.bot.application_id)
+            for scope, bodies in tree.items()
+        }
+        stored = dict(self.settings.current.command_hashes)
+
+        outdated = [
+            scope for scope in hashes if force or stored.get(scope) != hashes[scope]
+        ]
+        # Scopes that had commands before, but don't anymore
+        removed = [scope for scope in stored if scope not in hashes]
+
+        results = await asyncio.gather(
+            *(self._overwrite(scope, tree[scope]) for scope in outdated),
+            *(self._overwrite(scope, []) for scope in removed),
+        )
+        decisions = {scope: "unchanged" for scope in hashes}
+        for scope, ok in results:
+            if not ok:
+                decisions[scope] = "failed"
+                # Forget the new commands (keep the removed ones), so the
+                # scope is retried on the next startup
+                if scope in hashes:
+                    stored.pop(scope, None)
+            elif scope not in hashes:
+                decisions[scope] = "removed"
+                stored.pop(scope, None)
+            else:
+                decisions[scope] = "synced"
+                stored[scope] = hashes[scope]
+
+        if stored != self.settings.current.command_hashes:
+            await self.settings.update({models.BotSettings.command_hashes: stored})
+
+        logger.info(
+            f"Command sync took {(time.perf_counter() - start) * 1000:.0f}ms: "
+            + ", ".join(f"{scope} {decision}" for scope, decision in decisions.items())
+        )
+        return decisions
+
+    async def _overwrite(
+        self, scope: str, bodies: List[disnake.ApplicationCommand]
+    ) -> Tuple[str, bool]:
+        try:
+            if scope == GLOBAL_SCOPE:
+                await self.bot.bulk_overwrite_global_commands(bodies)
+            else:
+                await self.bot.bulk_overwrite_guild_commands(int(scope), bodies)
+        except disnake.HTTPException as e:
+            logger.error(f"Failed to sync commands in scope {scope}: {e}")
+            return scope, False
+        return scope, True
@@ -0,0 +1,293 @@
+import os
+import time
+import asyncio
+from collections import Counter, OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from loguru import logger
+
+from .executor import WorkerPool
+
+T = TypeVar("T")
+
+
+class PinnedFile:
+    """A file that is kept from being evicted from a :class:`DiskCache`.
+
+    The file is pinned as soon as this is created, and until :meth:`release`
+    is called or the context manager exits.
+
+    Attributes
+    ----------
+    path: :class:`str`
+        The path of the file.
+    """
+
+    def __init__(self, cache: "DiskCache", path: str) -> None:
+        self.cache = cache
+        self.path = path
+        self._released = False
+        cache.touch(path)
+        cache._pins[path] += 1
+
+    def __enter__(self) -> "PinnedFile":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.release()
+
+    def release(self) -> None:
+        """Let the file be evicted again. Releasing twice does nothing."""
+        if self._released:
+            return
+        self._released = True
+        pins = self.cache._pins
+        pins[self.path] -= 1
+        if pins[self.path] <= 0:
+            del pins[self.path]
+
+
+class DiskCache:
+    """Manages the files in a directory as a cache with a byte budget.
+
+    An in-memory index keeps the size and last access time of every file,
+    so deciding what to evict never touches the file system. Files are
+    evicted least recently used first once the directory grows past
+    `max_bytes`, or once they haven't been accessed for `max_age` seconds.
+    Pinned files (e.g. ones being uploaded) are never evicted. All file
+    system work runs in a worker thread, off the event loop.
+
+    Parameters
+    ----------
+    directory: :class:`str`
+        The directory to manage.
+    max_bytes: :class:`int`
+        The maximum total size of the files in the directory.
+    max_age: Optional[:class:`float`]
+        How many seconds a file may go unused before it is evicted.
+        Files never expire if `None`.
+    pool: Optional[:class:`WorkerPool`]
+        The pool to do file system work in (e.g. the bot's thread pool).
+        Without one, it runs in the event loop's default executor.
+    """
+
+    # Files that are still being written
+    IN_PROGRESS_SUFFIXES = (".part", ".download")
+    # Seconds an in-progress file may go unwritten before it's considered
+    # left over from a crash, and deleted by :meth:`scan`
+    IN_PROGRESS_MAX_AGE = 3600.0
+
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int = 1024**3,
+        max_age: Optional[float] = 3600.0,
+        pool: Optional[WorkerPool] = None,
+    ) -> None:
+        self.directory = directory
+        self.pool = pool
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+        # path -> (size, last access), least recently used first
+        self._entries: OrderedDict[str, Tuple[int, float]] = OrderedDict()
+        self._pins: Counter[str] = Counter()
+        self._evict_lock = asyncio.Lock()
+        self.total_bytes = 0
+
+        self.evictions = 0
+        self.evicted_bytes = 0
+        self.last_evict_duration = 0.0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, path: str) -> bool:
+        return path in self._entries
+
+    def size_of(self, path: str) -> Optional[int]:
+        """Get the size of a tracked file, or `None` if it isn't tracked."""
+        entry = self._entries.get(path)
+        return None if entry is None else entry[0]
+
+    def add(self, path: str, size: int) -> None:
+        """Start tracking a file that was just written.
+
+        Parameters
+        ----------
+        path: :class:`str`
+            The path of the file.
+        size: :class:`int`
+            The size of the file in bytes.
+        """
+        self._discard(path)
+        self._entries[path] = (size, time.time())
+        self.total_bytes += size
+        if self.total_bytes > self.max_bytes and not self._evict_lock.locked():
+            asyncio.create_task(self.evict())
+
+    def touch(self, path: str) -> None:
+        """Mark a tracked file as just accessed."""
+        entry = self._entries.get(path)
+        if entry is not None:
+            self._entries[path] = (entry[0], time.time())
+            self._entries.move_to_end(path)
+
+    def pin(self, path: str) -> PinnedFile:
+        """Keep a file from being evicted until the returned handle is
+        released, e.g. with `with cache.pin(path): ...`.
+
+        Parameters
+        ----------
+        path: :class:`str`
+            The path of the file.
+
+        Returns
+        -------
+        :class:`PinnedFile`
+            The pinned file.
+        """
+        return PinnedFile(self, path)
+
+    def _discard(self, path: str) -> None:
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            self.total_bytes -= entry[0]
+
+    async def _run_blocking(self, func: Callable[..., T], *args: Any) -> T:
+        if self.pool is not None:
+            return await self.pool.run(func, *args)
+        return await asyncio.to_thread(func, *args)
+
+    async def scan(self) -> None:
+        """Index every file already in the directory (e.g. left over from a
+        previous run), and delete abandoned in-progress files."""
+        found, stale = await self._run_blocking(
+            self._scan, self.directory, time.time() - self.IN_PROGRESS_MAX_AGE
+        )
+        if stale:
+            errors = await self._run_blocking(self._remove, stale)
+            for path, e in errors:
+                logger.error(f"Error deleting {path}: {e}")
+            logger.info(
+                f"Deleted {len(stale) - len(errors)} abandoned partial files "
+                f"in {self.directory}"
+            )
+        # Known files were used more recently than anything left on disk,
+        # so the scanned files go in front, oldest first
+        for path, size, last_access in sorted(found, key=lambda f: -f[2]):
+            if path not in self._entries:
+                self._entries[path] = (size, last_access)
+                self._entries.move_to_end(path, last=False)
+                self.total_bytes += size
+        logger.debug(
+            f"Indexed {len(self._entries)} files ({self.total_bytes} bytes) "
+            f"in {self.directory}"
+        )
+
+    @classmethod
+    def _scan(
+        cls, directory: str, stale_before: float
+    ) -> Tuple[List[Tuple[str, int, float]], List[str]]:
+        found = []
+        stale = []
+        stack = [directory]
+        while stack:
+            try:
+                with os.scandir(stack.pop()) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                            continue
+                        try:
+                            stat = entry.stat(follow_symlinks=False)
+                        except FileNotFoundError:
+                            # e.g. a finished download that was just renamed
+                            continue
+                        if entry.name.endswith(cls.IN_PROGRESS_SUFFIXES):
+                            # Still being written, unless it stopped long ago
+                            if stat.st_mtime < stale_before:
+                                stale.append(entry.path)
+                            continue
+                        last_access = max(stat.st_atime, stat.st_mtime)
+                        found.append((entry.path, stat.st_size, last_access))
+            except FileNotFoundError:
+                continue
+        return found, stale
+
+    async def evict(self, everything: bool = False) -> int:
+        """Delete files that are too old or over the byte budget.
+
+        Parameters
+        ----------
+        everything: :class:`bool`
+            Delete every file that isn't pinned. (Default: False)
+
+        Returns
+        -------
+        :class:`int`
+            The number of files deleted.
+        """
+        async with self._evict_lock:
+            start = time.perf_counter()
+            now = time.time()
+            victims = []
+            remaining = self.total_bytes
+            for path, (size, last_access) in self._entries.items():
+                if path in self._pins:
+                    continue
+                expired = self.max_age is not None and now - last_access > self.max_age
+                if everything or expired or remaining > self.max_bytes:
+                    victims.append(path)
+                    remaining -= size
+                else:
+                    # Everything after this was used more recently
+                    break
+
+            evicted_bytes = 0
+            for path in victims:
+                evicted_bytes += self._entries[path][0]
+                self._discard(path)
+            errors = await self._run_blocking(self._remove, victims)
+            for path, e in errors:
+                logger.error(f"Error deleting {path}: {e}")
+
+            self.evictions += len(victims)
+            self.evicted_bytes += evicted_bytes
+            self.last_evict_duration = time.perf_counter() - start
+            return len(victims)
+
+    @staticmethod
+    def _remove(paths: List[str]) -> List[Tuple[str, Exception]]:
+        errors = []
+        for path in paths:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                errors.append((path, e))
+        return errors
+
+    async def clear(self) -> int:
+        """Delete every file that isn't pinned."""
+        return await self.evict(everything=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the counters of this cache.
+
+        Returns
+        -------
+        Dict[:class:`str`, Any]
+            The number and total size of tracked files, pinned files, and
+            eviction counts.
+        """
+        return {
+            "files": len(self._entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "pinned": len(self._pins),
+            "evictions": self.evictions,
+            "evicted_bytes": self.evicted_bytes,
+            "last_evict_duration": self.last_evict_duration,
+        }
@@ -0,0 +1,368 @@
+import os
+import time
+import uuid
+import asyncio
+import hashlib
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import aiofiles
+import aiofiles.os
+from loguru import logger
+
+from .cache import LRUCache
+from .diskcache import DiskCache, PinnedFile
+from .httpclient import HTTPClient
+from .metrics import MetricsRegistry
+from .utilities import humanbytes
+
+
+# Throughput buckets, from a stalled host (1 KiB/s) to a fast one (100 MiB/s)
+SPEED_BUCKETS = tuple(float(1024 * 4**i) for i in range(9))
+# Buffered body bucket boundaries, from one small chunk up to 16 MiB
+BUFFER_BUCKETS = tuple(float(16 * 1024 * 2**i) for i in range(11))
+
+
+class DownloadError(Exception):
+    """Raised when a file could not be downloaded."""
+
+
+class DownloadTooLarge(DownloadError):
+    """Raised when a file is bigger than the allowed size."""
+
+    def __init__(self, url: str, max_bytes: int) -> None:
+        self.url = url
+        self.max_bytes = max_bytes
+        super().__init__(f"{url} is larger than {max_bytes} bytes")
+
+
+class DownloadStats(NamedTuple):
+    """Statistics of a finished download."""
+
+    size: int  # bytes written to disk
+    elapsed: float  # seconds from request to the last byte
+    peak_buffered: int  # the most body bytes held in memory at once
+    sha256: str  # hex digest of the file's contents
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.size / self.elapsed if self.elapsed > 0 else float(self.size)
+
+
+async def stream_download(
+    http: HTTPClient,
+    url: str,
+    filepath: str,
+    max_bytes: int,
+    chunk_size: int = 64 * 1024,
+) -> DownloadStats:
+    """Stream a file from a URL to disk without holding the body in memory.
+
+    The body is written chunk by chunk to a temporary `.part` file that is
+    only moved to `filepath` once complete. The download is aborted as soon
+    as the advertised `Content-Length` or the bytes received so far exceed
+    `max_bytes`.
+
+    Memory use is estimated as the peak of the chunk being written plus the
+    bytes the connection has received but not handed out yet. aiohttp pauses
+    reading once that buffer fills, so the estimate stays bounded however
+    large the file is.
+
+    Parameters
+    ----------
+    http: :class:`HTTPClient`
+        The client to make the request with.
+    url: :class:`str`
+        The URL of the file.
+    filepath: :class:`str`
+        Where to save the file.
+    max_bytes: :class:`int`
+        The maximum size of the file, e.g. Discord's upload limit.
+    chunk_size: :class:`int`
+        The maximum number of bytes read at once. (Default: 64 KiB)
+
+    Raises
+    ------
+    :class:`DownloadTooLarge`
+        The file is bigger than `max_bytes`.
+    :class:`DownloadError`
+        The server didn't respond with status code 200.
+    :class:`HTTPUnavailable`
+        The server couldn't be reached, even after retrying.
+
+    Returns
+    -------
+    :class:`DownloadStats`
+        The size, duration, peak buffered bytes and digest of the download.
+    """
+    start = time.perf_counter()
+    size = 0
+    peak_buffered = 0
+    digest = hashlib.sha256()
+    part_path = f"{filepath}.part"
+
+    async with http.get(url) as response:
+        if response.status != 200:
+            raise DownloadError(
+                f"Downloading media {url} returned status code `{response.status}`"
+            )
+        if response.content_length is not None and response.content_length > max_bytes:
+            raise DownloadTooLarge(url, max_bytes)
+
+        try:
+            async with aiofiles.open(part_path, mode="wb") as f:
+                async for chunk in response.content.iter_chunked(chunk_size):
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise DownloadTooLarge(url, max_bytes)
+                    # Received so far minus consumed so far is what's still
+                    # queued in the connection's buffer behind this chunk
+                    buffered = len(chunk) + response.content.total_bytes - size
+                    peak_buffered = max(peak_buffered, buffered)
+                    digest.update(chunk)
+                    await f.write(chunk)
+            await aiofiles.os.replace(part_path, filepath)
+        except BaseException:
+            if await aiofiles.os.path.exists(part_path):
+                await aiofiles.os.remove(part_path)
+            raise
+
+    return DownloadStats(
+        size, time.perf_counter() - start, peak_buffered, digest.hexdigest()
+    )
+
+
+def normalize_url(url: str) -> str:
+    """Normalize a URL so that equivalent URLs compare equal.
+
+    The scheme and host are lowercased, default ports and the fragment are
+    dropped and query parameters are sorted.
+
+    Parameters
+    ----------
+    url: :class:`str`
+        The URL to normalize.
+
+    Returns
+    -------
+    :class:`str`
+        The normalized URL.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = (parts.hostname or "").lower()
+    if parts.port and (scheme, parts.port) not in (("http", 80), ("https", 443)):
+        netloc = f"{netloc}:{parts.port}"
+    if parts.username:
+        netloc = f"{parts.username}:{parts.password or ''}@{netloc}"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, netloc, parts.path or "/", query, ""))
+
+
+class DownloadManager:
+    """Downloads files into content-addressed storage.
+
+    Concurrent requests for the same (normalized) URL share one download,
+    as long as it was started with a size limit at least as large as
+    theirs, and files are stored under the SHA-256 of their contents, so URLs
+    that share a filename never clobber each other. A URL that was
+    already downloaded is served from disk without touching the network,
+    as long as it is among the `max_urls` most recently fetched.
+
+    Parameters
+    ----------
+    http: :class:`HTTPClient`
+        The client to download with.
+    directory: :class:`str`
+        The directory to store files in. Created if it doesn't exist.
+    cache: :class:`DiskCache`
+        The cache that manages `directory`. Stored files are added to it
+        and are only served while it still tracks them.
+    registry: :class:`MetricsRegistry`
+        The registry to record the throughput and peak memory of every
+        download in.
+    max_urls: :class:`int`
+        The maximum number of URLs whose stored file is remembered.
+    """
+
+    def __init__(
+        self,
+        http: HTTPClient,
+        directory: str,
+        cache: DiskCache,
+        registry: MetricsRegistry,
+        max_urls: int = 10000,
+    ) -> None:
+        self.http = http
+        self.directory = directory
+        self.cache = cache
+
+        # normalized URL -> content hash
+        self._index: LRUCache[str, str] = LRUCache(max_urls)
+        # normalized URL -> (download, its size limit)
+        self._inflight: Dict[str, Tuple[asyncio.Task, int]] = {}
+
+        self.requests = 0
+        self.hits = 0
+        self.coalesced = 0
+        self.downloads = 0
+        self.failures = 0
+        self.last: Optional[DownloadStats] = None
+        self.peak_buffered = 0  # the highest peak of any download
+
+        self.speed = registry.histogram(
+            "download_bytes_per_second",
+            "Throughput of finished downloads.",
+            buckets=SPEED_BUCKETS,
+        )
+        self.buffered = registry.histogram(
+            "download_peak_buffered_bytes",
+            "Most body bytes a finished download held in memory at once.",
+            buckets=BUFFER_BUCKETS,
+        )
+
+    def path_for(self, sha256: str) -> str:
+        """Get the path a file with the given content hash is stored at."""
+        return os.path.join(self.directory, sha256)
+
+    def cached_path(self, url: str) -> Optional[str]:
+        """Get the stored file for a URL, if it was downloaded before."""
+        sha256 = self._index.get(normalize_url(url))
+        if sha256 is None:
+            return None
+        filepath = self.path_for(sha256)
+        if filepath not in self.cache:
+            # The file was evicted
+            self._index.pop(normalize_url(url))
+            return None
+        return filepath
+
+    async def fetch(self, url: str, max_bytes: int) -> PinnedFile:
+        """Get a local copy of the file at a URL, downloading it if needed.
+
+        The file is returned pinned in the :class:`DiskCache`, so it can't be
+        evicted while it is used. Release it when done, e.g. by using the
+        returned file as a context manager.
+
+        Parameters
+        ----------
+        url: :class:`str`
+            The URL of the file.
+        max_bytes: :class:`int`
+            The maximum size of the file.
+
+        Raises
+        ------
+        :class:`DownloadTooLarge`
+            The file is bigger than `max_bytes`.
+        :class:`DownloadError`
+            The server didn't respond with status code 200, or the file kept
+            being evicted before it could be pinned.
+
+        Returns
+        -------
+        :class:`PinnedFile`
+            The stored file.
+        """
+        self.requests += 1
+        key = normalize_url(url)
+
+        # A finished download is handed to its callers a loop iteration after
+        # it's stored, in which the cache may already have evicted the file
+        for _ in range(2):
+            filepath = await self._get(url, key, max_bytes)
+            if filepath in self.cache:
+                break
+        else:
+            raise DownloadError(
+                f"{url} was evicted from the cache before it could be used"
+            )
+
+        # The file may have been fetched for a caller with a larger limit
+        if (self.cache.size_of(filepath) or 0) > max_bytes:
+            raise DownloadTooLarge(url, max_bytes)
+        return self.cache.pin(filepath)
+
+    async def _get(self, url: str, key: str, max_bytes: int) -> str:
+        filepath = self.cached_path(key)
+        if filepath is not None:
+            self.hits += 1
+        else:
+            task, limit = self._inflight.get(key, (None, 0))
+            if task is not None and limit >= max_bytes:
+                self.coalesced += 1
+            else:
+                # A download with a smaller limit could fail for this caller,
+                # so start one with this limit that later callers can join
+                task = asyncio.create_task(self._download(url, key, max_bytes))
+                self._inflight[key] = (task, max_bytes)
+                task.add_done_callback(lambda done: self._forget(key, done))
+            try:
+                # One caller giving up must not cancel the download for the others
+                filepath = await asyncio.shield(task)
+            except DownloadTooLarge:
+                raise DownloadTooLarge(url, max_bytes) from None
+        return filepath
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key, (None,))[0] is task:
+            del self._inflight[key]
+
+    async def _download(self, url: str, key: str, max_bytes: int) -> str:
+        await aiofiles.os.makedirs(self.directory, exist_ok=True)
+        part_path = os.path.join(self.directory, f"{uuid.uuid4().hex}.download")
+        try:
+            stats = await stream_download(self.http, url, part_path, max_bytes)
+        except BaseException:
+            self.failures += 1
+            raise
+        self.downloads += 1
+        self.last = stats
+        self.peak_buffered = max(self.peak_buffered, stats.peak_buffered)
+        self.speed.observe(value=stats.bytes_per_second)
+        self.buffered.observe(value=stats.peak_buffered)
+
+        filepath = self.path_for(stats.sha256)
+        if filepath in self.cache:
+            # Another URL already gave us the same bytes
+            await aiofiles.os.remove(part_path)
+            self.cache.touch(filepath)
+        else:
+            await aiofiles.os.replace(part_path, filepath)
+            self.cache.add(filepath, stats.size)
+        # The URL is fetched as given (e.g. signed URLs break if their query
+        # is re-encoded), but indexed normalized
+        self._index.put(key, stats.sha256)
+
+        logger.info(
+            f"Downloaded file at {url} to {filepath} "
+            f"({humanbytes(stats.size)} in {stats.elapsed:.2f}s, "
+            f"{humanbytes(stats.bytes_per_second)}/s, "
+            f"peak buffered {humanbytes(stats.peak_buffered)})"
+        )
+        return filepath
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the counters of this manager.
+
+        Returns
+        -------
+        Dict[:class:`str`, Any]
+            The number of requests, disk hits, coalesced requests, network
+            downloads and failures, the hit rate, the throughput and peak
+            buffered bytes of the last download and the highest peak of any.
+        """
+        return {
+            "requests": self.requests,
+            "hits": self.hits,
+            "coalesced": self.coalesced,
+            "downloads": self.downloads,
+            "failures": self.failures,
+            "indexed": len(self._index),
+            "hit_rate": (
+                (self.hits + self.coalesced) / self.requests if self.requests else 0.0
+            ),
+            "last_bytes_per_second": self.last.bytes_per_second if self.last else 0.0,
+            "last_peak_buffered": self.last.peak_buffered if self.last else 0,
+            "max_peak_buffered": self.peak_buffered,
+        }
@@ -0,0 +1,302 @@
+import os
+import time
+import signal
+import asyncio
+import multiprocessing
+from multiprocessing.queues import SimpleQueue
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple, TypeVar
+
+from loguru import logger
+
+from .metrics import MetricsRegistry
+
+# From a regex compile (milliseconds) to a file operation on a slow disk
+POOL_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+T = TypeVar("T")
+
+
+class PoolClosed(RuntimeError):
+    """Raised when work is given to a :class:`WorkerPool` that was closed."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        super().__init__(f"The {name} pool is closed")
+
+
+def _timed(
+    func: Callable[..., Any], args: Tuple[Any, ...], kwargs: Dict[str, Any]
+) -> Tuple[float, float, bool, Any]:
+    """Call a function in a worker and time it.
+
+    Module-level, so that process pools can pickle it. `time.monotonic`
+    is system-wide, so the times can be compared across processes.
+    """
+    started = time.monotonic()
+    try:
+        result, ok = func(*args, **kwargs), True
+    except Exception as e:
+        result, ok = e, False
+    return started, time.monotonic(), ok, result
+
+
+def _register_worker(pids: SimpleQueue) -> None:
+    """Tell the pool the PID of a new worker process, so it can be
+    terminated if it doesn't finish on shutdown."""
+    pids.put(os.getpid())
+
+
+class WorkerPool:
+    """Runs blocking or CPU-bound functions off the event loop.
+
+    A managed pool of worker threads or processes. At most `workers`
+    functions run at once and at most `queue_size` more wait for a
+    worker. Callers beyond that wait on the event loop until there is
+    room (backpressure), so a burst of work can't pile up in memory.
+
+    Cancelling a caller cancels its function if it hasn't started yet.
+    A function that already started runs to completion and keeps its
+    place in the pool until then. Closing the pool cancels the functions
+    that haven't started and waits for the others.
+
+    The time every function waited for a worker and ran is recorded in
+    the metrics, along with the depth of the queue.
+
+    Threads suit blocking I/O and functions that release the GIL (most
+    of `os`, `hashlib` on large inputs). Processes suit pure Python CPU
+    work, but their functions and arguments must be picklable, and the
+    processes are only started when first needed.
+
+    Parameters
+    ----------
+    registry: :class:`MetricsRegistry`
+        The registry to add the metrics to.
+    name: :class:`str`
+        The name of the pool, used in its metrics and thread names.
+    workers: :class:`int`
+        The number of threads or processes. (Default: 4)
+    queue_size: :class:`int`
+        The maximum number of functions waiting for a worker. (Default: 256)
+    processes: :class:`bool`
+        Use processes instead of threads. (Default: False)
+    """
+
+    def __init__(
+        self,
+        registry: MetricsRegistry,
+        name: str,
+        workers: int = 4,
+        queue_size: int = 256,
+        processes: bool = False,
+    ) -> None:
+        self.name = name
+        self.workers = workers
+        self.queue_size = queue_size
+        self.processes = processes
+        self._executor: Optional[Executor] = None
+        self._pids: Optional[SimpleQueue] = None
+        self._slots = asyncio.Semaphore(workers + queue_size)
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._closed = False
+
+        # Functions given to the executor that haven't finished yet
+        self.pending = 0
+        # Callers waiting for room in the queue
+        self.blocked = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.last_wait = 0.0
+
+        self.wait_time = registry.histogram(
+            "pool_wait_seconds",
+            "Time a function waited for a worker, including backpressure.",
+            ["pool"],
+            buckets=POOL_BUCKETS,
+        )
+        self.run_time = registry.histogram(
+            "pool_run_seconds",
+            "Time a function ran in a worker.",
+            ["pool"],
+            buckets=POOL_BUCKETS,
+        )
+        self.tasks = registry.counter(
+            "pool_tasks_total",
+            "Functions run in a worker pool, by outcome.",
+            ["pool", "status"],
+        )
+        self.depth = registry.gauge(
+            "pool_queue_depth", "Functions waiting for a worker.", ["pool"]
+        )
+
+    @property
+    def queued(self) -> int:
+        """The number of functions waiting for a worker."""
+        return max(0, self.pending - self.workers)
+
+    @property
+    def full(self) -> bool:
+        """Whether new functions would have to wait for room in the queue."""
+        return self._slots.locked()
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.processes:
+                # Forking would copy the event loop and its threads
+                context = multiprocessing.get_context("spawn")
+                self._pids = context.SimpleQueue()
+                self._executor = ProcessPoolExecutor(
+                    self.workers,
+                    mp_context=context,
+                    initializer=_register_worker,
+                    initargs=(self._pids,),
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    self.workers, thread_name_prefix=self.name
+                )
+        return self._executor
+
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Run a function in a worker and wait for its result.
+
+        Parameters
+        ----------
+        func: Callable[..., T]
+            The function. For a process pool, it must be defined at the
+            top level of a module.
+        *args, **kwargs
+            The arguments to call it with.
+
+        Raises
+        ------
+        :class:`PoolClosed`
+            The pool was closed before the function started.
+
+        Returns
+        -------
+        T
+            What the function returned. Exceptions it raised are re-raised.
+        """
+        if self._closed:
+            raise PoolClosed(self.name)
+        submitted = time.monotonic()
+        self.blocked += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.blocked -= 1
+        if self._closed:
+            self._slots.release()
+            raise PoolClosed(self.name)
+
+        loop = asyncio.get_running_loop()
+        try:
+            future = self._get_executor().submit(_timed, func, args, kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        self.pending += 1
+        self._idle.clear()
+        self.depth.set(self.name, value=self.queued)
+        # The slot is only given back once the function is really done,
+        # which is later than the caller if it was cancelled while running
+        future.add_done_callback(lambda _: self._call_soon(loop, self._finished))
+
+        try:
+            started, finished, ok, result = await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            self.tasks.inc(self.name, "cancelled")
+            if future.cancelled() and self._closed:
+                task = asyncio.current_task()
+                if task is None or not task.cancelling():
+                    # Cancelled by close(), not by the caller
+                    raise PoolClosed(self.name) from None
+            raise
+        except Exception:
+            # The worker died, or the result couldn't be sent back
+            self.failed += 1
+            self.tasks.inc(self.name, "error")
+            raise
+
+        self.last_wait = max(0.0, started - submitted)
+        self.wait_time.observe(self.name, value=self.last_wait)
+        self.run_time.observe(self.name, value=finished - started)
+        if not ok:
+            self.failed += 1
+            self.tasks.inc(self.name, "error")
+            raise result
+        self.completed += 1
+        self.tasks.inc(self.name, "ok")
+        return result
+
+    @staticmethod
+    def _call_soon(loop: asyncio.AbstractEventLoop, callback: Callable[[], Any]):
+        # Runs in a worker thread, or the executor's management thread
+        try:
+            loop.call_soon_threadsafe(callback)
+        except RuntimeError:
+            # The loop is closed, nothing is waiting anymore
+            pass
+
+    def _finished(self) -> None:
+        self.pending -= 1
+        self._slots.release()
+        self.depth.set(self.name, value=self.queued)
+        if not self.pending:
+            self._idle.set()
+
+    async def close(self, timeout: Optional[float] = 10.0) -> None:
+        """Stop taking work, cancel the functions that haven't started and
+        wait for the others to finish.
+
+        Parameters
+        ----------
+        timeout: Optional[:class:`float`]
+            How long to wait for running functions. Worker processes still
+            running after this are terminated. Threads can't be stopped,
+            and the interpreter waits for them when it exits. (Default: 10)
+        """
+        self._closed = True
+        if self._executor is None:
+            return
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except TimeoutError:
+            logger.warning(
+                f"{self.pending} functions of the {self.name} pool are still "
+                f"running after {timeout:g}s"
+            )
+            if self._pids is not None:
+                while not self._pids.empty():
+                    try:
+                        os.kill(self._pids.get(), signal.SIGTERM)
+                    except ProcessLookupError:
+                        pass
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the counters of this pool.
+
+        Returns
+        -------
+        Dict[:class:`str`, Any]
+            The number of workers, whether they were started, running and
+            queued functions, callers waiting for room in the queue,
+            finished, failed and cancelled functions, and how long the last
+            function waited for a worker.
+        """
+        return {
+            "workers": self.workers,
+            "started": int(self._executor is not None),
+            "running": min(self.pending, self.workers),
+            "queued": self.queued,
+            "blocked": self.blocked,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "last_wait": self.last_wait,
+        }
@@ -0,0 +1,235 @@
+import hmac
+import time
+import asyncio
+import hashlib
+import secrets
+from typing import Any, Dict, NamedTuple, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from loguru import logger
+
+from .cache import LRUCache
+from .downloads import normalize_url
+from .httpclient import HTTPClient
+
+# Query parameters that hold credentials and must never end up in cache keys
+# or logs as they are
+SECRET_PARAMS = frozenset(
+    {
+        "api_key",
+        "apikey",
+        "key",
+        "token",
+        "access_token",
+        "secret",
+        "client_secret",
+        "password",
+        "signature",
+        "sig",
+    }
+)
+
+# Secret values are replaced by a hash keyed with this, so that responses
+# for different credentials get different keys, but the hashes can't be
+# brute-forced from the logs. It is new every run, like the cache.
+_SECRET_KEY = secrets.token_bytes(32)
+
+
+class HTTPStatusError(Exception):
+    """Raised when an API responds with an unexpected status code."""
+
+    def __init__(self, url: str, status: int) -> None:
+        self.url = url
+        self.status = status
+        super().__init__(f"{url} returned status code {status}")
+
+
+def _hash_secret(value: str) -> str:
+    digest = hmac.new(_SECRET_KEY, value.encode(), hashlib.sha256).hexdigest()
+    return f"hmac-{digest[:16]}"
+
+
+def strip_secrets(url: str) -> str:
+    """Normalize a URL and replace the values of query parameters that
+    hold credentials with a keyed hash.
+
+    The same URL with different credentials (e.g. two API keys with
+    different permissions) gives different results, so their responses
+    are never mixed up.
+
+    Parameters
+    ----------
+    url: :class:`str`
+        The URL to strip.
+
+    Returns
+    -------
+    :class:`str`
+        The stripped URL, safe to use as a cache key or in logs.
+    """
+    parts = urlsplit(normalize_url(url))
+    query = [
+        (name, _hash_secret(value) if name.lower() in SECRET_PARAMS else value)
+        for name, value in parse_qsl(parts.query, keep_blank_values=True)
+    ]
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+class _Entry(NamedTuple):
+    data: Any
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fresh_until: float
+
+
+class JSONCache:
+    """Caches JSON responses from external APIs.
+
+    Responses are served from memory while they are fresh (`ttl`). After
+    that, for up to `stale_ttl` more seconds, the stale response is still
+    served immediately while it is revalidated in the background. Once a
+    response is older than that, callers wait for a new one. Revalidation
+    sends the `ETag`/`Last-Modified` validators, so an unchanged resource
+    costs a bodyless 304. Concurrent fetches of the same URL are shared.
+
+    Parameters
+    ----------
+    http: :class:`HTTPClient`
+        The client to make requests with. Its retries and per-host limits
+        apply to every request.
+    ttl: :class:`float`
+        How many seconds a response is fresh for. (Default: 300)
+    stale_ttl: :class:`float`
+        How many seconds past `ttl` a stale response may still be
+        served while it is revalidated. (Default: 3600)
+    maxsize: :class:`int`
+        The maximum number of cached URLs. (Default: 256)
+    """
+
+    def __init__(
+        self,
+        http: HTTPClient,
+        ttl: float = 300.0,
+        stale_ttl: float = 3600.0,
+        maxsize: int = 256,
+    ) -> None:
+        self.http = http
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries: LRUCache[str, _Entry] = LRUCache(maxsize)
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.errors = 0
+
+    async def get(self, url: str, ttl: Optional[float] = None) -> Any:
+        """Get the parsed JSON body of a URL.
+
+        Parameters
+        ----------
+        url: :class:`str`
+            The URL to get, including any credentials.
+        ttl: Optional[:class:`float`]
+            How many seconds the response is fresh for, overriding the
+            cache's default.
+
+        Raises
+        ------
+        :class:`HTTPStatusError`
+            The API responded with a status code other than 200 (or 304).
+        :class:`HTTPUnavailable`
+            The API couldn't be reached, even after retrying.
+
+        Returns
+        -------
+        Any
+            The parsed JSON body. Shared between callers; don't modify it.
+        """
+        key = strip_secrets(url)
+        entry = self._entries.get(key)
+        now = time.monotonic()
+
+        if entry is not None and now < entry.fresh_until:
+            self.hits += 1
+            return entry.data
+        if entry is not None and now < entry.fresh_until + self.stale_ttl:
+            self.stale_hits += 1
+            self._fetch(key, url, entry, ttl).add_done_callback(
+                self._log_background_error
+            )
+            return entry.data
+
+        self.misses += 1
+        return await asyncio.shield(self._fetch(key, url, entry, ttl))
+
+    def _fetch(
+        self, key: str, url: str, entry: Optional[_Entry], ttl: Optional[float]
+    ) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._request(key, url, entry, ttl))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return task
+
+    async def _request(
+        self, key: str, url: str, entry: Optional[_Entry], ttl: Optional[float]
+    ) -> Any:
+        headers = {}
+        if entry is not None and entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry is not None and entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+
+        try:
+            response = await self.http.fetch(url, headers=headers)
+            fresh_until = time.monotonic() + (self.ttl if ttl is None else ttl)
+            if response.status == 304 and entry is not None:
+                self.revalidated += 1
+                self._entries.put(key, entry._replace(fresh_until=fresh_until))
+                return entry.data
+            if response.status != 200:
+                raise HTTPStatusError(key, response.status)
+
+            data = response.json()
+            self._entries.put(
+                key,
+                _Entry(
+                    data,
+                    response.headers.get("ETag"),
+                    response.headers.get("Last-Modified"),
+                    fresh_until,
+                ),
+            )
+            return data
+        except Exception:
+            self.errors += 1
+            raise
+
+    def _log_background_error(self, task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Failed to revalidate cached response: {task.exception()}")
+
+    def invalidate(self, url: str) -> None:
+        self._entries.pop(strip_secrets(url))
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the counters of this cache.
+
+        Returns
+        -------
+        Dict[:class:`str`, Any]
+            The number of cached URLs, fresh and stale hits, misses,
+            304 revalidations and request errors.
+        """
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "revalidated": self.revalidated,
+            "errors": self.errors,
+        }
@@ -0,0 +1,447 @@
+import json
+import time
+import random
+import asyncio
+import contextlib
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Mapping, NamedTuple, Optional, Tuple
+from urllib.parse import urlsplit
+
+import aiohttp
+from loguru import logger
+
+from .metrics import MetricsRegistry
+
+# Methods that can be sent again without changing the outcome
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE", "TRACE"})
+
+# Statuses that mean "try again later" rather than "this request is wrong"
+RETRY_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+
+# The metrics label of hosts without limits of their own, so arbitrary
+# user-supplied URLs can't add label series without bound
+OTHER_HOST = "other"
+
+# Seconds. External APIs take from milliseconds to the whole timeout
+REQUEST_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class HTTPUnavailable(Exception):
+    """Raised when a host couldn't be reached or timed out, even after
+    retrying."""
+
+    def __init__(self, host: str, reason: BaseException) -> None:
+        self.host = host
+        self.reason = reason
+        super().__init__(f"{host} couldn't be reached: {type(reason).__name__}")
+
+
+class HostLimit(NamedTuple):
+    """How hard a single host may be hit."""
+
+    concurrency: int  # requests in flight at once
+    rate: Optional[float] = None  # requests per second, unlimited if `None`
+    burst: int = 1  # requests allowed at once after idling, on top of the rate
+
+
+class HTTPResponse(NamedTuple):
+    """A response whose body was read completely."""
+
+    status: int
+    headers: Mapping[str, str]
+    body: bytes
+
+    def json(self) -> Any:
+        return json.loads(self.body)
+
+
+class TokenBucket:
+    """Limits how often something happens, while allowing short bursts.
+
+    Parameters
+    ----------
+    rate: :class:`float`
+        The number of tokens added per second.
+    burst: :class:`int`
+        The maximum number of tokens saved up.
+    """
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+
+    async def acquire(self) -> None:
+        """Take a token, waiting for one if there are none left."""
+        while True:
+            now = time.monotonic()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class _Host:
+    def __init__(self, limit: HostLimit) -> None:
+        self.semaphore = asyncio.Semaphore(limit.concurrency)
+        self.bucket = TokenBucket(limit.rate, limit.burst) if limit.rate else None
+        self.in_flight = 0
+        # Requests waiting for or holding the semaphore. Hosts are only
+        # forgotten when this is 0, so their limits can't be bypassed
+        self.users = 0
+
+
+class HTTPClient:
+    """The bot's HTTP client for external APIs and downloads.
+
+    Every request goes through one connection pool, with cached DNS
+    lookups and kept-alive connections. On top of the pool, each host has
+    its own limits: at most `host_concurrency` requests in flight and,
+    optionally, at most `host_rate` requests per second. A slow or rate
+    limited host only makes its own requests wait, instead of taking up
+    every connection and stalling unrelated commands.
+
+    Idempotent requests that fail to connect, time out or get a "try
+    again later" status (429, 5xx) are retried up to `retries` times,
+    after a random delay of up to `backoff * 2 ** attempt` seconds (or
+    the `Retry-After` the host asked for). The randomness keeps callers
+    that failed together from retrying together.
+
+    Concurrent :meth:`fetch` calls for the same URL and headers share one
+    request. Request latencies, outcomes and retries are recorded per
+    host in the metrics registry, for the hosts given limits with
+    :meth:`limit_host`. Requests to any other host are recorded as
+    `other`, since the bot requests URLs supplied by users.
+
+    The limits of at most `max_hosts` hosts are kept, and the least
+    recently used idle ones are forgotten beyond that.
+
+    Must be created in a running event loop.
+
+    Parameters
+    ----------
+    registry: :class:`MetricsRegistry`
+        The registry to add the metrics to.
+    pool_size: :class:`int`
+        The maximum number of open connections. (Default: 100)
+    host_concurrency: :class:`int`
+        The maximum number of requests in flight per host. (Default: 8)
+    host_rate: Optional[:class:`float`]
+        The maximum number of requests per second per host, or `None`
+        for no limit. (Default: None)
+    timeout: :class:`float`
+        The number of seconds a :meth:`fetch` may take, and the longest
+        a streamed response may go without sending data. (Default: 30.0)
+    connect_timeout: :class:`float`
+        The number of seconds to wait for a connection. (Default: 10.0)
+    retries: :class:`int`
+        The number of times an idempotent request is retried. (Default: 3)
+    backoff: :class:`float`
+        The maximum delay before the first retry, doubling with each
+        retry. (Default: 0.5)
+    max_backoff: :class:`float`
+        The maximum delay before any retry. (Default: 10.0)
+    dns_ttl: :class:`int`
+        How many seconds DNS lookups are cached for. (Default: 300)
+    max_hosts: :class:`int`
+        The maximum number of hosts to keep limits for. (Default: 1000)
+    """
+
+    def __init__(
+        self,
+        registry: MetricsRegistry,
+        pool_size: int = 100,
+        host_concurrency: int = 8,
+        host_rate: Optional[float] = None,
+        timeout: float = 30.0,
+        connect_timeout: float = 10.0,
+        retries: int = 3,
+        backoff: float = 0.5,
+        max_backoff: float = 10.0,
+        dns_ttl: int = 300,
+        max_hosts: int = 1000,
+    ) -> None:
+        self.default_limit = HostLimit(
+            host_concurrency, host_rate, max(1, int(host_rate or 1))
+        )
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_hosts = max_hosts
+
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=pool_size,
+                ttl_dns_cache=dns_ttl,
+                keepalive_timeout=30.0,
+            ),
+            # Streamed responses (downloads) may take long, as long as data flows
+            timeout=aiohttp.ClientTimeout(
+                total=None, connect=connect_timeout, sock_read=timeout
+            ),
+        )
+        self._limits: Dict[str, HostLimit] = {}
+        # Least recently used first
+        self._hosts: OrderedDict[str, _Host] = OrderedDict()
+        self._inflight: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], asyncio.Task] = {}
+
+        self.request_seconds = registry.histogram(
+            "http_request_seconds",
+            "Time until an external host sent the response headers, by host.",
+            ["host"],
+            buckets=REQUEST_BUCKETS,
+        )
+        self.wait_seconds = registry.histogram(
+            "http_wait_seconds",
+            "Time requests waited for the host's concurrency and rate limits, by host.",
+            ["host"],
+            buckets=REQUEST_BUCKETS,
+        )
+        self.requests = registry.counter(
+            "http_requests_total",
+            "Requests to external hosts, by host and status code (or 'error').",
+            ["host", "status"],
+        )
+        self.retried = registry.counter(
+            "http_retries_total",
+            "Retried requests to external hosts, by host.",
+            ["host"],
+        )
+        self.coalesced = registry.counter(
+            "http_coalesced_total",
+            "Fetches that shared an identical request already in flight, by host.",
+            ["host"],
+        )
+
+    def limit_host(
+        self, host: str, concurrency: int, rate: Optional[float] = None, burst: int = 1
+    ) -> None:
+        """Use other limits than the defaults for a host.
+
+        Hosts with their own limits are never forgotten and get their own
+        label in the metrics.
+
+        Parameters
+        ----------
+        host: :class:`str`
+            The host name, e.g. `api.nasa.gov`.
+        concurrency: :class:`int`
+            The maximum number of requests in flight.
+        rate: Optional[:class:`float`]
+            The maximum number of requests per second, or `None` for no limit.
+        burst: :class:`int`
+            The number of requests allowed at once after idling. (Default: 1)
+        """
+        self._limits[host] = HostLimit(concurrency, rate, burst)
+        self._hosts.pop(host, None)
+
+    def _label(self, host: str) -> str:
+        return host if host in self._limits else OTHER_HOST
+
+    def _host(self, host: str) -> _Host:
+        limits = self._hosts.get(host)
+        if limits is not None:
+            self._hosts.move_to_end(host)
+            return limits
+
+        limits = self._hosts[host] = _Host(self._limits.get(host, self.default_limit))
+        if len(self._hosts) > self.max_hosts:
+            idle = [
+                name
+                for name, other in self._hosts.items()
+                if not other.users and name not in self._limits and name != host
+            ]
+            for name in idle[: len(self._hosts) - self.max_hosts]:
+                del self._hosts[name]
+        return limits
+
+    def _retry_delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        if retry_after is not None:
+            try:
+                return min(max(0.0, float(retry_after)), self.max_backoff)
+            except ValueError:
+                pass  # An HTTP date, use the backoff instead
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+
+    @contextlib.asynccontextmanager
+    async def request(
+        self, method: str, url: str, *, retries: Optional[int] = None, **kwargs: Any
+    ) -> AsyncIterator[aiohttp.ClientResponse]:
+        """Send a request within the host's limits, retrying if it's safe to.
+
+        Use as an async context manager, like :meth:`aiohttp.ClientSession.request`.
+        The response is returned as soon as its headers arrive, so its
+        body can be streamed. The host's concurrency slot is held until
+        the context manager exits.
+
+        Parameters
+        ----------
+        method: :class:`str`
+            The HTTP method.
+        url: :class:`str`
+            The URL.
+        retries: Optional[:class:`int`]
+            The number of retries, overriding the client's default. Only
+            idempotent methods are retried.
+        **kwargs
+            Passed to :meth:`aiohttp.ClientSession.request`.
+
+        Raises
+        ------
+        :class:`HTTPUnavailable`
+            The host couldn't be reached or timed out on the last attempt.
+
+        Yields
+        ------
+        :class:`aiohttp.ClientResponse`
+            The response. Its status may still be an error status, e.g. a
+            retried 503 on the last attempt.
+        """
+        method = method.upper()
+        host = urlsplit(url).hostname or ""
+        attempts = 1
+        if method in IDEMPOTENT_METHODS:
+            attempts += self.retries if retries is None else retries
+
+        label = self._label(host)
+        limits = self._host(host)
+        queued = time.perf_counter()
+        limits.users += 1
+        try:
+            async with limits.semaphore:
+                limits.in_flight += 1
+                try:
+                    for attempt in range(attempts):
+                        if limits.bucket is not None:
+                            await limits.bucket.acquire()
+                        sent = time.perf_counter()
+                        if attempt == 0:
+                            self.wait_seconds.observe(label, value=sent - queued)
+
+                        try:
+                            response = await self.session.request(method, url, **kwargs)
+                        except (
+                            aiohttp.ClientConnectionError,
+                            asyncio.TimeoutError,
+                        ) as e:
+                            self.requests.inc(label, "error")
+                            if attempt + 1 == attempts:
+                                raise HTTPUnavailable(host, e) from e
+                            delay = self._retry_delay(attempt)
+                        else:
+                            self.request_seconds.observe(
+                                label, value=time.perf_counter() - sent
+                            )
+                            self.requests.inc(label, str(response.status))
+                            if (
+                                response.status not in RETRY_STATUSES
+                                or attempt + 1 == attempts
+                            ):
+                                break
+                            delay = self._retry_delay(
+                                attempt, response.headers.get("Retry-After")
+                            )
+                            response.release()
+
+                        self.retried.inc(label)
+                        logger.debug(
+                            f"Retrying {method} request to {host} in {delay:.2f}s "
+                            f"(attempt {attempt + 2} of {attempts})"
+                        )
+                        await asyncio.sleep(delay)
+
+                    try:
+                        yield response
+                    finally:
+                        response.release()
+                finally:
+                    limits.in_flight -= 1
+        finally:
+            limits.users -= 1
+
+    def get(self, url: str, **kwargs: Any) -> contextlib.AbstractAsyncContextManager:
+        """Send a GET request. See :meth:`request`."""
+        return self.request("GET", url, **kwargs)
+
+    async def fetch(
+        self, url: str, headers: Optional[Mapping[str, str]] = None
+    ) -> HTTPResponse:
+        """GET a URL and read its whole body.
+
+        Concurrent fetches of the same URL with the same headers share
+        one request, so a burst of identical commands costs one request.
+
+        Parameters
+        ----------
+        url: :class:`str`
+            The URL.
+        headers: Optional[Mapping[:class:`str`, :class:`str`]]
+            The request headers.
+
+        Raises
+        ------
+        :class:`HTTPUnavailable`
+            The host couldn't be reached or the response didn't arrive in time.
+
+        Returns
+        -------
+        :class:`HTTPResponse`
+            The response. Shared between callers; don't modify it.
+        """
+        key = (url, tuple(sorted((headers or {}).items())))
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fetch(url, headers))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced.inc(self._label(urlsplit(url).hostname or ""))
+        # One caller giving up must not cancel the request for the others
+        return await asyncio.shield(task)
+
+    async def _fetch(
+        self, url: str, headers: Optional[Mapping[str, str]]
+    ) -> HTTPResponse:
+        timeout = aiohttp.ClientTimeout(
+            total=self.timeout, connect=self.connect_timeout
+        )
+        async with self.get(url, headers=headers, timeout=timeout) as response:
+            try:
+                body = await response.read()
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                raise HTTPUnavailable(response.url.host or "", e) from e
+            return HTTPResponse(response.status, response.headers, body)
+
+    async def close(self) -> None:
+        await self.session.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the counters of this client, summed over every host.
+
+        Returns
+        -------
+        Dict[:class:`str`, Any]
+            The number of hosts contacted, requests in flight, requests
+            sent, failed requests (no response or a 5xx), retries and
+            coalesced fetches.
+        """
+        errors = sum(
+            count
+            for (_, status), count in self.requests.values.items()
+            if status == "error" or status.startswith("5")
+        )
+        return {
+            "hosts": len(self._hosts),
+            "in_flight": sum(host.in_flight for host in self._hosts.values()),
+            "requests": sum(self.requests.values.values()),
+            "errors": errors,
+            "retries": sum(self.retried.values.values()),
+            "coalesced": sum(self.coalesced.values.values()),
+        }
@@ -0,0 +1,321 @@
+import os
+import sys
+import queue
+import random
+import logging
+import threading
+from collections import Counter
+from datetime import datetime, time, timedelta
+from typing import Any, Callable, Dict, List, Optional, TextIO
+
+from loguru import logger
+
+CONSOLE_FORMAT = (
+    "<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | <level>{level: <8}</level> | "
+    "<cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - "
+    "<level>{message}</level>"
+)
+
+# Added by `setup_logging`, so their counters can be reported
+_sinks: List["QueuedSink"] = []
+_sampler: Optional["EventSampler"] = None
+
+
+class QueuedSink:
+    """A loguru sink that hands messages to a background thread.
+
+    Writing to the sink only puts the formatted message on a bounded
+    in-memory queue, so logging never waits on the disk or a slow
+    terminal. If the writer falls so far behind that the queue fills up,
+    new messages are dropped (and counted) instead of blocking the caller.
+    Removing the sink from loguru drains the queue.
+
+    Parameters
+    ----------
+    write: Callable[[:class:`str`], None]
+        Writes a formatted message. Called from the background thread.
+    flush: Optional[Callable[[], None]]
+        Called once the queue is empty, e.g. to flush a file.
+    maxsize: :class:`int`
+        The maximum number of queued messages. (Default: 10000)
+    name: :class:`str`
+        The name of the background thread.
+    """
+
+    def __init__(
+        self,
+        write: Callable[[str], None],
+        flush: Optional[Callable[[], None]] = None,
+        maxsize: int = 10000,
+        name: str = "log-writer",
+    ) -> None:
+        self._write = write
+        self._flush = flush
+        self._queue: queue.Queue[Optional[str]] = queue.Queue(maxsize)
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+
+    def write(self, message: str) -> None:
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        while True:
+            message = self._queue.get()
+            if message is None:
+                break
+            try:
+                self._write(message)
+                self.written += 1
+                if self._flush is not None and self._queue.empty():
+                    self._flush()
+            except Exception as e:
+                # Logging the error would just queue it back up
+                self.errors += 1
+                print(f"Failed to write log message: {e}", file=sys.__stderr__)
+
+        if self._flush is not None:
+            self._flush()
+
+    def stop(self) -> None:
+        """Write everything still queued and stop the background thread."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the counters of this sink.
+
+        Returns
+        -------
+        Dict[:class:`str`, Any]
+            The queue depth and the number of written, dropped and failed
+            messages.
+        """
+        return {
+            "name": self._thread.name,
+            "depth": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "errors": self.errors,
+        }
+
+
+class DailyRotatingFile:
+    """A file that is renamed with a timestamp once a day at a set time.
+
+    Only meant to be used from a single thread, like a
+    :class:`QueuedSink`'s writer.
+
+    Parameters
+    ----------
+    path: :class:`str`
+        The path of the file.
+    at: :class:`datetime.time`
+        The local time to rotate the file at. (Default: 12:00)
+    """
+
+    def __init__(self, path: str, at: time = time(12, 0)) -> None:
+        self.path = path
+        self.at = at
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file: TextIO = open(path, "a", encoding="utf-8")
+        self._next_rotation = self._next_rotation_after(datetime.now())
+
+    def _next_rotation_after(self, now: datetime) -> datetime:
+        rotation = datetime.combine(now.date(), self.at)
+        return rotation if rotation > now else rotation + timedelta(days=1)
+
+    def write(self, message: str) -> None:
+        now = datetime.now()
+        if now >= self._next_rotation:
+            self._rotate(now)
+        self._file.write(message)
+
+    def _rotate(self, now: datetime) -> None:
+        self._file.close()
+        root, ext = os.path.splitext(self.path)
+        os.replace(self.path, f"{root}.{now:%Y-%m-%d_%H-%M-%S}{ext}")
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._next_rotation = self._next_rotation_after(now)
+
+    def flush(self) -> None:
+        self._file.flush()
+
+
+class EventSampler:
+    """A loguru filter that keeps only a share of high-volume event records.
+
+    Records are matched by the `event` field bound to them (e.g. with
+    `logger.bind(event="slash_command")`). Kept records get a `sample_rate`
+    field so counts can be scaled back up. Warnings and errors are
+    always kept.
+
+    Parameters
+    ----------
+    rates: Dict[:class:`str`, :class:`float`]
+        The share of records to keep for each event, between 0 and 1.
+        Events without a rate are always kept.
+    """
+
+    def __init__(self, rates: Dict[str, float]) -> None:
+        self.rates = rates
+        self.kept: Counter[str] = Counter()
+        self.sampled_out: Counter[str] = Counter()
+
+    def __call__(self, record: Dict[str, Any]) -> bool:
+        extra = record["extra"]
+        event = extra.get("event")
+        rate = self.rates.get(event)
+        if rate is None or record["level"].no >= logging.WARNING:
+            return True
+
+        # Every sink sees the same record, so decide only once
+        if "sample_rate" in extra:
+            return True
+        if extra.get("sampled_out"):
+            return False
+        if rate < 1.0 and random.random() >= rate:
+            extra["sampled_out"] = True
+            self.sampled_out[event] += 1
+            return False
+        extra["sample_rate"] = rate
+        self.kept[event] += 1
+        return True
+
+
+class InterceptHandler(logging.Handler):
+    """Sends records from the standard `logging` module to loguru."""
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            level = logger.level(record.levelname).name
+        except ValueError:
+            level = record.levelno
+
+        # Find the caller that logged the message, skipping `logging` itself
+        frame, depth = logging.currentframe(), 2
+        while frame and frame.f_code.co_filename == logging.__file__:
+            frame = frame.f_back
+            depth += 1
+
+        logger.opt(depth=depth, exception=record.exc_info).bind(
+            logger_name=record.name
+        ).log(level, record.getMessage())
+
+
+def parse_sample_rates(value: Optional[str]) -> Dict[str, float]:
+    """Parse sample rates like `slash_command=0.1,guild_update=0.5`.
+
+    Parameters
+    ----------
+    value: Optional[:class:`str`]
+        The comma-separated `event=rate` pairs.
+
+    Returns
+    -------
+    Dict[:class:`str`, :class:`float`]
+        The rate of each event.
+    """
+    rates = {}
+    for pair in filter(None, (value or "").split(",")):
+        event, rate = pair.split("=")
+        rates[event.strip()] = float(rate)
+    return rates
+
+
+def log_path(cluster_id: Optional[int] = None) -> str:
+    """Get the path of the log file, which is separate for every cluster.
+
+    Parameters
+    ----------
+    cluster_id: Optional[:class:`int`]
+        The ID of the cluster, or `None` if not running in cluster mode.
+
+    Returns
+    -------
+    :class:`str`
+        The path of the log file.
+    """
+    if cluster_id is None:
+        return "logs/my-bot.log"
+    return f"logs/my-bot.cluster-{cluster_id}.log"
+
+
+def setup_logging(
+    debug: bool = False,
+    disnake_logging: bool = False,
+    path: Optional[str] = None,
+    sample_rates: Optional[Dict[str, float]] = None,
+    queue_size: int = 10000,
+) -> None:
+    """Replace loguru's default sink with non-blocking console and file sinks.
+
+    The console gets human-readable lines. The file gets one JSON object
+    per record, with bound fields under `record.extra`, and is rotated
+    daily at 12:00.
+
+    Parameters
+    ----------
+    debug: :class:`bool`
+        Log debug messages. (Default: False)
+    disnake_logging: :class:`bool`
+        Route disnake's logs (and anything else using the standard
+        `logging` module) through the same sinks. (Default: False)
+    path: Optional[:class:`str`]
+        The path of the log file. (Default: :func:`log_path`)
+    sample_rates: Optional[Dict[:class:`str`, :class:`float`]]
+        The share of records to keep for high-volume events.
+    queue_size: :class:`int`
+        The maximum number of messages queued for each sink.
+    """
+    global _sampler
+    level = "DEBUG" if debug else "INFO"
+    _sampler = EventSampler(sample_rates or {})
+
+    logger.remove()
+    _sinks.clear()
+
+    console = QueuedSink(
+        sys.stderr.write, sys.stderr.flush, queue_size, name="log-writer-console"
+    )
+    logger.add(
+        console,
+        level=level,
+        format=CONSOLE_FORMAT,
+        colorize=sys.stderr.isatty(),
+        filter=_sampler,
+    )
+    _sinks.append(console)
+
+    log_file = DailyRotatingFile(path or log_path())
+    file = QueuedSink(
+        log_file.write, log_file.flush, queue_size, name="log-writer-file"
+    )
+    logger.add(file, level=level, serialize=True, filter=_sampler)
+    _sinks.append(file)
+
+    if disnake_logging:
+        logging.basicConfig(handlers=[InterceptHandler()], level=0, force=True)
+        logging.getLogger("disnake").setLevel(level)
+
+
+def logging_stats() -> Dict[str, Any]:
+    """Get the counters of the sinks and sampler added by :func:`setup_logging`.
+
+    Returns
+    -------
+    Dict[:class:`str`, Any]
+        The counters of each sink, and the number of records kept and
+        sampled out for each event.
+    """
+    return {
+        "sinks": [sink.stats() for sink in _sinks],
+        "kept": dict(_sampler.kept) if _sampler else {},
+        "sampled_out": dict(_sampler.sampled_out) if _sampler else {},
+    }
@@ -0,0 +1,226 @@
+from collections import deque
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+from .utilities import strip_extra
+
+
+class WordMatcher:
+    """Finds every one of a list of words in a message in a single pass.
+
+    The words are compiled into an Aho-Corasick automaton, so the cost of
+    a check depends on the length of the message rather than the number of
+    words. Like :func:`match_word`, a word matches if it appears in the
+    lowercased message or in the message with all non-word characters
+    removed. Both forms are computed once per message.
+
+    Words can be added and removed without rebuilding the automaton from
+    scratch: the trie is updated in place and only its links are
+    recomputed, on the next match. The trie is only rebuilt once more
+    words were removed from it than it still matches.
+
+    Parameters
+    ----------
+    words: Iterable[:class:`str`]
+        The words to match. Matching is case-insensitive.
+    """
+
+    def __init__(self, words: Iterable[str] = ()) -> None:
+        self._words: Set[str] = set()
+        self._reset()
+        self.add(words)
+
+    def _reset(self) -> None:
+        # Trie nodes, as parallel lists indexed by node id. Node 0 is the root
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._terminal: List[str] = [""]
+        # Every word that ends at a node, including through its fail links
+        self._outputs: List[Tuple[str, ...]] = [()]
+        self._removed = 0
+        self._dirty = False
+
+    def __len__(self) -> int:
+        return len(self._words)
+
+    def __contains__(self, word: str) -> bool:
+        return word.strip().lower() in self._words
+
+    @property
+    def words(self) -> Set[str]:
+        """The (lowercased) words being matched."""
+        return set(self._words)
+
+    def add(self, words: Iterable[str]) -> None:
+        """Start matching more words."""
+        for word in words:
+            word = word.strip().lower()
+            if not word or word in self._words:
+                continue
+            self._words.add(word)
+            node = 0
+            for char in word:
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto[node][char] = next_node
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._terminal.append("")
+                    self._outputs.append(())
+                node = next_node
+            self._terminal[node] = word
+            self._dirty = True
+
+    def remove(self, words: Iterable[str]) -> None:
+        """Stop matching some words. Words that aren't matched are ignored."""
+        for word in words:
+            word = word.strip().lower()
+            if word not in self._words:
+                continue
+            self._words.remove(word)
+            # The word's nodes stay in the trie (other words may share
+            # them), they just stop producing a match
+            node = 0
+            for char in word:
+                node = self._goto[node][char]
+            self._terminal[node] = ""
+            self._removed += 1
+            self._dirty = True
+
+    def _link(self) -> None:
+        if self._removed > len(self._words):
+            # Drop the nodes only removed words used
+            words, self._words = self._words, set()
+            self._reset()
+            self.add(words)
+        # Breadth first, so every node's fail target is linked before it
+        queue = deque()
+        for node in self._goto[0].values():
+            self._fail[node] = 0
+            queue.append(node)
+        while queue:
+            node = queue.popleft()
+            own = (self._terminal[node],) if self._terminal[node] else ()
+            self._outputs[node] = own + self._outputs[self._fail[node]]
+            for char, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                queue.append(child)
+        self._dirty = False
+
+    def _scan(self, text: str, found: Set[str]) -> None:
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if outputs[node]:
+                found.update(outputs[node])
+
+    def find(self, text: str) -> Set[str]:
+        """Find every matched word in a text.
+
+        Parameters
+        ----------
+        text: :class:`str`
+            The text to search, e.g. a message's content.
+
+        Returns
+        -------
+        Set[:class:`str`]
+            The (lowercased) words found in the text.
+        """
+        if not self._words:
+            return set()
+        if self._dirty:
+            self._link()
+
+        found = set()
+        lowered = text.strip().lower()
+        self._scan(lowered, found)
+        stripped = strip_extra(lowered)
+        if stripped != lowered:
+            self._scan(stripped, found)
+        return found
+
+    def search(self, text: str) -> bool:
+        """Check if any matched word is in a text."""
+        return bool(self.find(text))
+
+
+class WordMatcherCache:
+    """Keeps a compiled :class:`WordMatcher` for each guild's word list.
+
+    Whenever a guild's word list changes, pass the new list to :meth:`set`
+    (or the change to :meth:`add` or :meth:`remove`): only the words that
+    were added or removed are applied to its existing matcher. Call
+    :meth:`invalidate` when the list is deleted or the guild is left.
+    """
+
+    def __init__(self) -> None:
+        self._matchers: Dict[int, WordMatcher] = {}
+
+    def __contains__(self, guild_id: int) -> bool:
+        return guild_id in self._matchers
+
+    def get(self, guild_id: int) -> WordMatcher:
+        """Get a guild's matcher, creating an empty one if needed."""
+        matcher = self._matchers.get(guild_id)
+        if matcher is None:
+            matcher = self._matchers[guild_id] = WordMatcher()
+        return matcher
+
+    def set(self, guild_id: int, words: Iterable[str]) -> WordMatcher:
+        """Replace a guild's word list.
+
+        Parameters
+        ----------
+        guild_id: :class:`int`
+            The ID of the guild.
+        words: Iterable[:class:`str`]
+            The guild's new word list.
+
+        Returns
+        -------
+        :class:`WordMatcher`
+            The guild's updated matcher.
+        """
+        matcher = self.get(guild_id)
+        new = {word.strip().lower() for word in words} - {""}
+        old = matcher.words
+        matcher.remove(old - new)
+        matcher.add(new - old)
+        return matcher
+
+    def add(self, guild_id: int, words: Iterable[str]) -> None:
+        """Add words to a guild's word list."""
+        self.get(guild_id).add(words)
+
+    def remove(self, guild_id: int, words: Iterable[str]) -> None:
+        """Remove words from a guild's word list."""
+        self.get(guild_id).remove(words)
+
+    def find(self, guild_id: int, text: str) -> Set[str]:
+        """Find every word of a guild's word list in a text."""
+        matcher = self._matchers.get(guild_id)
+        return set() if matcher is None else matcher.find(text)
+
+    def invalidate(self, guild_id: int) -> None:
+        """Forget a guild's word list."""
+        self._matchers.pop(guild_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the counters of this cache.
+
+        Returns
+        -------
+        Dict[:class:`str`, Any]
+            The number of guilds and words.
+        """
+        return {
+            "guilds": len(self._matchers),
+            "words": sum(len(matcher) for matcher in self._matchers.values()),
+        }
@@ -0,0 +1,190 @@
+import os
+import sys
+import enum
+import itertools
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, Type
+
+import disnake
+from disnake.ext import commands
+
+# Values without references worth following
+LEAVES = (str, bytes, int, float, bool, type(None), datetime, enum.Enum)
+
+# Objects shared by everything in the cache, never counted as part of another
+SHARED: Tuple[Type, ...] = (
+    disnake.Client,
+    disnake.state.ConnectionState,
+    disnake.http.HTTPClient,
+    disnake.Guild,
+)
+
+
+def _children(obj: Any) -> Iterable[Any]:
+    if isinstance(obj, dict):
+        return itertools.chain(obj.keys(), obj.values())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return obj
+    # disnake's models use __slots__, so look at those as well as __dict__
+    values = [
+        getattr(obj, slot, None)
+        for cls in type(obj).__mro__
+        for slot in cls.__dict__.get("__slots__", ())
+    ]
+    values.extend(getattr(obj, "__dict__", {}).values())
+    return values
+
+
+def object_size(
+    obj: Any,
+    seen: Set[int],
+    skip: Tuple[Type, ...] = SHARED,
+    depth: int = 3,
+) -> int:
+    """Estimate the memory an object uses, including what it references.
+
+    References are followed up to `depth` levels, skipping objects that
+    were already counted and objects of the `skip` types, which are
+    accounted for separately (e.g. the guild a member belongs to).
+
+    Parameters
+    ----------
+    obj: Any
+        The object.
+    seen: Set[:class:`int`]
+        The IDs of the objects counted so far. Updated in place.
+    skip: Tuple[Type, ...]
+        The types of referenced objects not to count.
+    depth: :class:`int`
+        How many levels of references to follow. (Default: 3)
+
+    Returns
+    -------
+    :class:`int`
+        The estimated size in bytes.
+    """
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if depth <= 0 or isinstance(obj, LEAVES):
+        return size
+    for child in _children(obj):
+        if child is None or isinstance(child, skip):
+            continue
+        size += object_size(child, seen, skip, depth - 1)
+    return size
+
+
+def estimate(
+    objects: Iterable[Any], count: int, sample: int, skip: Tuple[Type, ...] = SHARED
+) -> int:
+    """Estimate the total size of many objects from the size of the first few.
+
+    Parameters
+    ----------
+    objects: Iterable[Any]
+        The objects.
+    count: :class:`int`
+        The total number of objects.
+    sample: :class:`int`
+        The number of objects to measure.
+    skip: Tuple[Type, ...]
+        The types of referenced objects not to count.
+
+    Returns
+    -------
+    :class:`int`
+        The estimated total size in bytes.
+    """
+    seen: Set[int] = set()
+    measured = 0
+    size = 0
+    for obj in itertools.islice(objects, sample):
+        size += object_size(obj, seen, skip)
+        measured += 1
+    return size * count // measured if measured else 0
+
+
+def rss_bytes() -> Optional[int]:
+    """Get the resident memory of the process, or `None` if not on Linux."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, IndexError, ValueError, AttributeError):
+        return None
+
+
+def cache_memory(
+    bot: commands.InteractionBot, sample: int = 500
+) -> Dict[str, Tuple[int, int]]:
+    """Estimate the memory used by each of disnake's caches.
+
+    Only `sample` objects of each cache are measured, the rest are
+    assumed to be the same size on average, so the report is cheap enough
+    to run on a large bot.
+
+    Parameters
+    ----------
+    bot: :class:`commands.InteractionBot`
+        The bot.
+    sample: :class:`int`
+        The number of objects to measure in each cache. (Default: 500)
+
+    Returns
+    -------
+    Dict[:class:`str`, Tuple[:class:`int`, :class:`int`]]
+        The number of objects and estimated size in bytes of the guilds
+        (with their channels, roles and emojis, but not members), members,
+        messages and views.
+    """
+    guilds = bot.guilds
+    # Everything a guild holds except its members, which are counted next
+    guild_parts: List[Any] = []
+    for guild in itertools.islice(guilds, sample):
+        guild_parts.append(guild)
+        guild_parts.extend(guild.channels)
+        guild_parts.extend(guild.threads)
+        guild_parts.extend(guild.roles)
+        guild_parts.extend(guild.emojis)
+        guild_parts.extend(guild.stickers)
+    guild_skip = SHARED + (
+        disnake.Member,
+        disnake.abc.GuildChannel,
+        disnake.Thread,
+        disnake.Role,
+        disnake.Emoji,
+        disnake.GuildSticker,
+    )
+    seen: Set[int] = set()
+    guild_bytes = sum(object_size(part, seen, guild_skip) for part in guild_parts)
+    if guilds:
+        guild_bytes = guild_bytes * len(guilds) // min(len(guilds), sample)
+
+    # `guild.members` would copy every guild's members into a new list
+    member_count = sum(len(guild._members) for guild in guilds)
+    members = (member for guild in guilds for member in guild._members.values())
+    member_skip = SHARED + (disnake.abc.GuildChannel, disnake.Role)
+
+    messages = bot.cached_messages
+    message_skip = SHARED + (disnake.abc.GuildChannel, disnake.Thread)
+
+    # disnake keeps the views waiting for interactions by message and custom
+    # ID, but only exposes the persistent ones
+    view_store = getattr(bot._connection, "_view_store", None)
+    stored = getattr(view_store, "_views", None)
+    if isinstance(stored, dict):
+        views = {id(view): view for view, _ in stored.values()}
+    else:
+        views = {id(view): view for view in bot.persistent_views}
+
+    return {
+        "guilds": (len(guilds), guild_bytes),
+        "members": (member_count, estimate(members, member_count, sample, member_skip)),
+        "messages": (
+            len(messages),
+            estimate(messages, len(messages), sample, message_skip),
+        ),
+        "views": (len(views), estimate(views.values(), len(views), sample)),
+    }
@@ -0,0 +1,433 @@
+import math
+import time
+import bisect
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import disnake
+import disnake.webhook.async_ as webhook_async
+from aiohttp import web
+from loguru import logger
+
+# Seconds. Discord fails an interaction that isn't responded to within 3
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    3.0,
+    5.0,
+    10.0,
+    30.0,
+)
+
+Labels = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Labels, **extra: str) -> str:
+    pairs = list(zip(names, values)) + list(extra.items())
+    if not pairs:
+        return ""
+    escaped = (
+        (
+            name,
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """The base class of the metrics in a :class:`MetricsRegistry`."""
+
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+
+
+class Counter(Metric):
+    """A value that only goes up, like a number of requests."""
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()) -> None:
+        super().__init__(name, help, labels)
+        self.values: Dict[Labels, float] = defaultdict(float)
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self.values[labels] += amount
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        for labels, value in self.values.items():
+            lines.append(
+                f"{self.name}{_format_labels(self.labels, labels)} {_format_value(value)}"
+            )
+        return lines
+
+
+class Gauge(Counter):
+    """A value that can go up and down, like a number of requests in flight."""
+
+    type = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.values[labels] -= amount
+
+    def set(self, *labels: str, value: float) -> None:
+        self.values[labels] = value
+
+
+class Histogram(Metric):
+    """Counts observations (like durations) in cumulative buckets.
+
+    Parameters
+    ----------
+    buckets: Sequence[:class:`float`]
+        The upper bounds of the buckets, in increasing order.
+    """
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets) + (math.inf,)
+        # labels -> (count per bucket, not cumulative), sum
+        self.values: Dict[Labels, List[int]] = {}
+        self.sums: Dict[Labels, float] = defaultdict(float)
+
+    def observe(self, *labels: str, value: float) -> None:
+        counts = self.values.get(labels)
+        if counts is None:
+            counts = self.values[labels] = [0] * len(self.buckets)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sums[labels] += value
+
+    def count(self, *labels: str) -> int:
+        return sum(self.values.get(labels, ()))
+
+    def quantile(self, q: float, *labels: str) -> Optional[float]:
+        """Estimate a quantile by interpolating inside its bucket, the same
+        way Prometheus' `histogram_quantile` does.
+
+        Parameters
+        ----------
+        q: :class:`float`
+            The quantile, between 0 and 1.
+
+        Returns
+        -------
+        Optional[:class:`float`]
+            The estimate, or `None` if nothing was observed.
+        """
+        counts = self.values.get(labels)
+        if not counts:
+            return None
+        rank = q * sum(counts)
+        seen = 0
+        for index, count in enumerate(counts):
+            if count and seen + count >= rank:
+                upper = self.buckets[index]
+                lower = self.buckets[index - 1] if index else 0.0
+                if math.isinf(upper):
+                    return lower
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return None
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        for labels, counts in self.values.items():
+            cumulative = 0
+            for upper, count in zip(self.buckets, counts):
+                cumulative += count
+                bucket = _format_labels(self.labels, labels, le=_format_value(upper))
+                lines.append(f"{self.name}_bucket{bucket} {cumulative}")
+            label_str = _format_labels(self.labels, labels)
+            lines.append(
+                f"{self.name}_sum{label_str} {_format_value(self.sums[labels])}"
+            )
+            lines.append(f"{self.name}_count{label_str} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds metrics and renders them in the Prometheus text format.
+
+    Besides its own metrics, the registry can render the numeric counters
+    of other components (anything with a `stats()` method) as gauges,
+    read when the metrics are scraped.
+
+    Parameters
+    ----------
+    prefix: :class:`str`
+        Prepended to the name of every metric.
+    """
+
+    def __init__(self, prefix: str = "mybot") -> None:
+        self.prefix = prefix
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: Dict[str, Callable[[], Mapping[str, Any]]] = {}
+
+    def _add(self, metric: Metric) -> Any:
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(f"{self.prefix}_{name}", help, labels))
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._add(Gauge(f"{self.prefix}_{name}", help, labels))
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._add(Histogram(f"{self.prefix}_{name}", help, labels, buckets))
+
+    def add_collector(self, name: str, stats: Callable[[], Mapping[str, Any]]) -> None:
+        """Render the numeric values of a `stats()` method as gauges.
+
+        Parameters
+        ----------
+        name: :class:`str`
+            The name of the component, used in the names of its gauges.
+        stats: Callable[[], Mapping[:class:`str`, Any]]
+            Returns the component's counters.
+        """
+        self._collectors[name] = stats
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        for component, stats in self._collectors.items():
+            try:
+                values = stats()
+            except Exception as e:
+                logger.warning(f"Failed to collect {component} stats: {e}")
+                continue
+            for key, value in values.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                name = f"{self.prefix}_{component}_{key}"
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class _ResponseRecorder:
+    """A webhook adapter that hands every request to disnake's adapter and
+    records the first response to each interaction in a :class:`CommandMetrics`.
+    """
+
+    def __init__(self, metrics: "CommandMetrics", adapter: Any) -> None:
+        self.metrics = metrics
+        self.adapter = adapter
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.adapter, name)
+
+    async def create_interaction_response(
+        self, interaction_id: int, *args: Any, **kwargs: Any
+    ) -> None:
+        await self.adapter.create_interaction_response(interaction_id, *args, **kwargs)
+        self.metrics.responded(interaction_id)
+
+
+class CommandMetrics:
+    """Measures how long application commands take.
+
+    For each command, records the time until the interaction got its first
+    response (a defer, message or modal), the total time until the command
+    finished, the number of uses and errors, and how many are in flight.
+    Durations are measured from when `on_slash_command` is handled, and
+    first responses are seen by :meth:`track_responses`.
+
+    Parameters
+    ----------
+    registry: :class:`MetricsRegistry`
+        The registry to add the metrics to.
+    """
+
+    # Interactions can't be responded to after 15 minutes, so anything
+    # older than that will never finish (e.g. an error handler swallowed it)
+    MAX_AGE = 15 * 60
+
+    def __init__(self, registry: MetricsRegistry) -> None:
+        self.first_response = registry.histogram(
+            "command_first_response_seconds",
+            "Time until a command's first interaction response.",
+            ["command"],
+        )
+        self.duration = registry.histogram(
+            "command_duration_seconds",
+            "Time until a command finished.",
+            ["command", "status"],
+        )
+        self.calls = registry.counter(
+            "commands_total", "Commands used.", ["command", "status"]
+        )
+        self.in_flight = registry.gauge(
+            "commands_in_flight", "Commands still running.", ["command"]
+        )
+        # interaction id -> (command, start, responded)
+        self._running: Dict[int, Tuple[str, float, bool]] = {}
+
+    def start(self, inter: disnake.ApplicationCommandInteraction) -> None:
+        """Start measuring a command. Call from `on_slash_command`."""
+        now = time.perf_counter()
+        for inter_id, (command, start, _) in list(self._running.items()):
+            if now - start > self.MAX_AGE:
+                del self._running[inter_id]
+                self.in_flight.dec(command)
+
+        command = inter.application_command.qualified_name
+        self._running[inter.id] = (command, now, inter.response.is_done())
+        self.in_flight.inc(command)
+
+    def responded(self, inter_id: int) -> None:
+        """Record a command's first interaction response."""
+        entry = self._running.get(inter_id)
+        if entry is None or entry[2]:
+            return
+        command, start, _ = entry
+        self._running[inter_id] = (command, start, True)
+        self.first_response.observe(command, value=time.perf_counter() - start)
+
+    def finish(
+        self, inter: disnake.ApplicationCommandInteraction, error: bool = False
+    ) -> None:
+        """Stop measuring a command. Call from `on_slash_command_completion`
+        and `on_slash_command_error`."""
+        status = "error" if error else "ok"
+        entry = self._running.pop(inter.id, None)
+        if entry is None:
+            # Failed before it was dispatched (e.g. a check failed)
+            self.calls.inc(inter.application_command.qualified_name, status)
+            return
+        command, start, _ = entry
+        self.duration.observe(command, status, value=time.perf_counter() - start)
+        self.calls.inc(command, status)
+        self.in_flight.dec(command)
+
+    def track_responses(self) -> None:
+        """Record the first response of the interaction being handled.
+
+        Interaction responses are sent through disnake's webhook adapter,
+        which it looks up in a context variable. This sets it, for the
+        current task and the tasks it starts only, to an adapter that
+        records responses into these metrics. Call from the bot's
+        interaction handling (e.g. `process_application_commands`) before
+        the command is invoked.
+        """
+        adapter = webhook_async.async_context.get()
+        if isinstance(adapter, _ResponseRecorder):
+            if adapter.metrics is self:
+                return
+            adapter = adapter.adapter
+        webhook_async.async_context.set(_ResponseRecorder(self, adapter))
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """Summarize every command that was used.
+
+        Returns
+        -------
+        List[Dict[:class:`str`, Any]]
+            For each command, sorted by the number of uses: its name, uses,
+            errors, commands in flight, and estimated p50/p99 durations and
+            p50 time to first response, in seconds.
+        """
+        commands = defaultdict(lambda: {"calls": 0, "errors": 0})
+        for (command, status), count in self.calls.values.items():
+            commands[command]["calls"] += int(count)
+            if status == "error":
+                commands[command]["errors"] += int(count)
+
+        summary = []
+        for command, counts in commands.items():
+            summary.append(
+                {
+                    "command": command,
+                    **counts,
+                    "in_flight": self.in_flight.values.get((command,), 0),
+                    "p50": self.duration.quantile(0.5, command, "ok"),
+                    "p99": self.duration.quantile(0.99, command, "ok"),
+                    "first_response_p50": self.first_response.quantile(0.5, command),
+                }
+            )
+        return sorted(summary, key=lambda entry: entry["calls"], reverse=True)
+
+
+class MetricsServer:
+    """Serves a registry's metrics over HTTP at `/metrics`.
+
+    Parameters
+    ----------
+    registry: :class:`MetricsRegistry`
+        The metrics to serve.
+    host: :class:`str`
+        The address to listen on. (Default: 127.0.0.1)
+    port: :class:`int`
+        The port to listen on.
+    """
+
+    def __init__(
+        self, registry: MetricsRegistry, host: str = "127.0.0.1", port: int = 9090
+    ) -> None:
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._runner: Optional[web.AppRunner] = None
+
+    async def _metrics(self, request: web.Request) -> web.Response:
+        return web.Response(
+            text=self.registry.render(),
+            content_type="text/plain",
+            headers={"X-Content-Type-Options": "nosniff"},
+            charset="utf-8",
+        )
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_get("/metrics", self._metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        try:
+            await web.TCPSite(self._runner, self.host, self.port).start()
+        except BaseException:
+            await self.close()
+            raise
+        logger.info(f"Serving metrics at http://{self.host}:{self.port}/metrics")
+
+    async def close(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,92 @@
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+import disnake
+
+
+class CacheProfile(NamedTuple):
+    """What the bot receives from the gateway and how much of it it caches.
+
+    Attributes
+    ----------
+    intents: :class:`disnake.Intents`
+        The gateway intents.
+    member_cache_flags: :class:`disnake.MemberCacheFlags`
+        Which members are cached.
+    chunk_guilds_at_startup: :class:`bool`
+        Whether every guild's members are requested when it becomes
+        available. Needs the members intent.
+    max_messages: Optional[:class:`int`]
+        The number of messages to cache, or `None` to cache none.
+    """
+
+    intents: disnake.Intents
+    member_cache_flags: disnake.MemberCacheFlags
+    chunk_guilds_at_startup: bool
+    max_messages: Optional[int]
+
+    def bot_kwargs(self) -> Dict[str, Any]:
+        """Get the profile as keyword arguments for the bot's constructor."""
+        return self._asdict()
+
+
+def full_profile() -> CacheProfile:
+    # Every member of every guild, fetched on startup
+    intents = disnake.Intents.default()
+    intents.members = True
+    intents.message_content = True
+    return CacheProfile(intents, disnake.MemberCacheFlags.all(), True, 1000)
+
+
+def lean_profile() -> CacheProfile:
+    # No member or presence events, so members are only cached while in
+    # a voice channel (from voice states), and only the most recent messages
+    intents = disnake.Intents.default()
+    intents.members = False
+    intents.presences = False
+    intents.message_content = True
+    flags = disnake.MemberCacheFlags.none()
+    flags.voice = True
+    return CacheProfile(intents, flags, False, 100)
+
+
+def minimal_profile() -> CacheProfile:
+    # Only guilds (for the guild events) and AutoMod rules (to keep the
+    # AutoMod cache up to date). Slash commands don't need any intents
+    intents = disnake.Intents.none()
+    intents.guilds = True
+    intents.automod_configuration = True
+    return CacheProfile(intents, disnake.MemberCacheFlags.none(), False, None)
+
+
+CACHE_PROFILES: Dict[str, Callable[[], CacheProfile]] = {
+    "full": full_profile,
+    "lean": lean_profile,
+    "minimal": minimal_profile,
+}
+
+
+def get_cache_profile(name: str) -> CacheProfile:
+    """Get a cache profile by name.
+
+    Parameters
+    ----------
+    name: :class:`str`
+        The name of the profile: `"full"`, `"lean"` or `"minimal"`.
+
+    Returns
+    -------
+    :class:`CacheProfile`
+        A new instance of the profile.
+
+    Raises
+    ------
+    ValueError
+        There is no profile with that name.
+    """
+    try:
+        return CACHE_PROFILES[name]()
+    except KeyError:
+        raise ValueError(
+            f"Unknown cache profile '{name}', expected one of: "
+            + ", ".join(CACHE_PROFILES)
+        ) from None
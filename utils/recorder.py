@@ -0,0 +1,441 @@
+import os
+import re
+import glob
+import json
+import time
+import zlib
+import struct
+import hashlib
+import functools
+from collections import Counter
+from datetime import datetime
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+import disnake
+from disnake.ext import commands
+from loguru import logger
+
+from .logs import QueuedSink
+
+# The start of every recording file, followed by length-prefixed records
+MAGIC = b"MYBOTREC\x01"
+# Every record is prefixed with its length as a big-endian 32-bit integer
+LENGTH = struct.Struct(">I")
+
+# Recorded URLs point here instead, so a replay can serve them locally
+PLACEHOLDER_URL = "http://recorded.invalid"
+
+DIGITS = re.compile(r"\d+")
+# Select menu values are IDs if they look like one, text otherwise
+SNOWFLAKE = re.compile(r"\d{15,20}")
+
+# Strings that are kept as they are: they describe how to parse or handle
+# a payload rather than who sent it. Every other string is anonymized
+KEPT_KEYS = frozenset(
+    {
+        "type",
+        "content_type",
+        "custom_id",
+        "component_type",
+        "locale",
+        "guild_locale",
+        "preferred_locale",
+        "status",
+        "desktop",
+        "mobile",
+        "web",
+        "permissions",
+        "allow",
+        "deny",
+        "app_permissions",
+        "features",
+        "region",
+        "rtc_region",
+        "timestamp",
+    }
+)
+
+# Keys of timestamps, which disnake parses, e.g. "joined_at"
+TIME_SUFFIXES = ("_at", "_timestamp", "_time", "_since", "_until")
+
+# The maps of an interaction's resolved users, channels, etc. by their IDs
+RESOLVED_KEYS = frozenset(
+    {"users", "members", "roles", "channels", "messages", "attachments"}
+)
+
+# Command options whose values are IDs: users, channels, roles, mentionables
+# and attachments
+ID_OPTION_TYPES = frozenset({6, 7, 8, 9, 11})
+
+
+class Anonymizer:
+    """Removes identifying information from gateway event payloads.
+
+    IDs are replaced with keyed hashes, so the same ID is always replaced
+    with the same one (the @everyone role still has its guild's ID,
+    members still belong to their guild), but the original can't be
+    recovered without the key. Every other string is anonymized unless
+    its key is known to hold no personal data (:data:`KEPT_KEYS`,
+    timestamps): numbers are hashed like IDs, URLs are replaced with
+    links to :data:`PLACEHOLDER_URL` and any other text (names, message
+    contents, AutoMod keywords, session IDs, ...) with a placeholder of
+    the same length. The names of commands and their options and the
+    custom IDs of components are kept, since they decide what the bot
+    does with an interaction.
+
+    Parameters
+    ----------
+    key: Optional[:class:`bytes`]
+        The key of the ID hashes. A random one if `None`, so that IDs are
+        only consistent within one recording session.
+    """
+
+    def __init__(self, key: Optional[bytes] = None) -> None:
+        self.key = key or os.urandom(32)
+
+    def __call__(self, event: str, data: Any) -> Any:
+        """Anonymize the payload of an event.
+
+        Parameters
+        ----------
+        event: :class:`str`
+            The name of the event, e.g. `"INTERACTION_CREATE"`.
+        data: Any
+            The payload of the event.
+
+        Returns
+        -------
+        Any
+            The anonymized payload.
+        """
+        if event == "INTERACTION_CREATE" and isinstance(data.get("data"), dict):
+            command = data.pop("data")
+            data = self._walk(data, None)
+            data["data"] = self._command(command)
+            return data
+        return self._walk(data, None)
+
+    def snowflake(self, value: str) -> str:
+        digest = hashlib.blake2b(value.encode(), key=self.key, digest_size=8).digest()
+        # Positive, and never 0
+        return str(int.from_bytes(digest) >> 1 | 1)
+
+    def text(self, value: str) -> str:
+        if value.startswith(("http://", "https://")):
+            # Keep the extension, some commands check what kind of file it is
+            path = value.split("?", 1)[0]
+            ext = os.path.splitext(path)[1] if "/" in path[8:] else ""
+            digest = hashlib.blake2b(value.encode(), key=self.key, digest_size=8)
+            return f"{PLACEHOLDER_URL}/files/{digest.hexdigest()}{ext[:8]}"
+        return "x" * len(value)
+
+    def _is_kept(self, key: Optional[str]) -> bool:
+        return key is not None and (key in KEPT_KEYS or key.endswith(TIME_SUFFIXES))
+
+    def _walk(self, value: Any, key: Optional[str]) -> Any:
+        if isinstance(value, dict):
+            by_id = key in RESOLVED_KEYS
+            result = {}
+            for k, v in value.items():
+                if by_id and DIGITS.fullmatch(k):
+                    result[self.snowflake(k)] = self._walk(v, None)
+                else:
+                    result[k] = self._walk(v, k)
+            return result
+        if isinstance(value, list):
+            # List items are treated like the value of the list's key
+            return [self._walk(item, key) for item in value]
+        if isinstance(value, str):
+            if self._is_kept(key):
+                return value
+            if DIGITS.fullmatch(value):
+                # IDs, and numbers that might be parsed as one
+                return self.snowflake(value)
+            return self.text(value)
+        return value
+
+    def _command(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        # The data of an application command, component or modal interaction
+        result = {}
+        for key, value in data.items():
+            if key in ("name", "type", "custom_id", "component_type"):
+                result[key] = value
+            elif key == "options":
+                result[key] = [self._option(option) for option in value]
+            elif key == "values":
+                # The selected options of a select menu
+                result[key] = [
+                    self.snowflake(v) if SNOWFLAKE.fullmatch(v) else self.text(v)
+                    for v in value
+                ]
+            else:
+                result[key] = self._walk(value, key)
+        return result
+
+    def _option(self, option: Dict[str, Any]) -> Dict[str, Any]:
+        result = dict(option)
+        if "options" in option:
+            result["options"] = [self._option(o) for o in option["options"]]
+        value = option.get("value")
+        if isinstance(value, str):
+            if option.get("type") in ID_OPTION_TYPES:
+                result["value"] = self.snowflake(value)
+            else:
+                result["value"] = self.text(value)
+        return result
+
+
+def encode_record(timestamp: int, event: str, data: Any) -> bytes:
+    """Encode a record as compressed, compact JSON, prefixed with its length.
+
+    Parameters
+    ----------
+    timestamp: :class:`int`
+        When the event was received, in milliseconds since the epoch.
+    event: :class:`str`
+        The name of the event.
+    data: Any
+        The payload of the event.
+
+    Returns
+    -------
+    :class:`bytes`
+        The encoded record.
+    """
+    body = json.dumps([timestamp, event, data], separators=(",", ":")).encode()
+    body = zlib.compress(body, 1)
+    return LENGTH.pack(len(body)) + body
+
+
+def _read_file(path: str) -> Iterator[Tuple[int, str, Any]]:
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a recording")
+        while header := f.read(LENGTH.size):
+            body = (
+                f.read(LENGTH.unpack(header)[0]) if len(header) == LENGTH.size else b""
+            )
+            try:
+                timestamp, event, data = json.loads(zlib.decompress(body))
+            except (zlib.error, ValueError):
+                # Cut off by a crash while writing, nothing follows it
+                logger.warning(f"Skipped a truncated record at the end of {path}")
+                return
+            yield timestamp, event, data
+
+
+def read_recording(paths: Iterable[str]) -> Iterator[Tuple[int, str, Any]]:
+    """Read the records of one or more recording files, oldest first.
+
+    Parameters
+    ----------
+    paths: Iterable[:class:`str`]
+        The recording files, e.g. the current one and the ones rotated
+        out of it, in any order.
+
+    Yields
+    ------
+    Tuple[:class:`int`, :class:`str`, Any]
+        The timestamp in milliseconds since the epoch, name and payload
+        of each recorded event.
+
+    Raises
+    ------
+    ValueError
+        A file is not a recording.
+    """
+
+    def first_timestamp(path: str) -> int:
+        return next((record[0] for record in _read_file(path)), 0)
+
+    for path in sorted(paths, key=first_timestamp):
+        yield from _read_file(path)
+
+
+def recording_path(path: str, cluster_id: Optional[int] = None) -> str:
+    """Get the path of the recording file, which is separate for every cluster.
+
+    Parameters
+    ----------
+    path: :class:`str`
+        The configured path, e.g. `recordings/traffic.rec`.
+    cluster_id: Optional[:class:`int`]
+        The ID of the cluster, or `None` if not running in cluster mode.
+
+    Returns
+    -------
+    :class:`str`
+        The path of the recording file.
+    """
+    if cluster_id is None:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.cluster-{cluster_id}{ext}"
+
+
+class RecordingFile:
+    """A file of length-prefixed records that is rotated when it gets too big.
+
+    Rotated files are renamed with a timestamp, and the oldest are deleted
+    so that at most `max_files` files are kept, including the current one.
+    Only meant to be used from a single thread, like a
+    :class:`QueuedSink`'s writer.
+
+    Parameters
+    ----------
+    path: :class:`str`
+        The path of the file.
+    max_bytes: :class:`int`
+        The size to rotate the file at.
+    max_files: :class:`int`
+        The number of files to keep.
+    """
+
+    def __init__(self, path: str, max_bytes: int, max_files: int) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.rotations = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._open()
+
+    def _open(self) -> None:
+        self._file: BinaryIO = open(self.path, "ab")
+        self.size = self._file.tell()
+        if not self.size:
+            self._file.write(MAGIC)
+            self.size = len(MAGIC)
+
+    def write(self, record: bytes) -> None:
+        if self.size + len(record) > self.max_bytes and self.size > len(MAGIC):
+            self._rotate()
+        self._file.write(record)
+        self.size += len(record)
+
+    def _rotate(self) -> None:
+        self._file.close()
+        root, ext = os.path.splitext(self.path)
+        os.replace(self.path, f"{root}.{datetime.now():%Y-%m-%d_%H-%M-%S-%f}{ext}")
+        self.rotations += 1
+
+        # The timestamps sort by age
+        rotated = sorted(glob.glob(f"{glob.escape(root)}.????-??-??_*{ext}"))
+        for path in rotated[: max(0, len(rotated) - self.max_files + 1)]:
+            os.remove(path)
+        self._open()
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class TrafficRecorder:
+    """Records the gateway events the bot receives, to replay them later.
+
+    Every event is appended to a rotating file as an anonymized (see
+    :class:`Anonymizer`), compressed record, with the time it was
+    received. Replaying a recording with `benchmarks/replay.py` feeds the
+    same events to a bot wired to local stand-ins, at the same pace, so
+    production load (the real mix of commands, the bursts of events after
+    a shard reconnects) can be reproduced offline.
+
+    Events are taken from disnake's parsers, before they are handled. The
+    only work done on the event loop is serializing the payload and
+    queueing it; anonymizing, compressing and writing happen in a
+    background thread. If the thread falls behind, events are dropped
+    instead of slowing the bot down, and counted.
+
+    Parameters
+    ----------
+    bot: :class:`commands.InteractionBot`
+        The bot.
+    path: :class:`str`
+        The path of the recording file.
+    max_bytes: :class:`int`
+        The size to rotate the file at. (Default: 64 MiB)
+    max_files: :class:`int`
+        The number of files to keep, including the current one. (Default: 10)
+    events: Optional[Iterable[:class:`str`]]
+        The names of the events to record, e.g. `INTERACTION_CREATE`, or
+        `None` to record every event.
+    queue_size: :class:`int`
+        The maximum number of events waiting to be written. (Default: 10000)
+    """
+
+    def __init__(
+        self,
+        bot: commands.InteractionBot,
+        path: str,
+        max_bytes: int = 64 * 1024**2,
+        max_files: int = 10,
+        events: Optional[Iterable[str]] = None,
+        queue_size: int = 10000,
+    ) -> None:
+        self.path = path
+        self.anonymize = Anonymizer()
+        self.file = RecordingFile(path, max_bytes, max_files)
+        self.sink = QueuedSink(
+            self._write, self.file.flush, queue_size, name="traffic-recorder"
+        )
+        self.events: Counter[str] = Counter()
+        self.commands: Counter[str] = Counter()
+
+        parsers: Dict[str, Callable[[Any], Any]] = bot._connection.parsers
+        for event, parser in parsers.items():
+            if events is None or event in events:
+                parsers[event] = self._wrap(event, parser)
+        bot.add_listener(self.on_slash_command, "on_slash_command")
+        logger.info(f"Recording gateway events to {path}")
+
+    def _wrap(self, event: str, parser: Callable[[Any], Any]) -> Callable[[Any], Any]:
+        @functools.wraps(parser)
+        def wrapper(data: Any) -> Any:
+            # Serialized now, since handling the event may change the payload
+            self.sink.write(
+                f'[{time.time_ns() // 1_000_000},"{event}",'
+                f"{json.dumps(data, separators=(',', ':'))}]"
+            )
+            self.events[event] += 1
+            return parser(data)
+
+        return wrapper
+
+    def _write(self, message: str) -> None:
+        timestamp, event, data = json.loads(message)
+        self.file.write(encode_record(timestamp, event, self.anonymize(event, data)))
+
+    async def on_slash_command(
+        self, inter: disnake.ApplicationCommandInteraction
+    ) -> None:
+        # The mix of commands in the recording, for the stats
+        self.commands[inter.application_command.qualified_name] += 1
+
+    def close(self) -> None:
+        """Write every queued event and close the file."""
+        self.sink.stop()
+        self.file.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the counters of the recorder.
+
+        Returns
+        -------
+        Dict[:class:`str`, Any]
+            The number of events recorded, dropped and waiting to be
+            written, the size of the current file, the number of rotations,
+            and the number of recorded events and commands by name.
+        """
+        sink = self.sink.stats()
+        return {
+            "path": self.path,
+            "recorded": sink["written"],
+            "dropped": sink["dropped"],
+            "errors": sink["errors"],
+            "queued": sink["depth"],
+            "file_bytes": self.file.size,
+            "rotations": self.file.rotations,
+            "events": dict(self.events),
+            "commands": dict(self.commands),
+        }
@@ -0,0 +1,290 @@
+import time
+import asyncio
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence, Set
+
+from disnake.ext import commands
+from disnake.gateway import DiscordWebSocket
+from disnake.shard import Shard
+from beanie.operators import In
+from loguru import logger
+
+import models
+from .metrics import MetricsRegistry
+
+# Shards take from seconds (resumed) to minutes (identified with many guilds)
+READY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+class SessionResumer:
+    """Resumes the shards' gateway sessions across restarts.
+
+    When the bot shuts down gracefully, every shard's session ID, last
+    sequence number and resume URL are saved. The connections are closed
+    with a code that keeps the sessions alive on Discord's side. On the
+    next startup, shards with a session saved less than `max_age` seconds
+    ago send RESUME instead of IDENTIFY. Discord then only replays the
+    events missed while offline: there is no identify rate limit to wait
+    for and no GUILD_CREATE for every guild. If Discord rejects a session,
+    disnake identifies the shard as usual.
+
+    The catch is that the cache starts cold. The guilds, channels and
+    members of resumed shards aren't cached until Discord sends them
+    again (e.g. in a guild update), so `bot.guilds` is incomplete and
+    events in uncached guilds are mostly ignored by disnake. Only enable
+    this if the bot doesn't rely on a complete cache.
+
+    How long each shard took to get ready is recorded separately for
+    resumed and identified shards, to compare the two.
+
+    disnake has no public API for resuming a session on startup, so this
+    relies on some of its internals. If a disnake release changes them,
+    sessions are neither saved nor resumed and every shard identifies.
+
+    Parameters
+    ----------
+    bot: :class:`commands.AutoShardedInteractionBot`
+        The bot.
+    max_age: :class:`float`
+        The number of seconds a saved session is tried for.
+    registry: :class:`MetricsRegistry`
+        The registry to add the metrics to.
+    """
+
+    def __init__(
+        self,
+        bot: commands.AutoShardedInteractionBot,
+        max_age: float,
+        registry: MetricsRegistry,
+    ) -> None:
+        self.bot = bot
+        self.max_age = max_age
+        self._saved: Dict[int, models.GatewaySession] = {}
+        # When each shard started connecting, until it's ready
+        self._launched: Dict[int, float] = {}
+        # Shards that sent RESUME, until they got RESUMED or READY
+        self._resuming: Set[int] = set()
+        # How each shard got ready ("resumed" or "identified") and how long it took
+        self.modes: Dict[int, str] = {}
+        self.ready_seconds: Dict[str, List[float]] = defaultdict(list)
+
+        self.shard_ready = registry.histogram(
+            "shard_ready_seconds",
+            "Time from connecting a shard until it was ready, by how its session started.",
+            ["mode"],
+            buckets=READY_BUCKETS,
+        )
+        self.sessions = registry.counter(
+            "gateway_sessions_total",
+            "Saved gateway sessions, by what happened to them.",
+            ["outcome"],
+        )
+
+        self.supported = self._check_internals()
+        if not self.supported and max_age:
+            logger.warning(
+                "This version of disnake can't resume gateway sessions on "
+                "startup, every shard will identify"
+            )
+
+        bot.add_listener(self.on_shard_connect, "on_shard_connect")
+        bot.add_listener(self.on_shard_resumed, "on_shard_resumed")
+        bot.add_listener(self.on_shard_ready, "on_shard_ready")
+
+    def _check_internals(self) -> bool:
+        """Check that the disnake internals :meth:`resume` and :meth:`save`
+        use still exist."""
+        return (
+            isinstance(getattr(self.bot, "_AutoShardedClient__shards", None), dict)
+            and hasattr(self.bot, "_AutoShardedClient__queue")
+            and callable(getattr(Shard, "_cancel_task", None))
+            and callable(getattr(Shard, "launch", None))
+        )
+
+    async def load(self, shard_ids: Optional[Sequence[int]] = None) -> int:
+        """Load the sessions saved by the last run.
+
+        Loaded sessions are deleted from the database, since a session
+        can only be resumed once.
+
+        Parameters
+        ----------
+        shard_ids: Optional[Sequence[:class:`int`]]
+            Only load the sessions of these shards (e.g. those of this
+            cluster). Loads every session if `None`.
+
+        Returns
+        -------
+        :class:`int`
+            The number of sessions that are recent enough to resume.
+        """
+        query = models.GatewaySession.find(
+            *(
+                [In(models.GatewaySession.shard_id, list(shard_ids))]
+                if shard_ids
+                else []
+            )
+        )
+        now = datetime.now(timezone.utc)
+        async for session in query:
+            # The database returns naive datetimes in UTC
+            age = now - session.saved_at.replace(tzinfo=timezone.utc)
+            if age.total_seconds() > self.max_age:
+                self.sessions.inc("expired")
+            else:
+                self._saved[session.shard_id] = session
+        await query.delete()
+        return len(self._saved)
+
+    async def resume(self, shard_id: int, initial: bool = False) -> bool:
+        """Connect a shard by resuming its saved session, if it has one.
+
+        Parameters
+        ----------
+        shard_id: :class:`int`
+            The ID of the shard.
+        initial: :class:`bool`
+            Whether this is the first shard to connect.
+
+        Returns
+        -------
+        :class:`bool`
+            Whether the shard was connected. If not, it should identify.
+        """
+        self._launched[shard_id] = time.perf_counter()
+        session = self._saved.pop(shard_id, None)
+        if session is None or not self.supported:
+            return False
+        if session.shard_count != self.bot.shard_count:
+            self.sessions.inc("expired")
+            return False
+
+        # The application ID is only sent in READY
+        if self.bot._connection.application_id is None:
+            self.bot._connection.application_id = session.application_id
+        try:
+            ws = await asyncio.wait_for(
+                DiscordWebSocket.from_client(
+                    self.bot,
+                    initial=initial,
+                    gateway=session.resume_url,
+                    shard_id=shard_id,
+                    session=session.session_id,
+                    sequence=session.sequence,
+                    resume=True,
+                ),
+                timeout=30.0,
+            )
+        except Exception as e:
+            logger.warning(
+                f"Failed to resume shard {shard_id}, identifying instead: "
+                f"{type(e).__name__}: {e}"
+            )
+            self.sessions.inc("failed")
+            return False
+
+        # disnake has no public way to add a shard with an existing session,
+        # so this does what `AutoShardedClient.launch_shard` does with a new one
+        shard = Shard(ws, self.bot, self.bot._AutoShardedClient__queue.put_nowait)
+        self.bot._AutoShardedClient__shards[shard_id] = shard
+        shard.launch()
+        self._resuming.add(shard_id)
+        return True
+
+    async def save(self) -> int:
+        """Save every connected shard's session and disconnect the shard
+        without ending the session. Call before closing the bot.
+
+        Returns
+        -------
+        :class:`int`
+            The number of sessions saved.
+        """
+        if not self.supported:
+            return 0
+        sessions = []
+        for shard_id, shard in self.bot._AutoShardedClient__shards.items():
+            ws = shard.ws
+            if ws.session_id is None or ws.resume_gateway is None:
+                continue
+            # Stop reading events first, so the sequence is the last one handled
+            shard._cancel_task()
+            sessions.append(
+                models.GatewaySession(
+                    shard_id=shard_id,
+                    shard_count=self.bot.shard_count,
+                    application_id=self.bot.application_id,
+                    session_id=ws.session_id,
+                    sequence=ws.sequence,
+                    resume_url=ws.resume_gateway,
+                )
+            )
+            # Closing with 1000 (like disnake does) would end the session
+            await ws.close(code=4000)
+
+        if sessions:
+            await models.GatewaySession.find(
+                In(models.GatewaySession.shard_id, [s.shard_id for s in sessions])
+            ).delete()
+            await models.GatewaySession.insert_many(sessions)
+            self.sessions.inc("saved", amount=len(sessions))
+        logger.info(f"Saved {len(sessions)} gateway sessions for resuming")
+        return len(sessions)
+
+    def _ready(self, shard_id: int, mode: str) -> None:
+        launched = self._launched.pop(shard_id, None)
+        if launched is None:
+            return
+        seconds = time.perf_counter() - launched
+        self.modes[shard_id] = mode
+        self.ready_seconds[mode].append(seconds)
+        self.shard_ready.observe(mode, value=seconds)
+        logger.debug(f"Shard {shard_id} {mode} and ready in {seconds * 1000:.0f}ms")
+
+    async def on_shard_connect(self, shard_id: int):
+        # Only dispatched for READY, so Discord rejected the resumed session
+        if shard_id in self._resuming:
+            self._resuming.discard(shard_id)
+            self.sessions.inc("invalidated")
+            logger.info(f"Shard {shard_id} couldn't resume its session, identified")
+
+    async def on_shard_ready(self, shard_id: int):
+        self._ready(shard_id, "identified")
+
+    async def on_shard_resumed(self, shard_id: int):
+        # Also dispatched for resumes after connection drops, which don't count
+        if shard_id not in self._resuming:
+            return
+        self._resuming.discard(shard_id)
+        self.sessions.inc("resumed")
+        self._ready(shard_id, "resumed")
+
+        # READY isn't sent for resumed sessions, so disnake never considers
+        # the bot connected (or ready, if no shard identified)
+        connection = self.bot._connection
+        connection.call_handlers("connect_internal")
+        shard_ids = self.bot.shard_ids or range(self.bot.shard_count)
+        if not self.bot.is_ready() and all(
+            self.modes.get(s) == "resumed" for s in shard_ids
+        ):
+            connection.call_handlers("ready")
+            self.bot.dispatch("ready")
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the number of resumed and identified shards and how long
+        they took to get ready on average.
+
+        Returns
+        -------
+        Dict[:class:`str`, Any]
+            The counters, keyed by `<mode>_shards` and `<mode>_ready_seconds`.
+        """
+        stats = {}
+        for mode in ("resumed", "identified"):
+            seconds = self.ready_seconds[mode]
+            stats[f"{mode}_shards"] = len(seconds)
+            stats[f"{mode}_ready_seconds"] = (
+                sum(seconds) / len(seconds) if seconds else None
+            )
+        return stats
@@ -0,0 +1,611 @@
+import os
+import time
+import random
+import socket
+import asyncio
+import inspect
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, FrozenSet, List, MutableSet, Optional, Union
+
+from beanie import UpdateResponse
+from beanie.operators import Or, Set, SetOnInsert
+from loguru import logger
+from pymongo.errors import PyMongoError
+
+import models
+from .metrics import MetricsRegistry
+from .executor import WorkerPool
+
+# Jobs take from milliseconds (a cache sweep) to minutes (a report)
+JOB_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+JobFunc = Callable[[], Any]
+
+
+def utcnow() -> datetime:
+    """Get the current time in UTC, truncated to the milliseconds MongoDB stores."""
+    return _truncate(datetime.now(timezone.utc))
+
+
+def _truncate(dt: datetime) -> datetime:
+    return dt.replace(microsecond=dt.microsecond // 1000 * 1000)
+
+
+def _as_utc(dt: datetime) -> datetime:
+    # The database returns naive datetimes in UTC
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt
+
+
+class IntervalSchedule:
+    """Runs a job every `seconds` seconds, counted from when each run starts.
+
+    Parameters
+    ----------
+    seconds: :class:`float`
+        The interval.
+    """
+
+    def __init__(self, seconds: float) -> None:
+        if seconds <= 0:
+            raise ValueError("The interval must be positive")
+        self.seconds = seconds
+
+    def next_after(self, dt: datetime) -> datetime:
+        return dt + timedelta(seconds=self.seconds)
+
+    def __repr__(self) -> str:
+        return f"every {self.seconds:g}s"
+
+
+def _parse_cron_field(field: str, low: int, high: int) -> FrozenSet[int]:
+    values = set()
+    for part in field.split(","):
+        span, _, step = part.partition("/")
+        step = int(step) if step else 1
+        if span == "*":
+            start, end = low, high
+        elif "-" in span:
+            start, end = map(int, span.split("-", 1))
+        else:
+            # "5/15" means from 5 to the end, every 15
+            start = int(span)
+            end = high if step != 1 else start
+        if not low <= start <= end <= high or step < 1:
+            raise ValueError(f"Invalid cron field '{field}'")
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+
+class CronSchedule:
+    """Runs a job at the times matching a cron expression, in UTC.
+
+    The expression has five fields: minute, hour, day of the month, month
+    and day of the week (0 to 6 from Sunday, 7 is Sunday too). Each field
+    is `*`, a number, a range `a-b`, a step `*/n` or `a-b/n`, or a
+    comma-separated list of those. Like cron, if both day fields are
+    restricted, days matching either one match.
+
+    Parameters
+    ----------
+    expression: :class:`str`
+        The cron expression, e.g. `"0 4 * * *"` for every day at 04:00.
+
+    Raises
+    ------
+    ValueError
+        The expression is invalid.
+    """
+
+    def __init__(self, expression: str) -> None:
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Expected 5 fields in cron expression '{expression}'")
+        self.expression = expression
+        self.minutes = _parse_cron_field(fields[0], 0, 59)
+        self.hours = _parse_cron_field(fields[1], 0, 23)
+        self.days = _parse_cron_field(fields[2], 1, 31)
+        self.months = _parse_cron_field(fields[3], 1, 12)
+        self.weekdays = frozenset(day % 7 for day in _parse_cron_field(fields[4], 0, 7))
+        self._either_day = fields[2] != "*" and fields[4] != "*"
+
+    def _day_matches(self, dt: datetime) -> bool:
+        # Python counts from Monday, cron from Sunday
+        weekday = (dt.weekday() + 1) % 7
+        if self._either_day:
+            return dt.day in self.days or weekday in self.weekdays
+        return dt.day in self.days and weekday in self.weekdays
+
+    def next_after(self, dt: datetime) -> datetime:
+        dt = dt.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        # Some expressions never match, e.g. February 30th
+        limit = dt + timedelta(days=5 * 366)
+        while dt < limit:
+            if dt.month not in self.months:
+                # The first day of the next month
+                dt = dt.replace(day=1, hour=0, minute=0) + timedelta(days=32)
+                dt = dt.replace(day=1)
+            elif not self._day_matches(dt):
+                dt = dt.replace(hour=0, minute=0) + timedelta(days=1)
+            elif dt.hour not in self.hours:
+                dt = dt.replace(minute=0) + timedelta(hours=1)
+            elif dt.minute not in self.minutes:
+                dt += timedelta(minutes=1)
+            else:
+                return dt
+        raise ValueError(f"Cron expression '{self.expression}' never matches")
+
+    def __repr__(self) -> str:
+        return f"cron '{self.expression}'"
+
+
+class Job:
+    """A job registered with a :class:`Scheduler`.
+
+    Attributes
+    ----------
+    name: :class:`str`
+        The name of the job.
+    func: Callable[[], Any]
+        The function that does the work. Coroutine functions run on the
+        event loop, anything else in the scheduler's pool.
+    schedule: Union[:class:`IntervalSchedule`, :class:`CronSchedule`]
+        When the job runs.
+    jitter: :class:`float`
+        The maximum number of seconds each run is randomly delayed by.
+    max_concurrency: :class:`int`
+        The maximum number of runs at once. Runs that are due while the
+        limit is reached are skipped.
+    timeout: Optional[:class:`float`]
+        How many seconds a run may take, or `None` for no limit.
+    key: :class:`str`
+        The key of the job's state in the database.
+    next_run: Optional[:class:`datetime.datetime`]
+        When the job runs next, once the scheduler has started.
+    last_duration: Optional[:class:`float`]
+        How many seconds the last run in this process took.
+    last_error: Optional[:class:`str`]
+        Why the last run in this process failed, `None` if it succeeded.
+    stuck: :class:`int`
+        The number of blocking runs that timed out but are still running
+        in their worker.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        func: JobFunc,
+        schedule: Union[IntervalSchedule, CronSchedule],
+        jitter: float,
+        max_concurrency: int,
+        timeout: Optional[float],
+        key: str,
+    ) -> None:
+        self.name = name
+        self.func = func
+        self.blocking = not inspect.iscoroutinefunction(func)
+        self.schedule = schedule
+        self.jitter = jitter
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.key = key
+        self.next_run: Optional[datetime] = None
+        self.running = 0
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.stuck = 0
+        self.last_duration: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+        self._runs: MutableSet[asyncio.Task] = set()
+
+    def next_after(self, dt: datetime) -> datetime:
+        jitter = timedelta(seconds=random.uniform(0, self.jitter))
+        return _truncate(self.schedule.next_after(dt) + jitter)
+
+
+class Scheduler:
+    """Runs background jobs on intervals or cron schedules.
+
+    Cogs register jobs with :meth:`add`. Each job's next and last run are
+    stored in MongoDB, so a restart neither runs a job again early nor
+    skips it: a run that was missed while the bot was down happens right
+    away, once. Every run is claimed with an atomic update of the job's
+    next run time, so if several processes have the same job, only one of
+    them runs each time. Jobs that can't overlap also take a lease while
+    they run, until they finish or their timeout passes, and runs that
+    come due in the meantime are skipped, in every process.
+
+    Jobs that aren't shared run in every process (e.g. cleaning a
+    directory each process has its own of), with their state stored
+    per instance.
+
+    Coroutine functions run on the event loop, other functions are
+    considered blocking and run in a :class:`WorkerPool`. The duration
+    and outcome of every run are recorded in the metrics.
+
+    Parameters
+    ----------
+    registry: :class:`MetricsRegistry`
+        The registry to add the metrics to.
+    instance: :class:`str`
+        The name of this bot process, e.g. `"cluster-0"`. (Default: main)
+    pool: Optional[:class:`WorkerPool`]
+        The pool to run blocking jobs in (e.g. the bot's thread pool).
+        Without one, they run in the event loop's default executor.
+    """
+
+    # How long to wait before trying again when the database fails
+    RETRY_DELAY = 30.0
+    # The longest sleep, so changes to the system clock are noticed
+    MAX_SLEEP = 60.0
+    # How long jobs without a timeout hold their lease
+    DEFAULT_LEASE = 3600.0
+
+    def __init__(
+        self,
+        registry: MetricsRegistry,
+        instance: str = "main",
+        pool: Optional[WorkerPool] = None,
+    ) -> None:
+        self.instance = instance
+        # Tells this process's leases apart from those of others
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.jobs: Dict[str, Job] = {}
+        self.pool = pool
+        self._started = False
+
+        self.duration = registry.histogram(
+            "job_duration_seconds",
+            "Time a background job run took, by outcome.",
+            ["job", "status"],
+            buckets=JOB_BUCKETS,
+        )
+        self.runs = registry.counter(
+            "job_runs_total", "Background job runs, by outcome.", ["job", "status"]
+        )
+        self.skipped = registry.counter(
+            "job_skipped_total",
+            "Background job runs skipped because the last one was still running.",
+            ["job"],
+        )
+        self.in_flight = registry.gauge(
+            "jobs_running", "Background job runs in progress.", ["job"]
+        )
+        self.stuck = registry.gauge(
+            "jobs_stuck",
+            "Blocking job runs that timed out but are still running in a worker.",
+            ["job"],
+        )
+
+    def add(
+        self,
+        name: str,
+        func: JobFunc,
+        *,
+        every: Optional[float] = None,
+        cron: Optional[str] = None,
+        jitter: float = 0.0,
+        max_concurrency: int = 1,
+        timeout: Optional[float] = None,
+        shared: bool = False,
+    ) -> Job:
+        """Register a job. It starts running once the scheduler has started.
+
+        Parameters
+        ----------
+        name: :class:`str`
+            The name of the job, unique to the bot.
+        func: Callable[[], Any]
+            The function that does the work. Coroutine functions run on the
+            event loop, anything else in a worker thread.
+        every: Optional[:class:`float`]
+            Run the job every this many seconds.
+        cron: Optional[:class:`str`]
+            Run the job at the times matching this cron expression, in UTC
+            (see :class:`CronSchedule`). Exactly one of `every` and `cron`
+            must be given.
+        jitter: :class:`float`
+            Delay every run by a random number of seconds up to this, so
+            jobs of many processes don't all start at once. (Default: 0)
+        max_concurrency: :class:`int`
+            The maximum number of runs at once. With 1, runs that come due
+            while the job is still running (in any process) are skipped.
+            (Default: 1)
+        timeout: Optional[:class:`float`]
+            How many seconds a run may take before it is cancelled. Blocking
+            jobs can't be interrupted, so after the timeout their run is
+            recorded as timed out, but it counts as running (and stuck) and
+            keeps its lease until it returns. (Default: no limit)
+        shared: :class:`bool`
+            Run the job in only one of the bot's processes, instead of in
+            every one of them. (Default: False)
+
+        Returns
+        -------
+        :class:`Job`
+            The registered job.
+
+        Raises
+        ------
+        ValueError
+            The name is taken, or the schedule is missing or invalid.
+        """
+        if name in self.jobs:
+            raise ValueError(f"A job named '{name}' is already registered")
+        if (every is None) == (cron is None):
+            raise ValueError("Pass exactly one of `every` and `cron`")
+        schedule = IntervalSchedule(every) if every is not None else CronSchedule(cron)
+        key = name if shared else f"{name}@{self.instance}"
+        job = Job(name, func, schedule, jitter, max_concurrency, timeout, key)
+        self.jobs[name] = job
+        if self._started:
+            job._task = asyncio.create_task(self._loop(job))
+        return job
+
+    def remove(self, name: str) -> None:
+        """Unregister a job, cancelling it if it's running.
+
+        Parameters
+        ----------
+        name: :class:`str`
+            The name of the job.
+        """
+        job = self.jobs.pop(name, None)
+        if job is None:
+            return
+        for task in (job._task, *job._runs):
+            if task is not None:
+                task.cancel()
+
+    def start(self) -> None:
+        """Start running the registered jobs, and those registered later."""
+        self._started = True
+        for job in self.jobs.values():
+            if job._task is None:
+                job._task = asyncio.create_task(self._loop(job))
+
+    async def close(self) -> None:
+        """Cancel every job."""
+        self._started = False
+        tasks = []
+        for job in self.jobs.values():
+            tasks.extend(task for task in (job._task, *job._runs) if task is not None)
+            job._task = None
+        for task in tasks:
+            task.cancel()
+        # Blocking jobs can't be interrupted, they finish in their pool
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _load(self, job: Job) -> None:
+        """Load the job's state, creating it if the job never ran."""
+        now = utcnow()
+        state = models.JobState(key=job.key, next_run=job.next_after(now))
+        state = await models.JobState.find_one(models.JobState.key == job.key).update(
+            SetOnInsert({"_id": state.id, "next_run": state.next_run}),
+            upsert=True,
+            response_type=UpdateResponse.NEW_DOCUMENT,
+        )
+        job.next_run = _as_utc(state.next_run)
+
+        # The schedule may have changed since the next run was planned
+        latest = job.schedule.next_after(now) + timedelta(seconds=job.jitter)
+        if job.next_run > latest:
+            await self._advance(job, job.next_after(now))
+
+    async def _advance(self, job: Job, next_run: datetime, **fields: Any) -> bool:
+        """Move the job's next run, unless another process already did."""
+        state = await models.JobState.find_one(
+            models.JobState.key == job.key, models.JobState.next_run == job.next_run
+        ).update(
+            Set({"next_run": next_run, **fields}),
+            response_type=UpdateResponse.NEW_DOCUMENT,
+        )
+        if state is None:
+            return False
+        job.next_run = next_run
+        return True
+
+    async def _loop(self, job: Job) -> None:
+        while True:
+            try:
+                if job.next_run is None:
+                    await self._load(job)
+                delay = (job.next_run - utcnow()).total_seconds()
+                if delay > 0:
+                    await asyncio.sleep(min(delay, self.MAX_SLEEP))
+                    continue
+                await self._claim(job)
+            except PyMongoError as e:
+                logger.warning(f"Failed to schedule job {job.name}: {e}")
+                await asyncio.sleep(self.RETRY_DELAY)
+
+    async def _claim(self, job: Job) -> None:
+        """Claim the job's due run, or skip it if the job is still running."""
+        now = utcnow()
+        next_run = job.next_after(now)
+        if job.running < job.max_concurrency:
+            fields = {"last_run": now}
+            criteria = [
+                models.JobState.key == job.key,
+                models.JobState.next_run == job.next_run,
+            ]
+            if job.max_concurrency == 1:
+                # Not while another process is running it
+                lease = job.timeout if job.timeout is not None else self.DEFAULT_LEASE
+                fields["lease_owner"] = self.owner
+                fields["lease_until"] = now + timedelta(seconds=lease)
+                criteria.append(
+                    Or(
+                        models.JobState.lease_until == None,  # noqa: E711
+                        models.JobState.lease_until <= now,
+                    )
+                )
+            state = await models.JobState.find_one(*criteria).update(
+                Set({"next_run": next_run, **fields}),
+                response_type=UpdateResponse.NEW_DOCUMENT,
+            )
+            if state is not None:
+                job.next_run = next_run
+                task = asyncio.create_task(self._run(job))
+                job._runs.add(task)
+                task.add_done_callback(job._runs.discard)
+                return
+
+        if await self._advance(job, next_run):
+            job.skipped += 1
+            self.skipped.inc(job.name)
+            logger.debug(f"Skipped job {job.name}, it's still running")
+        else:
+            # Another process got to it first, so see when it runs next
+            job.next_run = None
+
+    async def _run(self, job: Job) -> None:
+        job.running += 1
+        self.in_flight.inc(job.name)
+        start = time.perf_counter()
+        status, error = "ok", None
+        future = None
+        try:
+            if job.blocking:
+                future = self._submit(job)
+                await asyncio.wait_for(asyncio.shield(future), job.timeout)
+            else:
+                await asyncio.wait_for(job.func(), job.timeout)
+        except asyncio.CancelledError:
+            if future is not None:
+                # Only stops the job if it hasn't started, the pool waits for it
+                future.cancel()
+            self._finished(job)
+            await self._release(job)
+            raise
+        except TimeoutError:
+            status, error = "timeout", f"Timed out after {job.timeout:g}s"
+            if job.blocking:
+                logger.warning(
+                    f"Job {job.name} timed out after {job.timeout:g}s, "
+                    "it keeps running in its worker"
+                )
+            else:
+                logger.error(f"Job {job.name} timed out after {job.timeout:g}s")
+        except Exception as e:
+            status, error = "error", f"{type(e).__name__}: {e}"
+            logger.exception(f"Job {job.name} failed!\t{error}")
+
+        duration = time.perf_counter() - start
+        job.runs += 1
+        if error is not None:
+            job.failures += 1
+        job.last_duration, job.last_error = duration, error
+        self.duration.observe(job.name, status, value=duration)
+        self.runs.inc(job.name, status)
+
+        if future is not None and not future.done():
+            # The thread can't be stopped. Record the timeout now, but keep
+            # the run and its lease until the thread returns, so that no
+            # other run of the job starts alongside it
+            await self._wait_stuck(
+                job, future, last_duration=duration, last_error=error
+            )
+            return
+        self._finished(job)
+        await self._release(job, last_duration=duration, last_error=error)
+
+    def _submit(self, job: Job) -> asyncio.Future:
+        if self.pool is not None:
+            return asyncio.ensure_future(self.pool.run(job.func))
+        return asyncio.ensure_future(asyncio.to_thread(job.func))
+
+    def _finished(self, job: Job) -> None:
+        job.running -= 1
+        self.in_flight.dec(job.name)
+
+    async def _wait_stuck(
+        self, job: Job, future: asyncio.Future, **fields: Any
+    ) -> None:
+        job.stuck += 1
+        self.stuck.inc(job.name)
+        try:
+            await self._release(job, hold=True, **fields)
+            await asyncio.wait([future])
+        finally:
+            job.stuck -= 1
+            self.stuck.dec(job.name)
+            self._finished(job)
+            if not future.done():
+                # Cancelled by close(), the pool waits for the thread
+                future.cancel()
+            await self._release(job)
+
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            error = future.exception()
+            logger.warning(
+                f"Job {job.name} failed after timing out!\t"
+                f"{type(error).__name__}: {error}"
+            )
+        else:
+            logger.info(f"Job {job.name} finished after timing out")
+
+    async def _release(self, job: Job, hold: bool = False, **fields: Any) -> None:
+        """Save the outcome of a run and give up the job's lease, or with
+        `hold`, extend it while a timed out run is still going."""
+        criteria = [models.JobState.key == job.key]
+        if job.max_concurrency == 1:
+            # Unless it expired and another process has it now
+            criteria.append(models.JobState.lease_owner == self.owner)
+            if hold:
+                lease_until = utcnow() + timedelta(seconds=self.DEFAULT_LEASE)
+                fields.update(lease_until=lease_until)
+            else:
+                fields.update(lease_owner=None, lease_until=None)
+        try:
+            await models.JobState.find_one(*criteria).update(Set(fields))
+        except PyMongoError as e:
+            logger.warning(f"Failed to save the state of job {job.name}: {e}")
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """Summarize every registered job.
+
+        Returns
+        -------
+        List[Dict[:class:`str`, Any]]
+            For each job: its name, schedule, next run, the number of runs
+            in progress, finished runs, failures, skipped runs and stuck
+            runs, and the duration and error of its last run in this process.
+        """
+        return [
+            {
+                "job": job.name,
+                "schedule": repr(job.schedule),
+                "next_run": job.next_run,
+                "running": job.running,
+                "runs": job.runs,
+                "failures": job.failures,
+                "skipped": job.skipped,
+                "stuck": job.stuck,
+                "last_duration": job.last_duration,
+                "last_error": job.last_error,
+            }
+            for job in self.jobs.values()
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the counters of the scheduler.
+
+        Returns
+        -------
+        Dict[:class:`str`, Any]
+            The number of registered jobs, runs in progress, finished runs,
+            failed runs, skipped runs and stuck runs.
+        """
+        jobs = self.jobs.values()
+        return {
+            "jobs": len(self.jobs),
+            "running": sum(job.running for job in jobs),
+            "runs": sum(job.runs for job in jobs),
+            "failures": sum(job.failures for job in jobs),
+            "skipped": sum(job.skipped for job in jobs),
+            "stuck": sum(job.stuck for job in jobs),
+        }
@@ -0,0 +1,185 @@
+import asyncio
+from typing import Any, Callable, Mapping, Optional
+
+from beanie import UpdateResponse
+from beanie.operators import Exists, Inc, Set
+from loguru import logger
+from pymongo.errors import OperationFailure, PyMongoError
+
+import models
+
+
+class SettingsConflict(Exception):
+    """Raised when the settings changed since they were last read."""
+
+
+class SettingsStore:
+    """Keeps the global :class:`models.BotSettings` document in memory.
+
+    The document is loaded once and served from memory afterwards, so
+    reading :attr:`current` never touches the database. Every update bumps
+    the document's `version`. Changes made by other bot processes are
+    picked up through a change stream, or by polling the version if the
+    database doesn't support change streams (e.g. a standalone server).
+
+    Parameters
+    ----------
+    poll_interval: :class:`float`
+        How many seconds between version checks when polling.
+    """
+
+    def __init__(self, poll_interval: float = 30.0) -> None:
+        self.poll_interval = poll_interval
+        self._settings: Optional[models.BotSettings] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def current(self) -> models.BotSettings:
+        """:class:`models.BotSettings`: The in-memory copy of the settings.
+
+        Treat it as read-only; use :meth:`update` or :meth:`modify` to change it.
+        """
+        if self._settings is None:
+            raise RuntimeError("Settings have not been loaded yet")
+        return self._settings
+
+    async def load(self) -> models.BotSettings:
+        """Read the settings from the database, creating them if they don't exist.
+
+        Returns
+        -------
+        :class:`models.BotSettings`
+            The loaded settings.
+        """
+        settings_doc = await models.BotSettings.find_one()
+        if settings_doc is None:
+            settings_doc = await models.BotSettings.insert_one(
+                models.BotSettings(toggle=False)
+            )
+            logger.success(f"Created settings entry for my-bot [{settings_doc.id}]")
+        else:
+            # Entries created before versioning need a version to compare against
+            await models.BotSettings.find(
+                Exists(models.BotSettings.version, False)
+            ).update(Set({models.BotSettings.version: 0}))
+        self._settings = settings_doc
+        return settings_doc
+
+    def _apply(self, settings_doc: Optional[models.BotSettings]) -> None:
+        if settings_doc is not None and settings_doc.version > self.current.version:
+            self._settings = settings_doc
+            logger.debug(f"Settings updated to version {settings_doc.version}")
+
+    async def refresh(self) -> models.BotSettings:
+        """Re-read the settings from the database."""
+        self._apply(await models.BotSettings.get(self.current.id))
+        return self.current
+
+    async def update(
+        self, fields: Mapping[Any, Any], expected_version: Optional[int] = None
+    ) -> models.BotSettings:
+        """Atomically set fields on the settings and bump their version.
+
+        Parameters
+        ----------
+        fields: Mapping[Any, Any]
+            The fields to set, keyed by name or by model field.
+        expected_version: Optional[:class:`int`]
+            Only apply the update if the settings are still at this version.
+
+        Raises
+        ------
+        :class:`SettingsConflict`
+            The settings are no longer at `expected_version`.
+
+        Returns
+        -------
+        :class:`models.BotSettings`
+            The updated settings.
+        """
+        criteria = [models.BotSettings.id == self.current.id]
+        if expected_version is not None:
+            criteria.append(models.BotSettings.version == expected_version)
+        settings_doc = await models.BotSettings.find_one(*criteria).update(
+            Set(fields),
+            Inc({models.BotSettings.version: 1}),
+            response_type=UpdateResponse.NEW_DOCUMENT,
+        )
+        if settings_doc is None:
+            await self.refresh()
+            raise SettingsConflict(
+                f"Settings are at version {self.current.version}, "
+                f"expected {expected_version}"
+            )
+        self._apply(settings_doc)
+        return self.current
+
+    async def modify(
+        self,
+        func: Callable[[models.BotSettings], Mapping[Any, Any]],
+        retries: int = 5,
+    ) -> models.BotSettings:
+        """Read-modify-write the settings, retrying if another process
+        changes them in between.
+
+        Parameters
+        ----------
+        func: Callable[[:class:`models.BotSettings`], Mapping[Any, Any]]
+            Gets the current settings and returns the fields to set.
+        retries: :class:`int`
+            How many times to retry on a conflict. (Default: 5)
+
+        Returns
+        -------
+        :class:`models.BotSettings`
+            The updated settings.
+        """
+        for attempt in range(retries + 1):
+            settings_doc = self.current
+            try:
+                return await self.update(
+                    func(settings_doc), expected_version=settings_doc.version
+                )
+            except SettingsConflict:
+                if attempt == retries:
+                    raise
+
+    def start(self) -> None:
+        """Start watching for changes made by other processes."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._watch())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _watch(self) -> None:
+        collection = models.BotSettings.get_pymongo_collection()
+        try:
+            async with await collection.watch() as stream:
+                logger.debug("Watching settings with a change stream")
+                async for _ in stream:
+                    await self.refresh()
+        except OperationFailure as e:
+            # Change streams need a replica set or sharded cluster
+            logger.debug(f"Change streams unavailable, polling settings ({e.code})")
+        except PyMongoError as e:
+            logger.warning(f"Settings change stream failed, polling instead: {e}")
+        await self._poll()
+
+    async def _poll(self) -> None:
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                remote = await models.BotSettings.find_one(
+                    models.BotSettings.id == self.current.id
+                ).project(models.SettingsVersion)
+                if remote is not None and remote.version > self.current.version:
+                    await self.refresh()
+            except PyMongoError as e:
+                logger.warning(f"Failed to poll settings: {e}")
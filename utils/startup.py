@@ -0,0 +1,68 @@
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Tuple
+
+from loguru import logger
+
+
+class StartupTimer:
+    """Times the phases of the bot's startup.
+
+    Phases can overlap (e.g. when they run concurrently), so each one is
+    recorded with its start offset as well as its duration. Milestones
+    like connecting to the gateway are recorded with :meth:`mark`. All
+    times are relative to when the timer was created.
+    """
+
+    def __init__(self) -> None:
+        self.origin = time.perf_counter()
+        # (name, start offset, duration), in the order the phases finished
+        self.phases: List[Tuple[str, float, float]] = []
+        self.marks: Dict[str, float] = {}
+
+    @asynccontextmanager
+    async def phase(self, name: str) -> AsyncIterator[None]:
+        """Time the body of an `async with` block as a phase.
+
+        Parameters
+        ----------
+        name: :class:`str`
+            The name of the phase.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.phases.append((name, start - self.origin, end - start))
+            logger.debug(f"Startup phase '{name}' took {(end - start) * 1000:.1f}ms")
+
+    def mark(self, name: str) -> None:
+        """Record a milestone, unless it was already recorded."""
+        self.marks.setdefault(name, time.perf_counter() - self.origin)
+
+    def report(self) -> str:
+        """Format the phases and milestones as a table, in start order."""
+        rows = [
+            (start, f"{name:<20} +{start * 1000:8.1f}ms  {duration * 1000:8.1f}ms")
+            for name, start, duration in self.phases
+        ]
+        rows += [
+            (offset, f"{name:<20} +{offset * 1000:8.1f}ms")
+            for name, offset in self.marks.items()
+        ]
+        header = f"{'phase':<20} {'start':>10}  {'duration':>10}"
+        return "\n".join([header] + [row for _, row in sorted(rows)])
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the duration of each phase and the offset of each milestone.
+
+        Returns
+        -------
+        Dict[:class:`str`, Any]
+            Seconds, keyed by `<phase>_seconds` and `<milestone>_at_seconds`.
+        """
+        return {
+            **{f"{name}_seconds": duration for name, _, duration in self.phases},
+            **{f"{name}_at_seconds": offset for name, offset in self.marks.items()},
+        }
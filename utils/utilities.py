@@ -12,6 +12,9 @@ import disnake
 def match_word(message: disnake.Message, word: str) -> bool:
     """Checks if a message contains a given word.
 
+    To check a message for many words, use a :class:`WordMatcher`,
+    which normalizes the message once and finds every word in one pass.
+
     Parameters
     ----------
     message: :class:`disnake.Message`
@@ -32,31 +35,6 @@ def match_word(message: disnake.Message, word: str) -> bool:
     return False
 
 
-async def check_automod_block(guild: disnake.Guild, string: str) -> bool:
-    """Queries a guild's AutoMod rules to see
-        if a given string contains blocked words.
-
-    Parameters
-    ----------
-    guild: :class:`disnake.Guild`
-        The guild being checked.
-    string: :class:`str`
-        The string to check AutoMod against.
-
-    Returns
-    -------
-    :class:`bool`
-        True if a blocked word was present, False otherwise.
-    """
-    automod_rules = await guild.fetch_automod_rules()
-    for rule in automod_rules:
-        if rule.trigger_type.name == "keyword":
-            for pattern in rule.trigger_metadata.regex_patterns:
-                if re.compile(pattern).match(strip_extra(string)):
-                    return True
-    return False
-
-
 def slash_command_mention(name: str, id: int) -> str:
     """A helper function to format a slash command as a Discord clickable mention.
 
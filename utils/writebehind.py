@@ -0,0 +1,268 @@
+import time
+import asyncio
+from typing import Any, Dict, Hashable, Mapping, Optional, Tuple, Type
+
+from beanie import BulkWriter, Document
+from beanie.operators import Set
+from loguru import logger
+from pymongo.errors import BulkWriteError
+
+PendingKey = Tuple[Type[Document], Hashable]
+
+
+class WriteBehindQueue:
+    """Buffers `$set` updates to documents and writes them in bulk.
+
+    Updates to the same document made within one flush window are
+    coalesced with the last write winning per field, so a burst of
+    gateway events for one guild costs a single database operation.
+    Pending updates are flushed as unordered bulk writes every
+    `flush_interval` seconds, or sooner once `max_pending` documents
+    are waiting.
+
+    A batch that fails as a whole (e.g. the database is unreachable) is
+    retried on the next flush. An update that the database rejects, or
+    that is part of a failed batch `max_attempts` times, is dropped and
+    logged, so it can't block the queue forever.
+
+    Parameters
+    ----------
+    flush_interval: :class:`float`
+        The maximum number of seconds an update waits before being written.
+    max_pending: :class:`int`
+        The number of pending documents that triggers an early flush.
+    batch_size: :class:`int`
+        The maximum number of operations per bulk write.
+    max_attempts: :class:`int`
+        How many times an update is tried before it is dropped. (Default: 5)
+    """
+
+    def __init__(
+        self,
+        flush_interval: float = 1.0,
+        max_pending: int = 500,
+        batch_size: int = 1000,
+        max_attempts: int = 5,
+    ) -> None:
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+
+        self._pending: Dict[PendingKey, Tuple[Dict[str, Any], Dict[Any, Any]]] = {}
+        # Updates of the flush in progress, still visible to pending()
+        self._writing: Dict[PendingKey, Tuple[Dict[str, Any], Dict[Any, Any]]] = {}
+        self._attempts: Dict[PendingKey, int] = {}
+        self._wake = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+        self.queued = 0
+        self.coalesced = 0
+        self.flushes = 0
+        self.written = 0
+        self.failures = 0
+        self.dropped = 0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+        self._total_flush_latency = 0.0
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def start(self) -> None:
+        """Start flushing on a timer. Must be called from a running event loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def set(
+        self,
+        model: Type[Document],
+        query: Mapping[str, Any],
+        fields: Mapping[Any, Any],
+    ) -> None:
+        """Queue a `$set` update for the document matching `query`.
+
+        Parameters
+        ----------
+        model: Type[:class:`beanie.Document`]
+            The model of the document to update.
+        query: Mapping[:class:`str`, Any]
+            An equality filter that identifies exactly one document,
+            e.g. `{"guild_id": 1234}`.
+        fields: Mapping[Any, Any]
+            The fields to set, keyed by name or by model field.
+        """
+        key = (model, tuple(sorted(query.items())))
+        self.queued += 1
+        if key in self._pending:
+            self._pending[key][1].update(fields)
+            self.coalesced += 1
+        else:
+            self._pending[key] = (dict(query), dict(fields))
+            if len(self._pending) >= self.max_pending:
+                self._wake.set()
+
+    def pending(
+        self, model: Type[Document], query: Mapping[str, Any]
+    ) -> Dict[Any, Any]:
+        """Get the fields queued for a document that may not have reached
+        the database yet.
+
+        Parameters
+        ----------
+        model: Type[:class:`beanie.Document`]
+            The model of the document.
+        query: Mapping[:class:`str`, Any]
+            The same filter the updates were queued with.
+
+        Returns
+        -------
+        Dict[Any, Any]
+            The fields to set, oldest first, or an empty dict.
+        """
+        key = (model, tuple(sorted(query.items())))
+        fields: Dict[Any, Any] = {}
+        for updates in (self._writing, self._pending):
+            if key in updates:
+                fields.update(updates[key][1])
+        return fields
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.exception(f"Write-behind flush failed!\t{type(e).__name__}: {e}")
+
+    async def flush(self) -> None:
+        """Write every pending update to the database now."""
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+            self._writing = pending
+            try:
+                await self._flush(pending)
+            finally:
+                self._writing = {}
+
+    async def _flush(self, pending: Dict[PendingKey, Any]) -> None:
+        start = time.perf_counter()
+
+        by_model: Dict[Type[Document], list] = {}
+        for key, update in pending.items():
+            by_model.setdefault(key[0], []).append((key, update))
+        batches = [
+            (model, updates[i : i + self.batch_size])
+            for model, updates in by_model.items()
+            for i in range(0, len(updates), self.batch_size)
+        ]
+
+        for index, (model, batch) in enumerate(batches):
+            try:
+                async with BulkWriter(ordered=False, object_class=model) as bulk_writer:
+                    for _, (query, fields) in batch:
+                        await model.find_one(query).update(
+                            Set(fields), bulk_writer=bulk_writer
+                        )
+            except BulkWriteError as e:
+                # The other updates of an unordered batch were written,
+                # the database rejected these ones
+                self.failures += 1
+                rejected = {error["index"] for error in e.details["writeErrors"]}
+                for position in sorted(rejected):
+                    key = batch[position][0]
+                    self._drop(key, f"rejected by the database: {e}")
+                    self._attempts.pop(key, None)
+                self._written(
+                    [item for i, item in enumerate(batch) if i not in rejected]
+                )
+                continue
+            except Exception:
+                # Every $set is idempotent, so retry the failed batch
+                # and the ones after it on the next flush
+                self.failures += 1
+                self._requeue(batch, attempted=True)
+                for _, remaining in batches[index + 1 :]:
+                    self._requeue(remaining)
+                raise
+            except BaseException:
+                # Cancelled mid-flush by close(), which flushes them again
+                for _, remaining in batches[index:]:
+                    self._requeue(remaining)
+                raise
+            self._written(batch)
+
+        latency = time.perf_counter() - start
+        self.flushes += 1
+        self.last_flush_latency = latency
+        self.max_flush_latency = max(self.max_flush_latency, latency)
+        self._total_flush_latency += latency
+        logger.debug(f"Flushed {len(pending)} buffered writes in {latency:.3f}s")
+
+    def _written(self, batch: list) -> None:
+        self.written += len(batch)
+        for key, _ in batch:
+            self._attempts.pop(key, None)
+
+    def _requeue(self, batch: list, attempted: bool = False) -> None:
+        for key, (query, fields) in batch:
+            if attempted:
+                attempts = self._attempts.get(key, 0) + 1
+                if attempts >= self.max_attempts:
+                    self._attempts.pop(key, None)
+                    self._drop(key, f"failed {attempts} times")
+                    continue
+                self._attempts[key] = attempts
+            # Anything queued since the flush started is newer and wins
+            if key in self._pending:
+                fields.update(self._pending[key][1])
+            self._pending[key] = (query, fields)
+
+    def _drop(self, key: PendingKey, reason: str) -> None:
+        self.dropped += 1
+        model, query = key
+        logger.error(
+            f"Dropped buffered write to {model.__name__} {dict(query)}, {reason}"
+        )
+
+    async def close(self) -> None:
+        """Stop the flush timer and drain everything still pending."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the counters of this queue.
+
+        Returns
+        -------
+        Dict[:class:`str`, Any]
+            The queue depth, write counts, failed batches, dropped
+            updates and flush latencies in seconds.
+        """
+        return {
+            "depth": len(self._pending),
+            "queued": self.queued,
+            "coalesced": self.coalesced,
+            "written": self.written,
+            "flushes": self.flushes,
+            "failures": self.failures,
+            "dropped": self.dropped,
+            "last_flush_latency": self.last_flush_latency,
+            "max_flush_latency": self.max_flush_latency,
+            "avg_flush_latency": (
+                self._total_flush_latency / self.flushes if self.flushes else 0.0
+            ),
+        }
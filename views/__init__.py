@@ -1 +1,2 @@
 from .paginator import Paginator
+from .persistent import PaginatorStore
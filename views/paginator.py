@@ -1,33 +1,201 @@
-from typing import List, Union
+import asyncio
+import inspect
+from collections import OrderedDict
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Union
 
 import disnake
 
+PageSource = Union[
+    List[disnake.Embed],
+    Callable[[int], Union[Optional[disnake.Embed], Awaitable[Optional[disnake.Embed]]]],
+    AsyncIterator[disnake.Embed],
+]
+
 
 class Paginator(disnake.ui.View):
+    """A view that pages through embeds.
+
+    Pages are only rendered when they are navigated to, so large listings
+    open instantly. The most recently rendered pages are kept in a small
+    LRU, and the pages next to the current one are rendered in the
+    background so that navigating to them is instant too.
+
+    Parameters
+    ----------
+    pages: Union[List[:class:`disnake.Embed`], Callable, AsyncIterator[:class:`disnake.Embed`]]
+        The pages. Either a list of already built embeds, a sync or async
+        callable that renders the page at an index (returning `None` or
+        raising :class:`IndexError` past the last page), or an async
+        iterator that yields the pages in order.
+    author: Union[:class:`disnake.User`, :class:`disnake.Member`]
+        The only user allowed to use the buttons.
+    total: Optional[:class:`int`]
+        The number of pages, if known up front.
+    cache_size: :class:`int`
+        The maximum number of rendered pages kept in memory. (Default: 8)
+    """
+
     message: disnake.Message
 
     def __init__(
-        self, embeds: List[disnake.Embed], author: Union[disnake.User, disnake.Member]
+        self,
+        pages: PageSource,
+        author: Union[disnake.User, disnake.Member],
+        *,
+        total: Optional[int] = None,
+        cache_size: int = 8,
     ) -> None:
         super().__init__()
-        self.embeds = embeds
         self.author = author
+        self.total = total
+        self.cache_size = cache_size
+
+        self._render: Optional[Callable] = None
+        self._iterator: Optional[AsyncIterator[disnake.Embed]] = None
+        self._consumed: List[disnake.Embed] = []
+        if isinstance(pages, list):
+            self._consumed = pages
+            self.total = len(pages)
+        elif hasattr(pages, "__anext__"):
+            self._iterator = pages
+        else:
+            self._render = pages
+
+        self._rendered: OrderedDict[int, disnake.Embed] = OrderedDict()
+        self._pending: Dict[int, asyncio.Task] = {}
 
         self.embed_index = 0
-        self.prev_page.disabled = True
-        self.first_page.disabled = True
-        if len(self.embeds) == 1:
-            self.next_page.disabled = True
-            self.last_page.disabled = True
+        self._update_buttons()
+
+    async def initial_page(self) -> Optional[disnake.Embed]:
+        """Render the first page to send along with this view.
+
+        Returns
+        -------
+        Optional[:class:`disnake.Embed`]
+            The first page, or `None` if there are no pages.
+        """
+        embed = await self.get_page(0)
+        if embed is not None:
+            self._set_footer(embed)
+            self._prefetch()
+        self._update_buttons()
+        return embed
+
+    async def get_page(self, index: int) -> Optional[disnake.Embed]:
+        """Get the page at an index, rendering it if needed.
+
+        Parameters
+        ----------
+        index: :class:`int`
+            The index of the page.
+
+        Returns
+        -------
+        Optional[:class:`disnake.Embed`]
+            The page, or `None` if the index is past the last page.
+        """
+        if index < 0 or (self.total is not None and index >= self.total):
+            return None
+        if index < len(self._consumed):
+            return self._consumed[index]
+        if index in self._rendered:
+            self._rendered.move_to_end(index)
+            return self._rendered[index]
+
+        # An interaction giving up must not cancel a render others may share
+        return await asyncio.shield(self._schedule(index))
+
+    def _schedule(self, index: int) -> asyncio.Task:
+        task = self._pending.get(index)
+        if task is None:
+            task = asyncio.create_task(self._render_page(index))
+            self._pending[index] = task
+            task.add_done_callback(lambda _: self._pending.pop(index, None))
+        return task
+
+    async def _render_page(self, index: int) -> Optional[disnake.Embed]:
+        if self._iterator is not None:
+            # Iterators can't go back, so everything they yield is kept
+            while len(self._consumed) <= index:
+                try:
+                    self._consumed.append(await self._iterator.__anext__())
+                except StopAsyncIteration:
+                    self.total = len(self._consumed)
+                    return None
+            return self._consumed[index]
+
+        try:
+            embed = self._render(index)
+            if inspect.isawaitable(embed):
+                embed = await embed
+        except IndexError:
+            embed = None
+        if embed is None:
+            if self.total is None or index < self.total:
+                self.total = index
+            return None
+
+        self._rendered[index] = embed
+        while len(self._rendered) > self.cache_size:
+            self._rendered.popitem(last=False)
+        return embed
+
+    def _prefetch(self) -> None:
+        for index in (self.embed_index + 1, self.embed_index - 1):
+            if (
+                index >= len(self._consumed)
+                and index not in self._rendered
+                and index not in self._pending
+                and index >= 0
+                and (self.total is None or index < self.total)
+            ):
+                self._schedule(index)
+
+    def _set_footer(self, embed: disnake.Embed) -> None:
+        if self.total is not None:
+            embed.set_footer(text=f"Page {self.embed_index + 1} of {self.total}")
+        else:
+            embed.set_footer(text=f"Page {self.embed_index + 1}")
+
+    def _update_buttons(self) -> None:
+        at_start = self.embed_index == 0
+        at_end = self.total is not None and self.embed_index >= self.total - 1
+        self.first_page.disabled = at_start
+        self.prev_page.disabled = at_start
+        self.next_page.disabled = at_end
+        # Without a total, only an iterator can be run to its end
+        self.last_page.disabled = at_end or (
+            self.total is None and self._iterator is None
+        )
+
+    async def _show(self, interaction: disnake.MessageInteraction, index: int) -> None:
+        if (
+            index not in self._rendered
+            and index >= len(self._consumed)
+            and not interaction.response.is_done()
+        ):
+            # Rendering might take longer than Discord waits for a response
+            await interaction.response.defer()
+
+        embed = await self.get_page(index)
+        if embed is not None:
+            self.embed_index = index
         else:
-            self.next_page.disabled = False
-            self.first_page.disabled = False
+            # Went past the end of a source without a known total
+            embed = await self.get_page(self.embed_index)
+        self._set_footer(embed)
+        self._update_buttons()
 
-        # Sets the footer of the embeds with their respective page numbers.
-        for i, embed in enumerate(self.embeds):
-            embed.set_footer(text=f"Page {i + 1} of {len(self.embeds)}")
+        if interaction.response.is_done():
+            await interaction.edit_original_response(embed=embed, view=self)
+        else:
+            await interaction.response.edit_message(embed=embed, view=self)
+        self._prefetch()
 
     async def on_timeout(self) -> None:
+        for task in self._pending.values():
+            task.cancel()
         await self.message.edit(view=None)
 
     async def interaction_check(self, interaction: disnake.MessageInteraction) -> bool:
@@ -37,29 +205,13 @@ class Paginator(disnake.ui.View):
     async def first_page(
         self, button: disnake.ui.Button, interaction: disnake.MessageInteraction
     ) -> None:
-        self.embed_index = 0
-        embed = self.embeds[self.embed_index]
-        embed.set_footer(text=f"Page 1 of {len(self.embeds)}")
-
-        self.first_page.disabled = True
-        self.prev_page.disabled = True
-        self.next_page.disabled = False
-        self.last_page.disabled = False
-        await interaction.response.edit_message(embed=embed, view=self)
+        await self._show(interaction, 0)
 
     @disnake.ui.button(emoji="◀", style=disnake.ButtonStyle.secondary)
     async def prev_page(
         self, button: disnake.ui.Button, interaction: disnake.MessageInteraction
     ) -> None:
-        self.embed_index -= 1
-        embed = self.embeds[self.embed_index]
-
-        self.next_page.disabled = False
-        self.last_page.disabled = False
-        if self.embed_index == 0:
-            self.first_page.disabled = True
-            self.prev_page.disabled = True
-        await interaction.response.edit_message(embed=embed, view=self)
+        await self._show(interaction, self.embed_index - 1)
 
     @disnake.ui.button(emoji="✖️", style=disnake.ButtonStyle.red)
     async def remove(
@@ -71,15 +223,7 @@ class Paginator(disnake.ui.View):
     async def next_page(
         self, button: disnake.ui.Button, interaction: disnake.MessageInteraction
     ) -> None:
-        self.embed_index += 1
-        embed = self.embeds[self.embed_index]
-
-        self.first_page.disabled = False
-        self.prev_page.disabled = False
-        if self.embed_index == len(self.embeds) - 1:
-            self.next_page.disabled = True
-            self.last_page.disabled = True
-        await interaction.response.edit_message(embed=embed, view=self)
+        await self._show(interaction, self.embed_index + 1)
 
     @disnake.ui.button(
         emoji="⏩", custom_id="last_page_button", style=disnake.ButtonStyle.blurple
@@ -87,11 +231,8 @@ class Paginator(disnake.ui.View):
     async def last_page(
         self, button: disnake.ui.Button, interaction: disnake.MessageInteraction
     ) -> None:
-        self.embed_index = len(self.embeds) - 1
-        embed = self.embeds[self.embed_index]
-
-        self.first_page.disabled = False
-        self.prev_page.disabled = False
-        self.next_page.disabled = True
-        self.last_page.disabled = True
-        await interaction.response.edit_message(embed=embed, view=self)
+        if self.total is None:
+            # Only iterators get here; run them to the end to find the total
+            await interaction.response.defer()
+            await self.get_page(2**31)
+        await self._show(interaction, self.total - 1)
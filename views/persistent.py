@@ -0,0 +1,253 @@
+import json
+import uuid
+import zlib
+import asyncio
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple, Union
+
+import disnake
+
+import models
+import utils
+
+CUSTOM_ID_PREFIX = "paginator"
+
+PageRenderer = Callable[[Any], disnake.Embed]
+
+
+class StoredPages(NamedTuple):
+    author_id: int
+    renderer: Optional[str]
+    items: List[Any]  # decoded, so a page is rendered without the others
+    total: int
+    size: int  # estimated bytes of `items` in memory
+
+
+class PaginatorStore:
+    """Pages through embeds on any number of messages without a live view
+    per message.
+
+    Each paginator's pages are stored once, compressed, in MongoDB. The
+    buttons on its message encode the paginator's key and the page they
+    lead to in their `custom_id`, and a single :meth:`on_button_click`
+    listener serves every paginator, so they keep working after a restart.
+    Recently used paginators are kept in memory, decoded, up to a global
+    byte budget, so turning a page only renders that page.
+
+    Pages can be stored as built embeds, or as raw items plus the name of
+    a renderer registered with :meth:`register_renderer` that builds each
+    page's embed when it is opened, which is usually much more compact.
+    Pages too many to build up front (e.g. read from a cursor as they are
+    needed) suit the live :class:`Paginator` view instead, which doesn't
+    survive restarts.
+
+    Parameters
+    ----------
+    memory_budget: :class:`int`
+        The maximum number of bytes of decoded pages kept in memory.
+    """
+
+    def __init__(self, memory_budget: int = 16 * 1024**2) -> None:
+        self.memory_budget = memory_budget
+        self.memory_used = 0
+        self._entries: OrderedDict[str, StoredPages] = OrderedDict()
+        self._renderers: Dict[str, PageRenderer] = {}
+        # Concurrent misses for a paginator share one database query
+        self._loading: Dict[str, asyncio.Task] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def register_renderer(self, name: str, renderer: PageRenderer) -> None:
+        """Register a function that builds a page's embed from a stored item.
+
+        Register renderers when the bot starts (e.g. in a cog's `__init__`),
+        so paginators sent before a restart can still be rendered.
+
+        Parameters
+        ----------
+        name: :class:`str`
+            The name to refer to the renderer by.
+        renderer: Callable[[Any], :class:`disnake.Embed`]
+            Gets one JSON-serializable item and returns its embed.
+        """
+        self._renderers[name] = renderer
+
+    async def send(
+        self,
+        inter: disnake.Interaction,
+        items: List[Any],
+        renderer: Optional[str] = None,
+    ) -> None:
+        """Store pages and show the first one as the interaction's response.
+
+        Parameters
+        ----------
+        inter: :class:`disnake.Interaction`
+            The interaction to respond to. It may already be deferred.
+        items: List[Any]
+            Either the embeds of each page, or JSON-serializable items
+            that `renderer` turns into embeds.
+        renderer: Optional[:class:`str`]
+            The name of a registered renderer for `items`.
+        """
+        if renderer is None:
+            items = [embed.to_dict() for embed in items]
+        elif renderer not in self._renderers:
+            raise ValueError(f"No page renderer named '{renderer}' is registered")
+
+        key = uuid.uuid4().hex
+        await models.PaginatorPages.insert_one(
+            models.PaginatorPages(
+                key=key,
+                author_id=inter.author.id,
+                renderer=renderer,
+                items=zlib.compress(json.dumps(items, separators=(",", ":")).encode()),
+                total=len(items),
+            )
+        )
+        entry = self._decoded(inter.author.id, renderer, items)
+        self._remember(key, entry)
+
+        embed, components = self._render(key, entry, 0)
+        if inter.response.is_done():
+            await inter.edit_original_response(embed=embed, components=components)
+        else:
+            await inter.response.send_message(embed=embed, components=components)
+
+    async def on_button_click(self, inter: disnake.MessageInteraction) -> None:
+        """Listener for `on_button_click` that serves every paginator."""
+        custom_id = inter.component.custom_id or ""
+        if not custom_id.startswith(f"{CUSTOM_ID_PREFIX}:"):
+            return
+        _, key, action = custom_id.split(":", 2)
+
+        entry = await self.get(key)
+        if entry is None:
+            # The paginator expired, so its buttons can't do anything anymore
+            return await inter.response.edit_message(components=[])
+        if inter.author.id != entry.author_id:
+            return await inter.response.send_message(
+                "Only the person who used the command can turn the pages.",
+                ephemeral=True,
+            )
+        if action == "remove":
+            return await inter.response.edit_message(components=[])
+
+        index = int(action.split(":")[0])
+        embed, components = self._render(key, entry, index)
+        await inter.response.edit_message(embed=embed, components=components)
+
+    async def get(self, key: str) -> Optional[StoredPages]:
+        """Get a paginator's stored pages, loading them into memory if needed.
+
+        Parameters
+        ----------
+        key: :class:`str`
+            The key of the paginator.
+
+        Returns
+        -------
+        Optional[:class:`StoredPages`]
+            The stored pages, or `None` if the paginator expired.
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry
+
+        self.misses += 1
+        task = self._loading.get(key)
+        if task is None:
+            task = asyncio.create_task(self._load(key))
+            self._loading[key] = task
+            task.add_done_callback(lambda _: self._loading.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _load(self, key: str) -> Optional[StoredPages]:
+        pages_doc = await models.PaginatorPages.find_one(
+            models.PaginatorPages.key == key
+        )
+        if pages_doc is None:
+            return None
+        entry = self._decoded(
+            pages_doc.author_id,
+            pages_doc.renderer,
+            json.loads(zlib.decompress(pages_doc.items)),
+        )
+        self._remember(key, entry)
+        return entry
+
+    @staticmethod
+    def _decoded(
+        author_id: int, renderer: Optional[str], items: List[Any]
+    ) -> StoredPages:
+        size = utils.object_size(items, set(), depth=8)
+        return StoredPages(author_id, renderer, items, len(items), size)
+
+    def _remember(self, key: str, entry: StoredPages) -> None:
+        replaced = self._entries.pop(key, None)
+        if replaced is not None:
+            self.memory_used -= replaced.size
+        self._entries[key] = entry
+        self.memory_used += entry.size
+        while self.memory_used > self.memory_budget and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self.memory_used -= evicted.size
+            self.evictions += 1
+
+    def _render(
+        self, key: str, entry: StoredPages, index: int
+    ) -> Tuple[disnake.Embed, List[disnake.ui.Button]]:
+        index = max(0, min(index, entry.total - 1))
+        item = entry.items[index]
+        if entry.renderer is None:
+            embed = disnake.Embed.from_dict(item)
+        else:
+            embed = self._renderers[entry.renderer](item)
+        embed.set_footer(text=f"Page {index + 1} of {entry.total}")
+        return embed, self._buttons(key, index, entry.total)
+
+    @staticmethod
+    def _buttons(key: str, index: int, total: int) -> List[disnake.ui.Button]:
+        def button(
+            emoji: str, style: disnake.ButtonStyle, action: Union[int, str], slot: str
+        ) -> disnake.ui.Button:
+            # Every custom_id on a message must be unique, even if two
+            # buttons lead to the same page
+            custom_id = f"{CUSTOM_ID_PREFIX}:{key}:{action}"
+            if isinstance(action, int):
+                custom_id += f":{slot}"
+            return disnake.ui.Button(emoji=emoji, style=style, custom_id=custom_id)
+
+        last = total - 1
+        buttons = [
+            button("⏪", disnake.ButtonStyle.blurple, 0, "first"),
+            button("◀", disnake.ButtonStyle.secondary, index - 1, "prev"),
+            button("✖️", disnake.ButtonStyle.red, "remove", ""),
+            button("▶", disnake.ButtonStyle.secondary, index + 1, "next"),
+            button("⏩", disnake.ButtonStyle.blurple, last, "last"),
+        ]
+        buttons[0].disabled = buttons[1].disabled = index == 0
+        buttons[3].disabled = buttons[4].disabled = index >= last
+        return buttons
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the counters of this store.
+
+        Returns
+        -------
+        Dict[:class:`str`, Any]
+            The number of paginators and bytes in memory, memory hits,
+            database loads and evictions.
+        """
+        return {
+            "entries": len(self._entries),
+            "memory_used": self.memory_used,
+            "memory_budget": self.memory_budget,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }